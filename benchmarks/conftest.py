@@ -0,0 +1,244 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Fixtures shared by the benchmarks."""
+
+from __future__ import annotations
+
+import json
+import random
+import shutil
+from typing import TYPE_CHECKING, NamedTuple
+
+import pytest
+
+from conda_anaconda_telemetry import hooks
+from conda_anaconda_telemetry.cache import CACHE_DIR_ENV_VAR
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from pytest import MonkeyPatch
+    from pytest_mock import MockerFixture
+
+#: Number of ``conda-meta`` records in the synthetic prefixes
+PREFIX_SIZES = (100, 1_000, 10_000)
+
+#: Number of channels in the synthetic channel configuration
+CHANNEL_COUNT = 50
+
+#: Header values computed once per process, in the order they are sent
+HEADER_VALUE_FUNCTIONS = (
+    hooks.get_sys_info_header_value,
+    hooks.get_channel_urls_header_value,
+    hooks.get_virtual_packages_header_value,
+    hooks.get_installed_packages_header_value,
+    hooks.get_install_arguments_header_value,
+)
+
+#: Channels the synthetic packages are installed from
+CHANNELS = (
+    "https://repo.anaconda.com/pkgs/main",
+    "https://repo.anaconda.com/pkgs/r",
+    "https://conda.anaconda.org/conda-forge",
+)
+
+#: Subdirs the synthetic packages are installed from
+SUBDIRS = ("linux-64", "noarch")
+
+
+def make_record(index: int, rng: random.Random, files: int) -> dict:
+    """Return a ``conda-meta`` record resembling the ones written by conda."""
+    name = f"package-{index:05d}"
+    version = f"{rng.randint(0, 30)}.{rng.randint(0, 30)}.{rng.randint(0, 30)}"
+    build = f"py312h{rng.getrandbits(28):07x}_{rng.randint(0, 9)}"
+    channel = rng.choice(CHANNELS)
+    subdir = rng.choice(SUBDIRS)
+    paths = [
+        f"lib/python3.12/site-packages/{name.replace('-', '_')}/module_{i}.py"
+        for i in range(files)
+    ]
+    return {
+        "build": build,
+        "build_number": 0,
+        "channel": f"{channel}/{subdir}",
+        "constrains": [],
+        "depends": ["python >=3.12,<3.13.0a0", "libzlib >=1.3.1,<2.0a0"],
+        "extracted_package_dir": f"/opt/conda/pkgs/{name}-{version}-{build}",
+        "features": "",
+        "files": paths,
+        "fn": f"{name}-{version}-{build}.conda",
+        "license": "BSD-3-Clause",
+        "link": {"source": f"/opt/conda/pkgs/{name}-{version}-{build}", "type": 1},
+        "md5": f"{rng.getrandbits(128):032x}",
+        "name": name,
+        "package_tarball_full_path": f"/opt/conda/pkgs/{name}-{version}-{build}.conda",
+        "paths_data": {
+            "paths": [
+                {
+                    "_path": path,
+                    "path_type": "hardlink",
+                    "sha256": f"{rng.getrandbits(256):064x}",
+                    "size_in_bytes": rng.randint(100, 100_000),
+                }
+                for path in paths
+            ],
+            "paths_version": 1,
+        },
+        "requested_spec": "",
+        "sha256": f"{rng.getrandbits(256):064x}",
+        "size": rng.randint(10_000, 10_000_000),
+        "subdir": subdir,
+        "timestamp": 1_700_000_000_000,
+        "track_features": "",
+        "url": f"{channel}/{subdir}/{name}-{version}-{build}.conda",
+        "version": version,
+    }
+
+
+#: Name fragments used to build package names resembling real environments
+NAME_PREFIXES = ("", "lib", "py", "python-", "r-", "perl-", "font-", "xorg-")
+NAME_WORDS = (
+    "abseil", "arrow", "blas", "boost", "brotli", "bzip2", "cairo", "curl",
+    "expat", "ffi", "freetype", "gcc", "glib", "grpc", "hdf5", "icu", "jpeg",
+    "lapack", "llvm", "lz4", "matplotlib", "ncurses", "numpy", "openssl",
+    "pandas", "png", "protobuf", "readline", "requests", "scipy", "sqlite",
+    "tiff", "tk", "urllib3", "xml2", "xz", "yaml", "zlib", "zstd",
+)  # fmt: skip
+
+
+def make_package_list(
+    count: int,
+    seed: int = 0,
+    channels: tuple[str, ...] = ("conda-forge", "conda-forge", "defaults"),
+) -> list[str]:
+    """Return ``count`` canonical package strings, like ``conda list --canonical``."""
+    rng = random.Random(seed)  # noqa: S311
+    packages: dict[str, str] = {}
+    while len(packages) < count:
+        name = rng.choice(NAME_PREFIXES) + rng.choice(NAME_WORDS)
+        if rng.random() < 0.5:
+            name += f"-{rng.choice(NAME_WORDS)}"
+        if name in packages:
+            name += f"-{len(packages)}"
+        channel = rng.choice(channels)
+        subdir = rng.choice(SUBDIRS)
+        version = f"{rng.randint(0, 30)}.{rng.randint(0, 30)}.{rng.randint(0, 30)}"
+        build = f"py312h{rng.getrandbits(28):07x}_{rng.randint(0, 9)}"
+        packages[name] = f"{channel}/{subdir}::{name}-{version}-{build}"
+    return sorted(packages.values())
+
+
+def make_prefix(path: Path, count: int, files: int = 40, seed: int = 0) -> Path:
+    """Create a prefix with ``count`` synthetic ``conda-meta`` records."""
+    rng = random.Random(seed)  # noqa: S311
+    conda_meta = path / "conda-meta"
+    conda_meta.mkdir(parents=True)
+    for index in range(count):
+        record = make_record(index, rng, files)
+        name = f"{record['name']}-{record['version']}-{record['build']}.json"
+        # conda writes records with sorted keys and an indentation of 2
+        (conda_meta / name).write_text(json.dumps(record, indent=2, sort_keys=True))
+    (conda_meta / "history").write_text("==> 2024-01-01 00:00:00 <==\n")
+    return path
+
+
+@pytest.fixture(scope="session", params=PREFIX_SIZES, ids=lambda size: f"{size}pkgs")
+def prefix(
+    request: pytest.FixtureRequest, tmp_path_factory: pytest.TempPathFactory
+) -> Path:
+    """Synthetic prefix, created once per session for each size."""
+    path = tmp_path_factory.mktemp(f"{request.param}pkgs", numbered=False)
+    return make_prefix(path, request.param)
+
+
+def make_channels(count: int) -> tuple[str, ...]:
+    """Return ``count`` channels resembling a large ``.condarc``.
+
+    Besides the usual public channels the list contains labels and private
+    channels with tokens, which have to be masked.
+    """
+    channels = ["defaults", "conda-forge", "bioconda", "pytorch", "nvidia"]
+    for index in range(count - len(channels)):
+        if index % 2:
+            channels.append(f"https://conda.example.com/t/tk-{index:04x}/org-{index}")
+        else:
+            channels.append(f"org-{index}/label/dev")
+    return tuple(channels[:count])
+
+
+class VirtualPackage(NamedTuple):
+    """Virtual package record as returned by conda's plugin manager."""
+
+    name: str
+    version: str
+    build: str
+
+
+#: Virtual packages of a typical Linux machine with a GPU
+VIRTUAL_PACKAGES = (
+    VirtualPackage("__archspec", "1", "x86_64_v3"),
+    VirtualPackage("__conda", "24.9.2", "0"),
+    VirtualPackage("__cuda", "12.4", "0"),
+    VirtualPackage("__glibc", "2.35", "0"),
+    VirtualPackage("__linux", "6.8.0", "0"),
+    VirtualPackage("__unix", "0", "0"),
+)
+
+
+def clear_caches(cache_dir: Path | None = None) -> None:
+    """Forget everything the plugin keeps in memory, like a new conda process.
+
+    If ``cache_dir`` is given, the on-disk header cache is removed as well.
+    """
+    hooks.get_header_bundle.cache_clear()
+    hooks.get_reduced_header_bundle.cache_clear()
+    hooks.PREFETCHES.clear()
+    hooks.LATE_COLLECTORS.clear()
+    hooks.PENDING_SNAPSHOTS.clear()
+    hooks.PROFILE_BUNDLES.clear()
+    hooks.DEFAULT_SCOPES.clear()
+    hooks.get_request_header_rules.cache_clear()
+    hooks.get_channel_name.cache_clear()
+    hooks.get_inventory.cache_clear()
+    for func in HEADER_VALUE_FUNCTIONS:
+        func.cache_clear()
+    if cache_dir is not None:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def cache_dir(monkeypatch: MonkeyPatch, tmp_path: Path) -> Path:
+    """Empty on-disk header cache for a single benchmark."""
+    monkeypatch.setenv(CACHE_DIR_ENV_VAR, str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def environment(mocker: MockerFixture, prefix: Path, cache_dir: Path) -> Iterator[Path]:
+    """Simulate ``conda install`` in the synthetic prefix.
+
+    The channel configuration and the virtual packages are replaced with
+    synthetic ones, and all caches start out empty.
+    """
+    context = type(hooks.context)
+    mocker.patch.object(
+        context,
+        "channels",
+        new_callable=mocker.PropertyMock,
+        return_value=make_channels(CHANNEL_COUNT),
+    )
+    # return fixed virtual packages without detecting them
+    mocker.patch.object(
+        hooks.context.plugin_manager,
+        "get_virtual_package_records",
+        return_value=VIRTUAL_PACKAGES,
+    )
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        mocker.MagicMock(packages=["numpy", "pandas>=2"], cmd="install"),
+    )
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=str(prefix))
+    clear_caches(cache_dir)
+    yield prefix
+    clear_caches()
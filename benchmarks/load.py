@@ -0,0 +1,246 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""End-to-end load test of the plugin through conda's requests session.
+
+Fetches a stream of repodata and package URLs from the local stand-in server in
+``repo_server.py`` in each of the ``MODES`` and reports the latency per request, the
+throughput, the header bytes per request and the bytes the request profiles save.
+Runs offline; no request leaves the machine::
+
+    python benchmarks/load.py --requests 500 --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, NamedTuple
+
+from conda.base.context import context
+from conda.gateways.connection.session import get_session
+from repo_server import RepoServer
+
+from conda_anaconda_telemetry import hooks
+from conda_anaconda_telemetry.metrics import PERCENTILES, percentile
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Sequence
+
+    from repo_server import ReceivedRequest
+
+#: Channel base URLs requests are made for; the last one doesn't get headers
+CHANNELS = (
+    "http://repo.anaconda.com/pkgs/main",
+    "http://repo.anaconda.com/pkgs/r",
+    "http://conda.anaconda.org/conda-forge",
+    "http://conda.anaconda.org/bioconda",
+)
+
+#: Subdirs repodata is fetched for
+SUBDIRS = ("linux-64", "noarch")
+
+#: Modes every load test runs in: without the plugin, with all headers on every
+#: request and with the headers of each request's profile (see ``REQUEST_PROFILES``)
+MODES = ("disabled", "uniform", "enabled")
+
+
+def make_urls(count: int, seed: int = 0) -> list[str]:
+    """Return the URLs of a large install.
+
+    Like a real install, the stream starts with the repodata of every channel and
+    subdir and continues with one request per package artifact.
+    """
+    rng = random.Random(seed)  # noqa: S311
+    urls = [
+        f"{channel}/{subdir}/repodata.json"
+        for channel in CHANNELS
+        for subdir in SUBDIRS
+    ]
+    for index in range(count - len(urls)):
+        channel = rng.choice(CHANNELS)
+        subdir = rng.choice(SUBDIRS)
+        urls.append(f"{channel}/{subdir}/package-{index:05d}-1.0-0.conda")
+    return urls[:count]
+
+
+def reset_plugin() -> None:
+    """Forget everything the plugin keeps in memory, like a new conda process."""
+    hooks.get_header_bundle.cache_clear()
+    hooks.get_reduced_header_bundle.cache_clear()
+    hooks.get_request_header_rules.cache_clear()
+    hooks.get_inventory.cache_clear()
+    for func in (
+        hooks.get_sys_info_header_value,
+        hooks.get_channel_urls_header_value,
+        hooks.get_virtual_packages_header_value,
+        hooks.get_installed_packages_header_value,
+        hooks.get_install_arguments_header_value,
+    ):
+        func.cache_clear()
+    hooks.PREFETCHES.clear()
+    hooks.SESSION_HOSTS.clear()
+    hooks.LATE_COLLECTORS.clear()
+    hooks.PENDING_SNAPSHOTS.clear()
+    hooks.PROFILE_BUNDLES.clear()
+    # conda keeps the headers of every URL, including those sent while disabled
+    for cached in ("get_cached_request_headers", "get_cached_session_headers"):
+        with contextlib.suppress(AttributeError):
+            getattr(context.plugin_manager, cached).cache_clear()
+
+
+@contextlib.contextmanager
+def plugin_mode(mode: str) -> Iterator[None]:
+    """Set up the plugin for one of the ``MODES``."""
+    with plugin_enabled(mode != "disabled"):
+        if mode != "uniform":
+            yield
+            return
+
+        profiles = dict(hooks.REQUEST_PROFILES)
+        hooks.REQUEST_PROFILES.update(dict.fromkeys(profiles))
+        try:
+            yield
+        finally:
+            hooks.REQUEST_PROFILES.update(profiles)
+
+
+@contextlib.contextmanager
+def plugin_enabled(enabled: bool) -> Iterator[None]:
+    """Register the plugin with conda's plugin manager only if ``enabled``."""
+    plugin_manager = context.plugin_manager
+    name = plugin_manager.get_name(hooks)
+    if enabled or name is None:
+        yield
+        return
+
+    plugin_manager.unregister(hooks)
+    try:
+        yield
+    finally:
+        plugin_manager.register(hooks, name=name)
+
+
+def simulate_command(command: str = "install", *packages: str) -> None:
+    """Make the plugin collect the headers of ``conda <command> <packages>``."""
+    context._set_argparse_args(
+        argparse.Namespace(
+            cmd=command, packages=list(packages or ("numpy",)), match_spec=None
+        )
+    )
+
+
+class Report(NamedTuple):
+    """Results of fetching a stream of URLs in one mode."""
+
+    mode: str
+    seconds: float
+    #: Duration of every request in seconds, in the order the URLs were given
+    latencies: list[float]
+    received: list[ReceivedRequest]
+
+    def to_dict(self) -> dict[str, float]:
+        """Return the latency, throughput and header bytes of the requests."""
+        latencies = sorted(self.latencies)
+        requests = len(latencies)
+        header_bytes = sum(request.header_bytes for request in self.received)
+        telemetry_bytes = sum(request.telemetry_bytes for request in self.received)
+        return {
+            "requests": requests,
+            "throughput": requests / self.seconds,
+            "latency_mean_ms": statistics.fmean(latencies) * 1_000,
+            **{
+                f"latency_p{percent}_ms": percentile(latencies, percent) * 1_000
+                for percent in PERCENTILES
+            },
+            "header_bytes_per_request": header_bytes / requests,
+            "telemetry_bytes": telemetry_bytes,
+            "telemetry_bytes_per_request": telemetry_bytes / requests,
+            "requests_with_telemetry": sum(
+                bool(request.telemetry_headers) for request in self.received
+            ),
+        }
+
+
+def run(server: RepoServer, urls: Sequence[str], mode: str, workers: int = 8) -> Report:
+    """Fetch ``urls`` through conda's session with the plugin in ``mode``."""
+    proxies = {"http": server.url}
+
+    def fetch(url: str) -> float:
+        tic = time.perf_counter()
+        response = get_session(url).get(url, proxies=proxies, timeout=30)
+        response.raise_for_status()
+        response.content  # noqa: B018
+        return time.perf_counter() - tic
+
+    reset_plugin()
+    start = len(server.received)
+    with plugin_mode(mode):
+        tic = time.perf_counter()
+        with ThreadPoolExecutor(workers) as executor:
+            latencies = list(executor.map(fetch, urls))
+        seconds = time.perf_counter() - tic
+    return Report(mode, seconds, latencies, server.received[start:])
+
+
+def compare(reports: Sequence[Report]) -> dict[str, dict]:
+    """Return the results of each mode, what the plugin added and what the request
+    profiles saved.
+    """
+    results = {report.mode: report.to_dict() for report in reports}
+    if {"disabled", "enabled"} <= results.keys():
+        disabled, enabled = results["disabled"], results["enabled"]
+        results["added"] = {
+            key: enabled[key] - disabled[key]
+            for key in (
+                "latency_mean_ms",
+                "latency_p50_ms",
+                "latency_p99_ms",
+                "header_bytes_per_request",
+            )
+        }
+    if {"uniform", "enabled"} <= results.keys():
+        uniform, enabled = results["uniform"], results["enabled"]
+        results["saved"] = {
+            key: uniform[key] - enabled[key]
+            for key in ("telemetry_bytes", "telemetry_bytes_per_request")
+        }
+        results["saved"]["telemetry_bytes_percent"] = (
+            100 * results["saved"]["telemetry_bytes"] / uniform["telemetry_bytes"]
+            if uniform["telemetry_bytes"]
+            else 0.0
+        )
+    return results
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Run the load test and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=500, help="URLs per mode")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent requests")
+    parser.add_argument("--json", metavar="PATH", help="also write the results here")
+    args = parser.parse_args(argv)
+
+    simulate_command()
+    urls = make_urls(args.requests)
+    with RepoServer() as server:
+        # the first requests of a process set up connections and sessions
+        run(server, urls[: args.workers], "disabled", args.workers)
+        reports = [run(server, urls, mode, args.workers) for mode in MODES]
+
+    results = compare(reports)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.json:
+        with open(args.json, "w") as fh:  # noqa: PTH123
+            fh.write(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
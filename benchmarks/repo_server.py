@@ -0,0 +1,127 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Local stand-in for ``repo.anaconda.com`` and ``conda.anaconda.org``.
+
+The server is used as the HTTP proxy of conda's session, so requests for
+``http://repo.anaconda.com/...`` keep their original host (and the plugin decides
+on the real host names) without any DNS lookups or network access. Every request
+is answered with a small repodata document or package payload and its headers are
+recorded.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, NamedTuple
+from urllib.parse import urlsplit
+
+from conda_anaconda_telemetry.hooks import HEADER_PREFIX
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+#: Loopback address the server listens on
+HOST = "127.0.0.1"
+
+#: Hosts the server answers for, any other host gets a 404
+HOSTS = frozenset({"repo.anaconda.com", "repo.anaconda.cloud", "conda.anaconda.org"})
+
+#: Size in bytes of the payload returned for package artifacts
+PACKAGE_SIZE = 1_024
+
+
+class ReceivedRequest(NamedTuple):
+    """A request recorded by the server."""
+
+    host: str
+    path: str
+    #: Bytes of all request headers, as sent on the wire
+    header_bytes: int
+    #: Bytes of the ``anaconda-telemetry-*`` headers, as sent on the wire
+    telemetry_bytes: int
+    #: Names of the ``anaconda-telemetry-*`` headers
+    telemetry_headers: frozenset[str]
+
+
+def header_size(name: str, value: str) -> int:
+    """Return the size of a header line, ``<name>: <value>\\r\\n``."""
+    return len(name) + len(value) + 4
+
+
+class RepoRequestHandler(BaseHTTPRequestHandler):
+    """Answers proxied requests for repodata and packages."""
+
+    server: RepoServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        """Record the request and return a repodata document or a package."""
+        url = urlsplit(self.path)
+        host = url.hostname or self.headers.get("Host", "").partition(":")[0]
+        telemetry = {
+            name.lower(): value
+            for name, value in self.headers.items()
+            if name.lower().startswith(HEADER_PREFIX)
+        }
+        self.server.received.append(
+            ReceivedRequest(
+                host=host,
+                path=url.path,
+                header_bytes=sum(header_size(*item) for item in self.headers.items()),
+                telemetry_bytes=sum(header_size(*item) for item in telemetry.items()),
+                telemetry_headers=frozenset(telemetry),
+            )
+        )
+
+        if host not in HOSTS:
+            self.send_error(404)
+            return
+        if url.path.endswith(".json"):
+            subdir = url.path.rsplit("/", 2)[-2]
+            body = json.dumps({"info": {"subdir": subdir}, "packages": {}}).encode()
+            content_type = "application/json"
+        else:
+            body = b"\0" * PACKAGE_SIZE
+            content_type = "application/octet-stream"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        """Don't log every request to stderr."""
+
+
+class RepoServer(ThreadingHTTPServer):
+    """Threaded proxy server on a free local port, recording every request."""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        """Bind to a free port on the loopback interface."""
+        super().__init__((HOST, 0), RepoRequestHandler)
+        self.received: list[ReceivedRequest] = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Return the URL to use as the HTTP proxy."""
+        return f"http://{HOST}:{self.server_port}"
+
+    def __enter__(self) -> RepoServer:
+        """Start serving in a background thread."""
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Stop serving and close the socket."""
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,184 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Cold and warm cost of every step of the header collection.
+
+*Cold* rounds start without any in-memory or on-disk caches, like the first
+request of a new conda process in a modified environment. *Warm* rounds measure
+the following requests of the same process. The first request latency is measured
+with the collectors run one after the other and on the collector threads.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+from conftest import HEADER_VALUE_FUNCTIONS, VIRTUAL_PACKAGES, clear_caches
+
+from conda_anaconda_telemetry import hooks
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    from pytest_benchmark.fixture import BenchmarkFixture
+    from pytest_mock import MockerFixture
+
+HOST = "repo.anaconda.com"
+PATH = "/pkgs/main/linux-64/repodata.json"
+
+#: Number of rounds for benchmarks that have to reset the caches in between
+COLD_ROUNDS = 5
+
+#: Seconds the detection of virtual packages takes, e.g. to run ``nvidia-smi``
+DETECTION_SECONDS = 0.05
+
+
+def detect_virtual_packages() -> tuple:
+    """Take as long as a real detection of virtual packages."""
+    time.sleep(DETECTION_SECONDS)
+    return VIRTUAL_PACKAGES
+
+
+def request_headers() -> tuple:
+    return tuple(hooks.conda_request_headers(HOST, PATH))
+
+
+def header_sizes(headers: tuple) -> dict[str, int]:
+    return {header.name: len(header.value) for header in headers}
+
+
+@pytest.mark.usefixtures("environment")
+def test_conda_request_headers_cold(
+    benchmark: BenchmarkFixture, prefix: Path, cache_dir: Path
+) -> None:
+    benchmark.group = f"conda_request_headers: {prefix.name}"
+
+    headers = benchmark.pedantic(
+        request_headers, setup=lambda: clear_caches(cache_dir), rounds=COLD_ROUNDS
+    )
+
+    benchmark.extra_info["header_sizes"] = header_sizes(headers)
+    assert hooks.HEADER_PACKAGES in header_sizes(headers)
+
+
+@pytest.mark.parametrize(
+    "workers", [1, hooks.COLLECTOR_WORKERS], ids=["sequential", "concurrent"]
+)
+@pytest.mark.usefixtures("environment")
+def test_first_request_latency(
+    benchmark: BenchmarkFixture,
+    mocker: MockerFixture,
+    prefix: Path,
+    cache_dir: Path,
+    workers: int,
+) -> None:
+    """First request of a new process, with the collectors on ``workers`` threads."""
+    benchmark.group = f"first request: {prefix.name}"
+    mocker.patch.object(
+        hooks.context.plugin_manager,
+        "get_virtual_package_records",
+        side_effect=detect_virtual_packages,
+    )
+    # without deadlines, so every round waits for all values
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.get_collector_timeouts", return_value={}
+    )
+    mocker.patch("conda_anaconda_telemetry.hooks.COLLECTOR_WORKERS", workers)
+
+    headers = benchmark.pedantic(
+        request_headers, setup=lambda: clear_caches(cache_dir), rounds=COLD_ROUNDS
+    )
+
+    assert hooks.TIMEOUT_MARKER not in {header.value for header in headers}
+    assert hooks.HEADER_VIRTUAL_PACKAGES in header_sizes(headers)
+
+
+@pytest.mark.usefixtures("environment")
+def test_conda_request_headers_cold_disk_cache(
+    benchmark: BenchmarkFixture, prefix: Path
+) -> None:
+    """First request of a new process in an environment that hasn't changed."""
+    benchmark.group = f"conda_request_headers: {prefix.name}"
+    request_headers()
+
+    benchmark.pedantic(request_headers, setup=clear_caches, rounds=COLD_ROUNDS)
+
+
+@pytest.mark.usefixtures("environment")
+def test_conda_request_headers_warm(benchmark: BenchmarkFixture, prefix: Path) -> None:
+    benchmark.group = f"conda_request_headers: {prefix.name}"
+    request_headers()
+
+    benchmark(request_headers)
+
+
+@pytest.mark.usefixtures("environment")
+def test_private_conda_request_headers_cold(
+    benchmark: BenchmarkFixture, prefix: Path, cache_dir: Path
+) -> None:
+    benchmark.group = f"_conda_request_headers: {prefix.name}"
+
+    benchmark.pedantic(
+        hooks._conda_request_headers,
+        setup=lambda: clear_caches(cache_dir),
+        rounds=COLD_ROUNDS,
+    )
+
+
+@pytest.mark.usefixtures("environment")
+def test_private_conda_request_headers_warm(
+    benchmark: BenchmarkFixture, prefix: Path
+) -> None:
+    """Wrapping the cached header values without validating them."""
+    benchmark.group = f"_conda_request_headers: {prefix.name}"
+    hooks._conda_request_headers()
+
+    benchmark(hooks._conda_request_headers)
+
+
+def test_should_submit_request_headers_cold(benchmark: BenchmarkFixture) -> None:
+    benchmark.group = "should_submit_request_headers"
+
+    benchmark.pedantic(
+        hooks.should_submit_request_headers,
+        args=(HOST, PATH, ()),
+        setup=hooks.get_request_header_rules.cache_clear,
+        rounds=100,
+    )
+
+
+def test_should_submit_request_headers_warm(benchmark: BenchmarkFixture) -> None:
+    benchmark.group = "should_submit_request_headers"
+    hooks.should_submit_request_headers(HOST, PATH, ())
+
+    benchmark(hooks.should_submit_request_headers, HOST, PATH, ())
+
+
+@pytest.mark.parametrize("func", HEADER_VALUE_FUNCTIONS, ids=lambda f: f.__name__)
+@pytest.mark.usefixtures("environment")
+def test_header_value_cold(
+    benchmark: BenchmarkFixture,
+    func: Callable[[], str],
+    prefix: Path,
+    cache_dir: Path,
+) -> None:
+    benchmark.group = f"{func.__name__}: {prefix.name}"
+
+    value = benchmark.pedantic(
+        func, setup=lambda: clear_caches(cache_dir), rounds=COLD_ROUNDS
+    )
+
+    benchmark.extra_info["header_size"] = len(value)
+
+
+@pytest.mark.parametrize("func", HEADER_VALUE_FUNCTIONS, ids=lambda f: f.__name__)
+@pytest.mark.usefixtures("environment")
+def test_header_value_warm(
+    benchmark: BenchmarkFixture, func: Callable[[], str], prefix: Path
+) -> None:
+    benchmark.group = f"{func.__name__}: {prefix.name}"
+    func()
+
+    benchmark(func)
@@ -0,0 +1,48 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Compare the ``conda-meta`` scanner against ``conda list --canonical``."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from conda.cli.main_list import list_packages
+from conda.core.prefix_data import PrefixData
+
+from conda_anaconda_telemetry import hooks
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_benchmark.fixture import BenchmarkFixture
+    from pytest_mock import MockerFixture
+
+
+def clear_caches() -> None:
+    """Forget everything conda and the plugin cache in memory, like a new process."""
+    getattr(PrefixData, "_cache_", {}).clear()
+    hooks.get_channel_name.cache_clear()
+
+
+def test_list_packages(benchmark: BenchmarkFixture, prefix: Path) -> None:
+    benchmark.group = f"package list: {prefix.name}"
+    benchmark.pedantic(
+        list_packages,
+        args=(str(prefix),),
+        kwargs={"format": "canonical"},
+        setup=clear_caches,
+        rounds=5,
+    )
+
+
+def test_get_package_list(
+    benchmark: BenchmarkFixture, prefix: Path, mocker: MockerFixture
+) -> None:
+    benchmark.group = f"package list: {prefix.name}"
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=str(prefix))
+
+    packages = benchmark.pedantic(hooks.get_package_list, setup=clear_caches, rounds=5)
+
+    clear_caches()
+    _, expected = list_packages(str(prefix), format="canonical")
+    assert list(packages) == list(expected)
@@ -0,0 +1,40 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""How many packages fit into the packages header with each wire format."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+from conftest import PREFIX_SIZES, make_package_list
+
+from conda_anaconda_telemetry.encoding import (
+    PACKAGES_FORMATS,
+    decode_packages,
+    encode_packages,
+)
+from conda_anaconda_telemetry.hooks import PACKAGES_SIZE_LIMIT
+
+if TYPE_CHECKING:
+    from pytest_benchmark.fixture import BenchmarkFixture
+
+
+@pytest.mark.parametrize("count", PREFIX_SIZES)
+@pytest.mark.parametrize("encoding", PACKAGES_FORMATS)
+def test_encode_packages(
+    benchmark: BenchmarkFixture, encoding: str, count: int
+) -> None:
+    benchmark.group = f"packages header: {count}pkgs"
+    packages = make_package_list(count)
+
+    value = benchmark(encode_packages, packages, encoding, PACKAGES_SIZE_LIMIT)
+
+    sent = len(decode_packages(value))
+    benchmark.extra_info.update(
+        packages_sent=sent,
+        packages_total=count,
+        header_bytes=len(value),
+        packages_per_kilobyte=round(sent / len(value) * 1_000, 1),
+    )
+    assert len(value) <= PACKAGES_SIZE_LIMIT
@@ -0,0 +1,94 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Per-request cost of the ``conda_request_headers`` hook."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+from conda.auxlib.collection import AttrDict
+
+from conda_anaconda_telemetry import hooks
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_benchmark.fixture import BenchmarkFixture
+    from pytest_mock import MockerFixture
+
+HOST = "repo.anaconda.com"
+PATH = "/pkgs/main/linux-64/repodata.json"
+
+#: Unpatched ``get_prefix``, the ``environment`` fixture replaces it
+get_prefix = hooks.get_prefix
+
+
+@pytest.fixture
+def command(environment: Path) -> Path:
+    """Simulate ``conda install`` in the synthetic prefix with warm collectors."""
+    hooks.get_header_bundle(hooks.get_conda_command())
+    return environment
+
+
+@pytest.mark.parametrize("previous_calls", [0, 100, 1_000])
+@pytest.mark.usefixtures("command")
+def test_request_headers_warm(
+    benchmark: BenchmarkFixture, previous_calls: int, prefix: Path
+) -> None:
+    """The warm path must cost the same no matter how many requests came before."""
+    benchmark.group = f"request headers (warm): {prefix.name}"
+    for _ in range(previous_calls):
+        tuple(hooks.conda_request_headers(HOST, PATH))
+
+    headers = benchmark(lambda: tuple(hooks.conda_request_headers(HOST, PATH)))
+
+    assert {header.name for header in headers} >= {
+        hooks.HEADER_SYS_INFO,
+        hooks.HEADER_PACKAGES,
+    }
+
+
+@pytest.mark.usefixtures("command")
+def test_request_headers_rebuild(benchmark: BenchmarkFixture, prefix: Path) -> None:
+    """Building and validating all headers on every request, for comparison."""
+    benchmark.group = f"request headers (warm): {prefix.name}"
+
+    benchmark(lambda: tuple(hooks.validate_headers(hooks._conda_request_headers())))
+
+
+@pytest.fixture
+def named_command(mocker: MockerFixture, environment: Path) -> Path:
+    """Simulate ``conda install -n <name>`` with warm collectors.
+
+    Unlike ``command``, the prefix is looked up by name in the environments
+    directories, like conda does.
+    """
+    mocker.patch.object(
+        type(hooks.context),
+        "envs_dirs",
+        new_callable=mocker.PropertyMock,
+        return_value=(str(environment.parent),),
+    )
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        AttrDict(cmd="install", name=environment.name, packages=["numpy"]),
+    )
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", get_prefix)
+    hooks.get_header_bundle(hooks.get_conda_command())
+    return environment
+
+
+def test_request_headers_warm_named(
+    benchmark: BenchmarkFixture, named_command: Path, prefix: Path
+) -> None:
+    """The warm path must not look up the prefix given with ``-n`` again."""
+    benchmark.group = f"request headers (warm): {prefix.name}"
+
+    headers = benchmark(lambda: tuple(hooks.conda_request_headers(HOST, PATH)))
+
+    assert hooks.get_prefix() == str(named_command)
+    assert {header.name for header in headers} >= {
+        hooks.HEADER_SYS_INFO,
+        hooks.HEADER_PACKAGES,
+    }
@@ -0,0 +1,59 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""End-to-end cost of the plugin for requests made through conda's session.
+
+See ``load.py`` for the driver and ``repo_server.py`` for the local server that
+stands in for the Anaconda repositories.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+from load import MODES, make_urls, run, simulate_command
+from repo_server import RepoServer
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from pytest_benchmark.fixture import BenchmarkFixture
+    from pytest_mock import MockerFixture
+
+#: Number of requests per round
+REQUESTS = 300
+
+#: Number of concurrent requests, like conda's repodata and download thread pools
+WORKERS = 8
+
+
+@pytest.fixture(scope="module")
+def server() -> Iterator[RepoServer]:
+    """Local stand-in for the Anaconda repositories, shared by all benchmarks."""
+    with RepoServer() as server:
+        yield server
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_load(
+    benchmark: BenchmarkFixture,
+    server: RepoServer,
+    mode: str,
+    prefix: Path,
+    cache_dir: Path,  # noqa: ARG001
+    mocker: MockerFixture,
+) -> None:
+    benchmark.group = f"load: {prefix.name}"
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=str(prefix))
+    simulate_command()
+    urls = make_urls(REQUESTS)
+    # set up the connections and sessions before measuring
+    run(server, urls[:WORKERS], mode, WORKERS)
+
+    report = benchmark.pedantic(run, args=(server, urls, mode, WORKERS), rounds=3)
+
+    results = report.to_dict()
+    benchmark.extra_info.update(results)
+    assert results["requests"] == REQUESTS
+    assert bool(results["requests_with_telemetry"]) is (mode != "disabled")
@@ -0,0 +1,87 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Compare the host/path matcher against the reference regular expression."""
+
+from __future__ import annotations
+
+import random
+from typing import TYPE_CHECKING
+
+import pytest
+
+from conda_anaconda_telemetry.hooks import (
+    REQUEST_HEADER_PATTERN,
+    should_submit_request_headers,
+)
+
+if TYPE_CHECKING:
+    from pytest_benchmark.fixture import BenchmarkFixture
+
+#: Channel base URLs (host, path) requests are made for
+CHANNELS = (
+    ("repo.anaconda.com", "/pkgs/main"),
+    ("repo.anaconda.com", "/pkgs/r"),
+    ("conda.anaconda.org", "/conda-forge"),
+    ("conda.anaconda.org", "/bioconda"),
+    ("conda.anaconda.org", "/pytorch"),
+    ("mirror.example.com", "/conda-forge"),
+)
+
+
+def make_url_stream(count: int, seed: int = 0) -> list[tuple[str, str]]:
+    """Return the (host, path) pairs of a large install.
+
+    Like a real install, the stream starts with the repodata requests for every
+    channel and subdir and continues with one request per package artifact.
+    """
+    rng = random.Random(seed)  # noqa: S311
+    stream = [
+        (host, f"{path}/{subdir}/repodata.json")
+        for host, path in CHANNELS
+        for subdir in ("linux-64", "noarch")
+    ]
+    while len(stream) < count:
+        host, path = rng.choice(CHANNELS)
+        name = f"package-{rng.randint(0, 5_000)}"
+        build = f"py312h{rng.getrandbits(28):07x}_0"
+        extension = rng.choice((".conda", ".tar.bz2"))
+        stream.append((host, f"{path}/linux-64/{name}-1.0-{build}{extension}"))
+    return stream
+
+
+@pytest.fixture(scope="module")
+def url_stream() -> list[tuple[str, str]]:
+    return make_url_stream(5_000)
+
+
+def test_should_submit_request_headers(
+    benchmark: BenchmarkFixture, url_stream: list[tuple[str, str]]
+) -> None:
+    benchmark.group = "request matcher"
+
+    def match_all() -> int:
+        return sum(
+            should_submit_request_headers(host, path) for host, path in url_stream
+        )
+
+    matches = benchmark(match_all)
+
+    assert matches == sum(
+        REQUEST_HEADER_PATTERN.match(f"{host}{path}") is not None
+        or (host, path[:14]) == ("mirror.example.com", "/conda-forge/")
+        for host, path in url_stream
+    )
+
+
+def test_request_header_pattern(
+    benchmark: BenchmarkFixture, url_stream: list[tuple[str, str]]
+) -> None:
+    benchmark.group = "request matcher"
+
+    def match_all() -> int:
+        return sum(
+            REQUEST_HEADER_PATTERN.match(f"{host}{path}") is not None
+            for host, path in url_stream
+        )
+
+    benchmark(match_all)
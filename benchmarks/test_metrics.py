@@ -0,0 +1,45 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Overhead of the ``timer`` decorator with and without metrics."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from conda_anaconda_telemetry.hooks import timer
+from conda_anaconda_telemetry.metrics import registry
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from pytest_benchmark.fixture import BenchmarkFixture
+
+
+def collect() -> str:
+    return "value"
+
+
+@pytest.fixture
+def metrics_enabled() -> Iterator[None]:
+    registry.enable(dump_at_exit=False)
+    yield
+    registry.enabled = False
+    registry.reset()
+
+
+def test_untimed(benchmark: BenchmarkFixture) -> None:
+    benchmark.group = "timer"
+    benchmark(collect)
+
+
+def test_timer_disabled(benchmark: BenchmarkFixture) -> None:
+    benchmark.group = "timer"
+    benchmark(timer(collect))
+
+
+@pytest.mark.usefixtures("metrics_enabled")
+def test_timer_enabled(benchmark: BenchmarkFixture) -> None:
+    benchmark.group = "timer"
+    benchmark(timer(collect))
@@ -0,0 +1,58 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Cost of the plain packages header for growing prefixes.
+
+The header is streamed from ``conda-meta`` and collection stops once the budget is
+used up, so its cost should stay flat from 100 to 10,000 packages. Reading the
+full package list first shows the cost that is avoided.
+"""
+
+from __future__ import annotations
+
+import tracemalloc
+from typing import TYPE_CHECKING
+
+import pytest
+from conftest import clear_caches
+
+from conda_anaconda_telemetry import hooks
+from conda_anaconda_telemetry.encoding import encode_packages
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    from pytest_benchmark.fixture import BenchmarkFixture
+    from pytest_mock import MockerFixture
+
+#: Number of rounds, every round starts without any caches
+ROUNDS = 5
+
+
+def streamed() -> str:
+    return encode_packages(hooks.iter_package_list(), "plain", hooks.SIZE_LIMIT)
+
+
+def full_list() -> str:
+    return encode_packages(hooks.get_package_list(), "plain", hooks.SIZE_LIMIT)
+
+
+@pytest.mark.parametrize("build", [streamed, full_list], ids=lambda f: f.__name__)
+def test_packages_header(
+    benchmark: BenchmarkFixture,
+    build: Callable[[], str],
+    prefix: Path,
+    mocker: MockerFixture,
+) -> None:
+    benchmark.group = f"plain packages header: {build.__name__}"
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=str(prefix))
+
+    value = benchmark.pedantic(build, setup=clear_caches, rounds=ROUNDS)
+
+    clear_caches()
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    benchmark.extra_info.update(header_bytes=len(value), peak_memory_bytes=peak)
+    assert len(value) <= hooks.SIZE_LIMIT
@@ -12,21 +12,34 @@ if TYPE_CHECKING:
 #: Application name.
 APP_NAME: Final = "conda-anaconda-telemetry"
 
-try:
-    from ._version import __version__
-except ImportError:
-    # _version.py is only created after running `pip install`
+
+def _get_dev_version() -> str:
     try:
         from setuptools_scm import get_version
 
-        __version__ = get_version(root="..", relative_to=__file__)
+        return get_version(root="..", relative_to=__file__)
     except (ImportError, OSError, LookupError):
         # ImportError: setuptools_scm isn't installed
         # OSError: git isn't installed
         # LookupError: setuptools_scm unable to detect version
         # conda-anaconda-telemetry follows SemVer, so the dev version is:
         #     MJ.MN.MICRO.devN+gHASH[.dirty]
-        __version__ = "0.0.0.dev0+placeholder"
+        return "0.0.0.dev0+placeholder"
+
+
+try:
+    from ._version import __version__
+except ImportError:
+    # _version.py is only created after running `pip install`; the fallback runs git
+    # via setuptools_scm, so it is deferred until the version is actually requested
+    # instead of slowing down every conda command that loads this plugin
+    def __getattr__(name: str) -> str:
+        if name in ("__version__", "APP_VERSION"):
+            version = _get_dev_version()
+            globals().update(__version__=version, APP_VERSION=version)
+            return version
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-#: Application version.
-APP_VERSION: Final = __version__
+else:
+    #: Application version.
+    APP_VERSION: Final = __version__
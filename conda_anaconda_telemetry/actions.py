@@ -0,0 +1,81 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Post-transaction action that keeps the package inventory up to date.
+
+This module is only imported once conda runs a transaction, since importing
+``conda.core.path_actions`` is comparatively slow.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+from typing import TYPE_CHECKING
+
+from conda.core.path_actions import Action
+
+from .hooks import collection, update_inventory
+from .inventory import format_package
+
+if TYPE_CHECKING:
+    from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateInventoryAction(Action):
+    """Apply the packages linked and unlinked by a transaction to the inventory."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:  # noqa: ANN401
+        """Create the action for a transaction, see ``Action``.
+
+        conda creates the actions on the thread that runs the transaction, so this
+        is where its collection session is known.
+        """
+        super().__init__(*args, **kwargs)
+        self.session = collection.current_session()
+
+    def verify(self) -> None:
+        """Nothing to verify, the inventory is only kept in memory."""
+        self._verified = True
+
+    def execute(self) -> None:
+        """Update the inventory with the changed packages only.
+
+        Errors are logged instead of raised, since conda would otherwise reverse
+        the transaction because of them.
+        """
+        if self.target_prefix is None:
+            return
+
+        # conda executes the actions on its own threads, which don't inherit the
+        # collection session of the transaction
+        session = (
+            collection.session(*self.session)
+            if self.session is not None
+            else contextlib.nullcontext()
+        )
+        try:
+            with session:
+                update_inventory(
+                    self.target_prefix,
+                    [record.name for record in self.unlink_precs or ()],
+                    [
+                        format_package(
+                            record.channel.canonical_name,
+                            record.subdir,
+                            record.name,
+                            record.version,
+                            record.build,
+                        )
+                        for record in self.link_precs or ()
+                    ],
+                )
+        except Exception as exc:
+            logger.debug("Failed to update the package inventory", exc_info=exc)
+
+    def reverse(self) -> None:
+        """Nothing to reverse, ``execute`` runs after the transaction succeeded."""
+
+    def cleanup(self) -> None:
+        """Nothing to clean up."""
@@ -0,0 +1,137 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Persistent, cross-process cache for header values."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import APP_NAME
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from typing import Final
+
+    Stamp = Sequence[int | float | str]
+
+logger = logging.getLogger(__name__)
+
+#: Environment variable that overrides the cache directory
+CACHE_DIR_ENV_VAR: Final = "CONDA_ANACONDA_TELEMETRY_CACHE_DIR"
+
+#: Version of the on-disk cache format; entries with another version are ignored
+CACHE_VERSION: Final = 1
+
+
+def get_cache_dir() -> Path:
+    """Return the directory used to store cached header values."""
+    if directory := os.environ.get(CACHE_DIR_ENV_VAR):
+        return Path(directory)
+
+    from platformdirs import user_cache_dir
+
+    return Path(user_cache_dir(APP_NAME, "anaconda"))
+
+
+def get_prefix_stamp(prefix: str | os.PathLike) -> tuple[int, ...] | None:
+    """Return a cheap fingerprint that changes whenever ``prefix`` is modified.
+
+    conda adds and removes records in ``conda-meta`` (changing the directory's
+    mtime) and appends to ``conda-meta/history`` on every transaction, so the
+    combination of both is a reliable validity check. ``None`` is returned when
+    the prefix has no ``conda-meta`` directory.
+    """
+    conda_meta = Path(prefix, "conda-meta")
+    try:
+        meta_stat = conda_meta.stat()
+    except OSError:
+        return None
+
+    try:
+        history_stat = (conda_meta / "history").stat()
+    except OSError:
+        history = (-1, -1)
+    else:
+        history = (history_stat.st_size, history_stat.st_mtime_ns)
+
+    return (meta_stat.st_mtime_ns, *history)
+
+
+class HeaderCache:
+    """Cache of header values stored as one JSON file per key.
+
+    Each entry records the ``stamp`` it was computed for; reads with a
+    different stamp are treated as misses. Writes go to a temporary file that
+    is atomically moved into place, so concurrent conda processes never see a
+    partially written entry and the last writer wins.
+    """
+
+    def __init__(self, namespace: str, directory: Path | None = None) -> None:
+        """Create a cache for ``namespace`` below ``directory``."""
+        self.namespace = namespace
+        self.directory = (directory or get_cache_dir()) / namespace
+
+    def path(self, key: str) -> Path:
+        """Return the path of the file that stores ``key``."""
+        digest = hashlib.sha256(key.encode("utf-8", "surrogateescape")).hexdigest()
+        return self.directory / f"{digest[:32]}.json"
+
+    def get(self, key: str, stamp: Stamp, max_age: float | None = None) -> str | None:
+        """Return the cached value for ``key`` or ``None`` if missing or stale.
+
+        If ``max_age`` is given, entries written more than ``max_age`` seconds ago
+        are stale as well.
+        """
+        try:
+            with self.path(key).open(encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+        if (
+            not isinstance(entry, dict)
+            or entry.get("version") != CACHE_VERSION
+            or entry.get("key") != key
+            or entry.get("stamp") != list(stamp)
+            or not isinstance(entry.get("value"), str)
+        ):
+            return None
+
+        if max_age is not None:
+            created = entry.get("created")
+            if not isinstance(created, (int, float)) or time.time() - created > max_age:
+                return None
+
+        return entry["value"]
+
+    def set(self, key: str, stamp: Stamp, value: str) -> None:
+        """Store ``value`` for ``key``; failures are logged and otherwise ignored."""
+        entry = {
+            "version": CACHE_VERSION,
+            "key": key,
+            "stamp": list(stamp),
+            "created": time.time(),
+            "value": value,
+        }
+        path = self.path(key)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(
+                dir=self.directory, prefix=f".{path.stem}.", suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                    json.dump(entry, fh)
+                Path(tmp).replace(path)
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+        except OSError as exc:
+            logger.debug("Failed to write telemetry cache %s", path, exc_info=exc)
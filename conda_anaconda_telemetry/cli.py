@@ -0,0 +1,61 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""The ``conda telemetry`` subcommand."""
+
+from __future__ import annotations
+
+import json
+import sys
+from typing import TYPE_CHECKING
+
+from .metrics import METRICS_ENV_VAR, get_metrics_path, registry
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser, Namespace
+
+
+def configure_parser(parser: ArgumentParser) -> None:
+    """Add the ``conda telemetry`` subcommands to ``parser``."""
+    subparsers = parser.add_subparsers(dest="telemetry_command", required=True)
+    subparsers.add_parser(
+        "stats",
+        help=(
+            "Show how long collecting the telemetry headers took in the last conda "
+            f"command, as JSON (requires {METRICS_ENV_VAR}=1)"
+        ),
+    )
+
+
+def show_stats() -> int:
+    """Print the metrics written by the last conda command."""
+    path = get_metrics_path()
+    try:
+        stats = json.loads(path.read_text())
+    except (OSError, ValueError):
+        print(
+            f"No metrics found in {path}. Set {METRICS_ENV_VAR}=1 and run a conda "
+            "command to collect them.",
+            file=sys.stderr,
+        )
+        return 1
+
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+def execute(args: Namespace | tuple[str, ...]) -> int:
+    """Run the ``conda telemetry`` subcommand selected in ``args``.
+
+    conda passes the raw arguments as a tuple to subcommands without a parser.
+    """
+    # the metrics of this command would replace the ones being inspected
+    registry.cancel_dump()
+
+    if isinstance(args, tuple):
+        command = args[0] if args else None
+    else:
+        command = args.telemetry_command
+
+    if command == "stats":
+        return show_stats()
+    return 1
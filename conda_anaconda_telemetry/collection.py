@@ -0,0 +1,330 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Bounded caches of collected header values, scoped to a prefix and configuration.
+
+A conda command collects the headers of one prefix with one configuration, so
+caching each value once per process is enough. Tools that embed conda as a library
+run many operations in one long-lived process, each on its own prefix. A
+``CollectionContext`` keys every cached value on the session it was collected in
+(the prefix and a key of the configuration) and bounds the cache: entries expire
+after a TTL and the least recently used ones are evicted once there are too many of
+them or they take up too much memory.
+
+Sessions are opened per operation with ``CollectionContext.session``. The session
+is kept in a ``contextvars.ContextVar``, so it applies to the current thread and to
+threads started with a copy of its context. Without a session, values are keyed on
+the default scope of the context (e.g. the prefix of the current conda command).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import itertools
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, NamedTuple, Protocol, TypeVar, cast
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Hashable, Iterator
+
+T = TypeVar("T")
+T_co = TypeVar("T_co", covariant=True)
+
+#: Default number of values kept by a ``CollectionContext``
+DEFAULT_MAXSIZE = 1_024
+
+#: Default number of bytes the values of a ``CollectionContext`` may take up
+DEFAULT_MAX_BYTES = 32 * 1_024 * 1_024
+
+
+class CacheInfo(NamedTuple):
+    """Cache statistics, compatible with ``functools.lru_cache``."""
+
+    hits: int
+    misses: int
+    maxsize: int | None
+    currsize: int
+
+
+class CachedFunction(Protocol[T_co]):
+    """A function decorated with ``CollectionContext.cached``."""
+
+    __name__: str
+
+    def __call__(self, *args: Hashable) -> T_co:
+        """Return the cached value for ``args``, computing it once if needed."""
+
+    def cache_info(self) -> CacheInfo:
+        """Return the hits, misses and size of the cache."""
+
+    def cache_get(self, *args: Hashable) -> T_co | None:
+        """Return the cached value for ``args`` without computing it."""
+
+    def cache_clear(self) -> None:
+        """Forget all cached values."""
+
+
+class Session(NamedTuple):
+    """The scope of an operation that collects headers."""
+
+    #: Prefix the headers are collected for, ``None`` for the default prefix
+    prefix: str | None
+    #: Key of the configuration the headers are collected with
+    config: str = ""
+
+
+def estimate_size(value: object) -> int:
+    """Return the approximate number of bytes kept alive by ``value``."""
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(map(estimate_size, value))
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + sum(map(estimate_size, vars(value).values()))
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ("created", "size", "used", "value")
+
+    def __init__(self, value: object, size: int, created: float, used: int) -> None:
+        self.value = value
+        self.size = size
+        self.created = created
+        self.used = used
+
+
+class BoundedCache:
+    """Thread-safe cache with LRU eviction, a TTL and a limit on its size in bytes.
+
+    Values that are missing are computed once while other threads asking for the
+    same key wait, and hits don't take a lock. Hits only
+    record when an entry was used; the least recently used entries are found when
+    evicting, which only happens when a value is added.
+    """
+
+    def __init__(
+        self,
+        maxsize: int | None = DEFAULT_MAXSIZE,
+        ttl: float | None = None,
+        max_bytes: int | None = DEFAULT_MAX_BYTES,
+    ) -> None:
+        """Create a cache for ``maxsize`` values taking up at most ``max_bytes``.
+
+        Values are computed again ``ttl`` seconds after they were added. ``None``
+        disables each of the limits.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        #: Approximate number of bytes of all values
+        self.nbytes = 0
+        self.evictions = 0
+        self._entries: dict[Hashable, _Entry] = {}
+        self._locks: dict[Hashable, threading.Lock] = {}
+        self._guard = threading.Lock()
+        # ``next`` on a counter is atomic, so hits don't need the lock
+        self._clock = itertools.count()
+
+    def __len__(self) -> int:
+        """Return the number of values in the cache, including expired ones."""
+        return len(self._entries)
+
+    def count(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Return the number of keys ``predicate`` returns true for."""
+        return sum(map(predicate, list(self._entries)))
+
+    def get(self, key: Hashable) -> object | None:
+        """Return the value for ``key`` or ``None`` if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.monotonic() - entry.created > self.ttl:
+            return None
+        entry.used = next(self._clock)
+        return entry.value
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], T]) -> T:
+        """Return the value for ``key``, calling ``compute`` once if it is missing.
+
+        Exceptions are not cached, a waiting thread tries again.
+        """
+        if (value := self.get(key)) is not None:
+            return cast("T", value)
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if (value := self.get(key)) is not None:
+                return cast("T", value)
+            computed = compute()
+            self.set(key, computed)
+        return computed
+
+    def set(self, key: Hashable, value: object) -> None:
+        """Store ``value`` for ``key`` and evict values that exceed the limits.
+
+        A value larger than ``max_bytes`` on its own is not stored.
+        """
+        size = estimate_size(value)
+        with self._guard:
+            self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = _Entry(
+                value, size, time.monotonic(), next(self._clock)
+            )
+            self.nbytes += size
+            self._evict()
+
+    def configure(
+        self,
+        maxsize: int | None = DEFAULT_MAXSIZE,
+        ttl: float | None = None,
+        max_bytes: int | None = DEFAULT_MAX_BYTES,
+    ) -> None:
+        """Change the limits of the cache, evicting values that exceed them now."""
+        with self._guard:
+            self.maxsize, self.ttl, self.max_bytes = maxsize, ttl, max_bytes
+            self._evict()
+
+    def discard(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Remove the values of all keys ``predicate`` returns true for."""
+        with self._guard:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Remove all values."""
+        with self._guard:
+            self._entries.clear()
+            self._locks.clear()
+            self.nbytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        if (entry := self._entries.pop(key, None)) is not None:
+            self.nbytes -= entry.size
+            self._locks.pop(key, None)
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            expired = time.monotonic() - self.ttl
+            for key in [
+                key for key, entry in self._entries.items() if entry.created < expired
+            ]:
+                self._remove(key)
+        while self._entries and (
+            (self.maxsize is not None and len(self._entries) > self.maxsize)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            lru = min(self._entries, key=lambda key: self._entries[key].used)
+            self._remove(lru)
+            self.evictions += 1
+
+
+class CollectionContext:
+    """Caches collected header values per session in a ``BoundedCache``."""
+
+    def __init__(
+        self,
+        maxsize: int | None = DEFAULT_MAXSIZE,
+        ttl: float | None = None,
+        max_bytes: int | None = DEFAULT_MAX_BYTES,
+        default_scope: Callable[[], Hashable] | None = None,
+    ) -> None:
+        """Create a context with the limits of its ``BoundedCache``.
+
+        ``default_scope`` returns the key of values collected outside of a session.
+        """
+        self.cache = BoundedCache(maxsize, ttl, max_bytes)
+        self._default_scope = default_scope or (lambda: None)
+        self._session: ContextVar[Session | None] = ContextVar(
+            f"anaconda_telemetry_session_{id(self)}", default=None
+        )
+        self._stats: dict[str, list[int]] = {}
+
+    @contextlib.contextmanager
+    def session(self, prefix: str | None = None, config: str = "") -> Iterator[Session]:
+        """Collect the values used in the block for ``prefix`` and ``config``.
+
+        Sessions can be nested; the innermost one applies.
+        """
+        session = Session(prefix, config)
+        token = self._session.set(session)
+        try:
+            yield session
+        finally:
+            self._session.reset(token)
+
+    def current_session(self) -> Session | None:
+        """Return the session of the current context, if one is open."""
+        return self._session.get()
+
+    def scope(self) -> Hashable:
+        """Return the key of values collected now: the session or the default."""
+        session = self._session.get()
+        return session if session is not None else self._default_scope()
+
+    def cached(self, func: Callable[..., T]) -> CachedFunction[T]:
+        """Cache the results of ``func`` per session, computing each of them once.
+
+        Like ``functools.lru_cache``, the decorated function provides
+        ``cache_info()`` and ``cache_clear()`` (for all sessions), as well as
+        ``cache_get()`` to look up the value of the current session without
+        computing it. Only positional arguments are supported.
+        """
+        name = func.__name__
+        stats = self._stats.setdefault(name, [0, 0])  # hits, misses
+
+        @functools.wraps(func)
+        def wrapper(*args: Hashable) -> T:
+            key = (name, self.scope(), args)
+            if (value := self.cache.get(key)) is not None:
+                stats[0] += 1
+                return cast("T", value)
+            stats[1] += 1
+            return self.cache.get_or_compute(key, functools.partial(func, *args))
+
+        def cache_info() -> CacheInfo:
+            currsize = self.cache.count(lambda key: key[0] == name)  # type: ignore[index]
+            return CacheInfo(stats[0], stats[1], self.cache.maxsize, currsize)
+
+        def cache_get(*args: Hashable) -> T | None:
+            """Return the cached value for ``args`` without computing it."""
+            return cast("T | None", self.cache.get((name, self.scope(), args)))
+
+        def cache_clear() -> None:
+            self.cache.discard(lambda key: key[0] == name)  # type: ignore[index]
+            stats[:] = [0, 0]
+
+        wrapper.cache_info = cache_info  # type: ignore[attr-defined]
+        wrapper.cache_get = cache_get  # type: ignore[attr-defined]
+        wrapper.cache_clear = cache_clear  # type: ignore[attr-defined]
+        return cast("CachedFunction[T]", wrapper)
+
+    def configure(
+        self,
+        maxsize: int | None = DEFAULT_MAXSIZE,
+        ttl: float | None = None,
+        max_bytes: int | None = DEFAULT_MAX_BYTES,
+    ) -> None:
+        """Change the limits of the cache."""
+        self.cache.configure(maxsize, ttl, max_bytes)
+
+    def discard(self, *funcs: CachedFunction[object]) -> None:
+        """Forget the values of ``funcs`` collected in the current scope.
+
+        Unlike ``cache_clear()``, the values of other sessions are kept. Without
+        ``funcs``, all values of the current scope are forgotten.
+        """
+        scope = self.scope()
+        names = {func.__name__ for func in funcs}
+        self.cache.discard(
+            lambda key: key[1] == scope and (not names or key[0] in names)  # type: ignore[index]
+        )
+
+    def clear(self) -> None:
+        """Forget the values of all sessions."""
+        self.cache.clear()
@@ -0,0 +1,225 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Lightweight reader for the package records in a prefix's ``conda-meta`` directory.
+
+conda's ``PrefixData`` fully parses every record (including the often very large
+``files`` and ``paths_data`` lists) and builds complete ``PrefixRecord`` objects.
+The telemetry headers only need a handful of fields, so this module reads them
+directly:
+
+- ``name``, ``version`` and ``build`` come from the record's file name, which conda
+  always writes as ``<name>-<version>-<build>.json``.
+- ``channel`` and ``subdir`` are looked up in the first and last few kilobytes of
+  the file. conda writes records with sorted keys, which places ``channel`` near
+  the start and ``subdir`` near the end of the document.
+
+Records that don't follow this layout are parsed in full as a fallback.
+
+``iter_sorted_conda_meta`` sorts the records by their file names before reading
+any of them, so consumers that only need the first few packages (e.g. a header
+with a size limit) don't read the rest.
+
+Packages installed with pip are not recorded in ``conda-meta``. conda lists them
+by inspecting the distributions in ``site-packages``; :func:`has_pip_packages`
+tells callers whether that is necessary for a prefix.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import re
+from typing import TYPE_CHECKING, NamedTuple
+
+from conda.common.path import get_python_site_packages_short_path
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from typing import Final
+
+#: Number of bytes read from the start and the end of each record
+CHUNK_SIZE: Final = 4_096
+
+#: Placeholder for records that don't specify a channel
+UNKNOWN_CHANNEL: Final = "<unknown>"
+
+_CHANNEL_PATTERN = re.compile(rb'"channel"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_SUBDIR_PATTERN = re.compile(rb'"subdir"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+#: Content of the ``INSTALLER`` file of distributions installed by conda
+CONDA_INSTALLER: Final = "conda"
+
+#: Errors of records that are skipped
+_READ_ERRORS = (OSError, ValueError, KeyError, TypeError)
+
+
+class CondaMetaRecord(NamedTuple):
+    """The fields of a ``conda-meta`` record needed for telemetry."""
+
+    name: str
+    version: str
+    build: str
+    channel: str
+    subdir: str
+
+
+def _find(pattern: re.Pattern[bytes], *chunks: bytes) -> str | None:
+    for chunk in chunks:
+        if match := pattern.search(chunk):
+            return json.loads(b'"' + match.group(1) + b'"')
+    return None
+
+
+def _read_full_record(path: str) -> CondaMetaRecord:
+    with open(path, "rb") as fh:  # noqa: PTH123
+        data = json.load(fh)
+    return CondaMetaRecord(
+        name=data["name"],
+        version=data["version"],
+        build=data["build"],
+        channel=data.get("channel") or UNKNOWN_CHANNEL,
+        subdir=data.get("subdir") or "",
+    )
+
+
+def _split_file_name(file_name: str) -> list[str] | None:
+    """Return the name, version and build of a record's file name, if it has them."""
+    parts = file_name[: -len(".json")].rsplit("-", 2)
+    return parts if len(parts) == 3 and all(parts) else None
+
+
+def read_record(path: str) -> CondaMetaRecord:
+    """Read a single ``conda-meta`` record, parsing as little of it as possible."""
+    parts = _split_file_name(os.path.basename(path))  # noqa: PTH119
+    if parts is None:
+        return _read_full_record(path)
+
+    with open(path, "rb") as fh:  # noqa: PTH123
+        head = fh.read(CHUNK_SIZE)
+        size = os.fstat(fh.fileno()).st_size
+        if size > CHUNK_SIZE:
+            fh.seek(max(size - CHUNK_SIZE, CHUNK_SIZE))
+            tail = fh.read()
+        else:
+            tail = b""
+
+    channel = _find(_CHANNEL_PATTERN, head, tail)
+    subdir = _find(_SUBDIR_PATTERN, tail, head)
+    if channel is None or subdir is None:
+        return _read_full_record(path)
+
+    name, version, build = parts
+    return CondaMetaRecord(name, version, build, channel, subdir)
+
+
+def iter_conda_meta(prefix: str | os.PathLike) -> Iterator[CondaMetaRecord]:
+    """Yield the records of all packages installed in ``prefix`` in no particular order.
+
+    Records that cannot be read are skipped; a prefix without ``conda-meta``
+    yields nothing.
+    """
+    try:
+        entries = os.scandir(os.path.join(prefix, "conda-meta"))  # noqa: PTH118
+    except OSError:
+        return
+
+    with entries:
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                yield read_record(entry.path)
+            except _READ_ERRORS:
+                continue
+
+
+def iter_sorted_conda_meta(prefix: str | os.PathLike) -> Iterator[CondaMetaRecord]:
+    """Yield the records of ``prefix`` in the order of ``sorted(iter_conda_meta())``.
+
+    The order is taken from the file names, so each record is only read when the
+    consumer asks for it. Only records with an unusual file name are read upfront.
+    The file names are kept in a heap instead of being sorted, so consumers that
+    stop early only pay for listing the directory.
+    """
+    conda_meta = os.path.join(prefix, "conda-meta")  # noqa: PTH118
+    try:
+        entries = os.scandir(conda_meta)
+    except OSError:
+        return
+
+    keys = []
+    with entries:
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            if (parts := _split_file_name(entry.name)) is None:
+                try:
+                    record = _read_full_record(entry.path)
+                except _READ_ERRORS:
+                    continue
+                parts = [record.name, record.version, record.build]
+            keys.append((*parts, entry.name))
+    heapq.heapify(keys)
+
+    while keys:
+        *_, file_name = heapq.heappop(keys)
+        try:
+            yield read_record(os.path.join(conda_meta, file_name))  # noqa: PTH118
+        except _READ_ERRORS:
+            continue
+
+
+def get_python_version(prefix: str | os.PathLike) -> str | None:
+    """Return the version of the ``python`` package installed in ``prefix``.
+
+    Only the record file names are inspected; ``None`` is returned when python
+    is not installed.
+    """
+    try:
+        names = os.listdir(os.path.join(prefix, "conda-meta"))  # noqa: PTH118, PTH208
+    except OSError:
+        return None
+
+    for name in names:
+        if not name.startswith("python-") or not name.endswith(".json"):
+            continue
+        if (parts := _split_file_name(name)) is not None and parts[0] == "python":
+            return parts[1]
+    return None
+
+
+def get_site_packages(prefix: str | os.PathLike) -> str | None:
+    """Return the ``site-packages`` directory of ``prefix`` if python is installed."""
+    if (python_version := get_python_version(prefix)) is None:
+        return None
+    short_path = get_python_site_packages_short_path(python_version)
+    return os.path.join(prefix, short_path)  # noqa: PTH118
+
+
+def has_pip_packages(prefix: str | os.PathLike) -> bool:
+    """Whether ``site-packages`` contains distributions not installed by conda.
+
+    pip and other installers write their name to the ``INSTALLER`` file of each
+    ``.dist-info`` directory they create; conda writes ``conda``.
+    """
+    if (site_packages := get_site_packages(prefix)) is None:
+        return False
+
+    try:
+        entries = os.scandir(site_packages)
+    except OSError:
+        return False
+
+    with entries:
+        for entry in entries:
+            if not entry.name.endswith(".dist-info"):
+                continue
+            try:
+                with open(os.path.join(entry.path, "INSTALLER")) as fh:  # noqa: PTH118, PTH123
+                    installer = fh.read().strip()
+            except OSError:
+                continue
+            if installer != CONDA_INSTALLER:
+                return True
+    return False
@@ -0,0 +1,362 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Wire formats for the packages header.
+
+Three formats are supported:
+
+``plain``
+    The canonical package strings joined with ``;``, e.g.
+    ``defaults/linux-64::python-3.12.4-h5148396_1;defaults/noarch::tzdata-2024a-h04d1e81_0``.
+
+``grouped`` (format version 1)
+    Packages are grouped by channel and subdir so each ``<channel>/<subdir>::``
+    prefix is only sent once. The value starts with the ``~1`` marker field and
+    every group starts with a field ending in ``::``, e.g.
+    ``~1;defaults/linux-64::;python-3.12.4-h5148396_1;defaults/noarch::;tzdata-2024a-h04d1e81_0``.
+
+``compressed`` (format version 2)
+    The grouped payload (without its marker) compressed with zlib and encoded with
+    base64, e.g. ``~2;eNpLSS1OzsgsS...``.
+
+``delta`` (format version 3)
+    The fingerprint of the package set the value describes, the fingerprint of the
+    one it is relative to (its base) and the packages added and removed since then,
+    e.g. ``~3;<fingerprint>;<base>;defaults/noarch::;six-1.16.0-pyhd3eb1b0_1;-;tzdata``.
+    Added packages are grouped like in the ``grouped`` format, removed packages are
+    listed by name after a ``-`` field. A value without a base lists all packages
+    and starts a new chain; :func:`reconstruct_packages` applies a chain of values.
+
+Values in the ``plain``, ``grouped`` and ``delta`` formats can be truncated at any
+field boundary and still be decoded. A ``compressed`` value is a single field, so
+:func:`encode_packages` drops packages until it fits into the given size limit.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import zlib
+from itertools import groupby
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from typing import Final
+
+#: Separator between fields, identical to the one used by all headers
+FIELD_SEPARATOR: Final = ";"
+
+#: Last field of a value that had to be truncated
+TRUNCATION_MARKER: Final = "..."
+
+#: Separator between the channel/subdir and the package in canonical strings
+CHANNEL_SEPARATOR: Final = "::"
+
+#: First character of the field that marks an encoded value and its version
+FORMAT_MARKER: Final = "~"
+
+#: Format names mapped to their version; ``plain`` values carry no marker
+PACKAGES_FORMATS: Final = {"plain": 0, "grouped": 1, "compressed": 2, "delta": 3}
+
+#: Field after which the ``delta`` format lists the names of removed packages
+REMOVED_MARKER: Final = "-"
+
+#: Size in bits of the fingerprint of a package set
+FINGERPRINT_BITS: Final = 128
+
+#: Fingerprints are sums of package digests modulo this value
+FINGERPRINT_MODULUS: Final = 1 << FINGERPRINT_BITS
+
+
+class Delta(NamedTuple):
+    """A decoded value in the ``delta`` format."""
+
+    fingerprint: str
+    #: Fingerprint of the package set the value is relative to, empty for a full set
+    base: str
+    added: tuple[str, ...]
+    #: Names of the removed packages
+    removed: tuple[str, ...]
+    #: Whether the value was truncated, so that some changes are missing
+    truncated: bool
+
+
+def package_name(package: str) -> str:
+    """Return the name of the package in the canonical string ``package``."""
+    return package.rpartition(CHANNEL_SEPARATOR)[2].rsplit("-", 2)[0]
+
+
+def package_digest(package: str) -> int:
+    """Return what ``package`` adds to the fingerprint of a package set."""
+    digest = hashlib.sha256(package.encode("utf-8")).digest()
+    return int.from_bytes(digest[: FINGERPRINT_BITS // 8], "big")
+
+
+def fingerprint(packages: Iterable[str]) -> int:
+    """Return the fingerprint of a set of canonical package strings.
+
+    The fingerprint is the sum of the digests of all packages, so it doesn't depend
+    on their order and adding or removing a package updates it with a single
+    addition or subtraction of that package's digest.
+    """
+    return sum(map(package_digest, packages)) % FINGERPRINT_MODULUS
+
+
+def format_fingerprint(value: int) -> str:
+    """Return a fingerprint as a fixed-width hex string, as sent in the header."""
+    return f"{value:0{FINGERPRINT_BITS // 4}x}"
+
+
+def _split(package: str) -> tuple[str, str]:
+    channel, separator, dist = package.rpartition(CHANNEL_SEPARATOR)
+    return channel + separator, dist
+
+
+def _group(packages: Iterable[str]) -> list[str]:
+    """Return the fields of the grouped format without the marker."""
+    fields = []
+    for channel, group in groupby(sorted(map(_split, packages)), key=lambda p: p[0]):
+        fields.append(channel)
+        fields.extend(dist for _, dist in group)
+    return fields
+
+
+def _ungroup(fields: Iterable[str]) -> list[str]:
+    """Return the packages in the fields of the grouped format."""
+    packages = []
+    channel = None
+    for field in fields:
+        if field.endswith(CHANNEL_SEPARATOR):
+            channel = field
+        elif channel is not None:
+            packages.append(f"{channel}{field}")
+    return packages
+
+
+def _join(
+    fields: Iterable[str], size_limit: int | None, mark_truncation: bool = False
+) -> str:
+    """Join ``fields`` but stop before the value gets longer than ``size_limit``.
+
+    With ``mark_truncation``, a value that had to be cut ends with
+    ``TRUNCATION_MARKER``, which also has to fit into ``size_limit``.
+    """
+    if size_limit is None:
+        return FIELD_SEPARATOR.join(fields)
+
+    parts = []
+    length = -len(FIELD_SEPARATOR)
+    for field in fields:
+        if length + len(FIELD_SEPARATOR) + len(field) > size_limit:
+            break
+        length += len(FIELD_SEPARATOR) + len(field)
+        parts.append(field)
+    else:
+        return FIELD_SEPARATOR.join(parts)
+
+    if mark_truncation:
+        marker_length = len(FIELD_SEPARATOR) + len(TRUNCATION_MARKER)
+        while parts and length + marker_length > size_limit:
+            length -= len(FIELD_SEPARATOR) + len(parts.pop())
+        parts.append(TRUNCATION_MARKER)
+    return FIELD_SEPARATOR.join(parts)
+
+
+def _compress(fields: list[str]) -> str:
+    payload = zlib.compress(FIELD_SEPARATOR.join(fields).encode("utf-8"), 9)
+    return base64.b64encode(payload).decode("ascii")
+
+
+def encode_packages(
+    packages: Iterable[str], encoding: str = "plain", size_limit: int | None = None
+) -> str:
+    """Encode canonical package strings with one of the ``PACKAGES_FORMATS``.
+
+    If ``size_limit`` is given, packages that don't fit are left out so the value
+    is never cut in the middle of a field. ``delta`` values list all packages, see
+    :func:`encode_delta` for the changes relative to another package set.
+    """
+    version = PACKAGES_FORMATS[encoding]
+    if version == 0:
+        return _join(packages, size_limit)
+    if version == 3:
+        packages = list(packages)
+        return encode_delta(
+            format_fingerprint(fingerprint(packages)), "", packages, (), size_limit
+        )
+
+    marker = f"{FORMAT_MARKER}{version}"
+    fields = _group(packages)
+    if version == 1:
+        return _join([marker, *fields], size_limit)
+
+    value = f"{marker}{FIELD_SEPARATOR}{_compress(fields)}"
+    if size_limit is None:
+        return value
+
+    # shrink the number of fields in proportion to the overshoot until it fits
+    count = len(fields)
+    while len(value) > size_limit and count > 1:
+        count = min(count - 1, int(count * size_limit / len(value) * 0.98))
+        # don't end on a channel field without packages
+        while count > 1 and fields[count - 1].endswith(CHANNEL_SEPARATOR):
+            count -= 1
+        value = f"{marker}{FIELD_SEPARATOR}{_compress(fields[:count])}"
+    return value if len(value) <= size_limit else ""
+
+
+def decode_packages(value: str) -> tuple[str, ...]:
+    """Return the canonical package strings of a packages header value.
+
+    Fields that cannot be decoded (e.g. a partial package) are ignored. Values in
+    the ``delta`` format can only be decoded if they list all packages, the others
+    need the values before them (see :func:`reconstruct_packages`).
+    """
+    if value.startswith(f"{FORMAT_MARKER}{PACKAGES_FORMATS['delta']}{FIELD_SEPARATOR}"):
+        delta = decode_delta(value)
+        if delta.base:
+            raise ValueError(f"Delta relative to {delta.base} needs its base")
+        return delta.added
+
+    fields = [
+        field
+        for field in value.split(FIELD_SEPARATOR)
+        if field and field != TRUNCATION_MARKER
+    ]
+    if not fields or not fields[0].startswith(FORMAT_MARKER):
+        return tuple(field for field in fields if CHANNEL_SEPARATOR in field)
+
+    marker, *fields = fields
+    if marker == f"{FORMAT_MARKER}{PACKAGES_FORMATS['compressed']}":
+        if not fields:
+            return ()
+        payload = zlib.decompress(base64.b64decode(fields[0]))
+        fields = payload.decode("utf-8").split(FIELD_SEPARATOR)
+    elif marker != f"{FORMAT_MARKER}{PACKAGES_FORMATS['grouped']}":
+        raise ValueError(f"Unknown packages format: {marker}")
+
+    return tuple(_ungroup(fields))
+
+
+def diff_packages(
+    old: Iterable[str], new: Iterable[str]
+) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """Return the packages added to ``old`` and the names of the ones removed.
+
+    A package whose version or build changed is only added, it replaces the
+    package with the same name.
+    """
+    old = frozenset(old)
+    new = frozenset(new)
+    new_names = {package_name(package) for package in new}
+    added = tuple(sorted(new - old))
+    removed = tuple(
+        sorted(name for name in map(package_name, old - new) if name not in new_names)
+    )
+    return added, removed
+
+
+def encode_delta(
+    fingerprint: str,
+    base: str,
+    added: Iterable[str] = (),
+    removed: Iterable[str] = (),
+    size_limit: int | None = None,
+) -> str:
+    """Encode the changes to the package set ``base`` in the ``delta`` format.
+
+    ``fingerprint`` is the fingerprint of the resulting package set, ``removed``
+    are package names. Without a ``base``, ``added`` has to be the full package set.
+    If ``size_limit`` is given, the changes that don't fit are left out and the value
+    ends with ``TRUNCATION_MARKER``, so it is never mistaken for a complete one.
+    """
+    fields = [f"{FORMAT_MARKER}{PACKAGES_FORMATS['delta']}", fingerprint, base]
+    fields.extend(_group(added))
+    if removed := sorted(removed):
+        fields.append(REMOVED_MARKER)
+        fields.extend(removed)
+    return _join(fields, size_limit, mark_truncation=True)
+
+
+def decode_delta(value: str) -> Delta:
+    """Return the fingerprints and changes of a value in the ``delta`` format."""
+    marker, _, rest = value.partition(FIELD_SEPARATOR)
+    fields = rest.split(FIELD_SEPARATOR)
+    if marker != f"{FORMAT_MARKER}{PACKAGES_FORMATS['delta']}" or len(fields) < 2:
+        raise ValueError(f"Not a delta value: {value[:20]!r}")
+
+    fingerprint, base, *fields = fields
+    truncated = bool(fields) and fields[-1] == TRUNCATION_MARKER
+    if truncated:
+        fields.pop()
+    removed: list[str] = []
+    if REMOVED_MARKER in fields:
+        index = fields.index(REMOVED_MARKER)
+        fields, removed = fields[:index], fields[index + 1 :]
+    return Delta(
+        fingerprint=fingerprint,
+        base=base,
+        added=tuple(_ungroup(fields)),
+        removed=tuple(name for name in removed if name),
+        truncated=truncated,
+    )
+
+
+def truncate_delta(
+    value: str, base_packages: Iterable[str]
+) -> tuple[str, tuple[str, ...]]:
+    """Return a truncated ``delta`` value for the package set it describes.
+
+    The fingerprint of a truncated value still covers the changes that were cut
+    off. The returned value carries the fingerprint of ``base_packages`` with only
+    the changes that were kept, ends with ``TRUNCATION_MARKER`` and is returned with
+    that package set, so it can become the base of the following values. Values
+    that weren't truncated are returned as they are.
+    """
+    delta = decode_delta(value)
+    packages = apply_delta(base_packages, delta)
+    if not delta.truncated:
+        return value, packages
+    fields = encode_delta(
+        format_fingerprint(fingerprint(packages)),
+        delta.base,
+        delta.added,
+        delta.removed,
+    )
+    return FIELD_SEPARATOR.join((fields, TRUNCATION_MARKER)), packages
+
+
+def apply_delta(packages: Iterable[str], delta: Delta) -> tuple[str, ...]:
+    """Return ``packages`` with the changes of ``delta``, sorted by name."""
+    by_name = {package_name(package): package for package in packages}
+    for name in delta.removed:
+        by_name.pop(name, None)
+    for package in delta.added:
+        by_name[package_name(package)] = package
+    return tuple(by_name[name] for name in sorted(by_name))
+
+
+def reconstruct_packages(values: Iterable[str]) -> tuple[str, ...]:
+    """Return the full package set of the last value in a chain of ``delta`` values.
+
+    The chain starts with a value without a base and every following value is
+    relative to the fingerprint of the one before it. ``ValueError`` is raised if
+    the chain is broken or a package set doesn't match its fingerprint, e.g.
+    because a value was truncated without :func:`truncate_delta`.
+    """
+    packages: tuple[str, ...] | None = None
+    previous = ""
+    for value in values:
+        delta = decode_delta(value)
+        if not delta.base:
+            packages = apply_delta((), delta)
+        elif packages is not None and delta.base == previous:
+            packages = apply_delta(packages, delta)
+        else:
+            raise ValueError(f"Delta relative to unknown package set {delta.base}")
+        if format_fingerprint(fingerprint(packages)) != delta.fingerprint:
+            raise ValueError(f"Package set doesn't match {delta.fingerprint}")
+        previous = delta.fingerprint
+    if packages is None:
+        raise ValueError("No delta values")
+    return packages
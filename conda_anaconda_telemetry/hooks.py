@@ -4,36 +4,114 @@
 
 from __future__ import annotations
 
+import contextlib
+import contextvars
 import functools
+import hashlib
+import json
 import logging
+import os
+import queue
 import re
+import threading
 import time
 import typing
+from pathlib import Path
 
 from conda.base.context import context
-from conda.cli.main_list import list_packages
-from conda.common.configuration import PrimitiveParameter
-from conda.common.url import mask_anaconda_token
-from conda.models.channel import all_channel_urls
-from conda.plugins import CondaRequestHeader, CondaSetting, hookimpl
+from conda.common.configuration import (
+    MapParameter,
+    PrimitiveParameter,
+    SequenceParameter,
+)
+from conda.plugins import (
+    CondaPostTransactionAction,
+    CondaPreCommand,
+    CondaRequestHeader,
+    CondaSetting,
+    CondaSubcommand,
+    hookimpl,
+)
 
-try:
-    from conda_build import __version__ as conda_build_version
-except ImportError:
-    conda_build_version = "n/a"
+from . import cli
+from .cache import HeaderCache, get_prefix_stamp
+from .collection import DEFAULT_MAX_BYTES, CollectionContext, Session
+from .conda_meta import get_site_packages, has_pip_packages, iter_sorted_conda_meta
+from .encoding import (
+    FIELD_SEPARATOR,
+    PACKAGES_FORMATS,
+    TRUNCATION_MARKER,
+    decode_delta,
+    diff_packages,
+    encode_delta,
+    encode_packages,
+    truncate_delta,
+)
+from .inventory import PackageInventory, format_package
+from .metrics import registry as metrics
+from .packing import Candidate, pack
+from .profiling import profiler
+from .tracing import (
+    ATTRIBUTE_BYTES,
+    ATTRIBUTE_CACHE_HIT,
+    ATTRIBUTE_TRUNCATED_BYTES,
+    tracer,
+)
 
 if typing.TYPE_CHECKING:
-    from collections.abc import Iterator, Sequence
-    from typing import Callable
+    from collections.abc import Hashable, Iterable, Iterator, Mapping, Sequence
+    from typing import Any, Callable, TypeVar
 
-logger = logging.getLogger(__name__)
+    from .collection import CachedFunction
 
-#: Field separator for request header
-FIELD_SEPARATOR = ";"
+    F = TypeVar("F", bound=Callable[..., Any])
+
+logger = logging.getLogger(__name__)
 
 #: Size limit in bytes for the payload in the request header
 SIZE_LIMIT = 7_000
 
+#: Guaranteed size in bytes for the packages header, it may use more of
+#: ``SIZE_LIMIT`` if the other headers leave room
+PACKAGES_SIZE_LIMIT = 5_000
+
+#: Environment variables starting with this prefix override virtual packages
+VIRTUAL_PACKAGES_OVERRIDE_PREFIX = "CONDA_OVERRIDE_"
+
+#: Seconds the first request waits for the headers collected in the background
+#: before a reduced set of headers is sent instead; later requests don't wait longer
+PREFETCH_TIMEOUT = 0.25
+
+#: Commands that make requests to channels; their headers are collected in the
+#: background as soon as they start
+PREFETCH_COMMANDS = frozenset(
+    {"create", "install", "remove", "search", "uninstall", "update", "upgrade"}
+)
+
+#: Name of the thread collecting the headers in the background
+PREFETCH_THREAD_NAME = "anaconda-telemetry-prefetch"
+
+#: Background collections started for each command, by collection scope and command
+PREFETCHES: dict[tuple[Hashable, str], Prefetch] = {}
+
+#: Value sent in place of a header whose collector missed its deadline
+TIMEOUT_MARKER = "<timeout>"
+
+#: Name of the threads running collectors with a deadline
+COLLECTOR_THREAD_NAME = "anaconda-telemetry-collector"
+
+#: Threads the collectors of a cold request run on at the same time
+COLLECTOR_WORKERS = 4
+
+#: Collectors that missed their deadline and keep running in the background, by
+#: collection scope and header name; set once they are done
+LATE_COLLECTORS: dict[tuple[Hashable, str], threading.Event] = {}
+
+#: Package sets of ``delta`` values that were collected but not sent yet, by
+#: collection scope and value; each becomes the base of later values once its value
+#: was sent
+PENDING_SNAPSHOTS: dict[tuple[Hashable, str], tuple[str, PackagesSnapshot]] = {}
+
 #: Prefix for all custom headers submitted via this plugin
 # Note: header names are normalized to lowercase by the HTTP layer, so keep
 # the prefix lowercased to match the actual header names emitted at runtime.
@@ -57,7 +135,82 @@ HEADER_INSTALL = f"{HEADER_PREFIX}-install"
 #: Name of the sys info header
 HEADER_SYS_INFO = f"{HEADER_PREFIX}-sys-info"
 
-#: Regex pattern for hosts and paths we want to submit request headers to
+#: Seconds the collector of each header may take before ``TIMEOUT_MARKER`` is sent
+#: instead; can be changed per header with the ``anaconda_telemetry_timeouts`` setting
+COLLECTOR_TIMEOUTS = {
+    HEADER_SYS_INFO: 1.0,
+    HEADER_CHANNELS: 1.0,
+    HEADER_VIRTUAL_PACKAGES: 2.0,
+    HEADER_PACKAGES: 2.0,
+}
+
+#: Headers collected for every command by default, besides the command's own
+BASE_HEADERS = frozenset(
+    {HEADER_SYS_INFO, HEADER_CHANNELS, HEADER_VIRTUAL_PACKAGES, HEADER_PACKAGES}
+)
+
+#: Base headers collected per command, other commands collect all ``BASE_HEADERS``;
+#: ``create`` targets an environment that doesn't exist yet and ``search`` and ``env``
+#: don't depend on an environment's packages, so none of them reads a prefix
+COLLECTION_PLANS = {
+    "create": BASE_HEADERS - {HEADER_PACKAGES},
+    "search": BASE_HEADERS - {HEADER_PACKAGES},
+}
+
+#: Request classes, see ``classify_request``
+REQUEST_REPODATA = "repodata"
+REQUEST_ARTIFACT = "artifact"
+REQUEST_OTHER = "other"
+
+#: Path endings of package artifact downloads
+ARTIFACT_SUFFIXES = (".conda", ".tar.bz2")
+
+#: Path endings of repodata requests, including compressed, patched and sharded
+#: repodata
+REPODATA_SUFFIXES = (".json", ".json.zst", ".jlap", ".msgpack.zst")
+
+#: Headers sent with each request class, ``None`` sends all headers; packages are
+#: downloaded after the solve, when the repodata requests already sent everything
+REQUEST_PROFILES: dict[str, frozenset[str] | None] = {
+    REQUEST_REPODATA: None,
+    REQUEST_ARTIFACT: frozenset({HEADER_SYS_INFO}),
+    REQUEST_OTHER: None,
+}
+
+#: Header bundles reduced to the profile of a request class, by collection scope,
+#: command and request class, together with the bundle they were taken from
+PROFILE_BUNDLES: dict[
+    tuple[Hashable, str, str],
+    tuple[tuple[CondaRequestHeader, ...], tuple[CondaRequestHeader, ...]],
+] = {}
+
+#: Name of the session header, linking requests to the one with the full headers
+HEADER_SESSION = f"{HEADER_PREFIX}-session"
+
+#: Random identifier of the current conda process
+SESSION_ID = os.urandom(16).hex()
+
+#: Header sent in place of the full headers once a host has received them
+SESSION_HEADER = CondaRequestHeader(name=HEADER_SESSION, value=SESSION_ID)
+
+#: Hosts that received the full headers with the ``anaconda_telemetry_send_once``
+#: setting enabled, with the collection scope of the headers
+SESSION_HOSTS: set[tuple[Hashable, str]] = set()
+
+#: Guards adding to ``SESSION_HOSTS``; reading from it doesn't need the lock
+SESSION_HOSTS_LOCK = threading.Lock()
+
+#: Hosts we want to submit request headers to for any path
+REQUEST_HEADER_HOSTS = frozenset({"repo.anaconda.com", "repo.anaconda.cloud"})
+
+#: Hosts we want to submit request headers to, mapped to the channels (i.e. the
+#: first path segment) requests have to be made for
+REQUEST_HEADER_CHANNELS = {
+    "conda.anaconda.org": frozenset({"anaconda", "conda-forge", "main", "msys2", "r"}),
+}
+
+#: Regex pattern for hosts and paths we want to submit request headers to; this is
+#: the reference definition that ``should_submit_request_headers`` implements
 REQUEST_HEADER_PATTERN = re.compile(
     r"""
     ^                           # Start of string
@@ -82,27 +235,56 @@ REQUEST_HEADER_PATTERN = re.compile(
 )
 
 
-def timer(func: Callable) -> Callable:
-    """Log the duration of a function call."""
+def timer(func: F) -> F:
+    """Log the duration of a function call and record it in the metrics registry.
+
+    Nothing is measured unless metrics are enabled, tracing is enabled or logging
+    is at INFO.
+    """
+    name = func.__name__
+    if hasattr(func, "cache_info"):
+        metrics.register_cache(name, func)
 
     @functools.wraps(func)
-    def wrapper_timer(*args: tuple, **kwargs: dict) -> Callable:
+    def wrapper_timer(*args: tuple, **kwargs: dict) -> Any:  # noqa: ANN401
         """Wrap the given function."""
-        if logger.getEffectiveLevel() <= logging.INFO:
+        if tracer.enabled:
+            return trace_call(func, *args, **kwargs)
+        if metrics.enabled or logger.isEnabledFor(logging.INFO):
             tic = time.perf_counter()
             value = func(*args, **kwargs)
             toc = time.perf_counter()
             elapsed_time = toc - tic
+            if metrics.enabled:
+                metrics.record_duration(name, elapsed_time)
             logger.info(
                 "function: %s; duration (seconds): %0.4f",
-                func.__name__,
+                name,
                 elapsed_time,
             )
             return value
 
         return func(*args, **kwargs)
 
-    return wrapper_timer
+    return typing.cast("F", wrapper_timer)
+
+
+def trace_call(func: Callable, *args: tuple, **kwargs: dict) -> Any:  # noqa: ANN401
+    """Call ``func`` in a span, recording its duration like ``timer`` does."""
+    name = func.__name__
+    cache_get = getattr(func, "cache_get", None)
+    with tracer.span(name) as span:
+        if cache_get is not None:
+            span.set_attribute(ATTRIBUTE_CACHE_HIT, cache_get(*args) is not None)
+        tic = time.perf_counter()
+        value = func(*args, **kwargs)
+        elapsed_time = time.perf_counter() - tic
+        if isinstance(value, str):
+            span.set_attribute(ATTRIBUTE_BYTES, len(value))
+    if metrics.enabled:
+        metrics.record_duration(name, elapsed_time)
+    logger.info("function: %s; duration (seconds): %0.4f", name, elapsed_time)
+    return value
 
 
 def get_virtual_packages() -> tuple[str, ...]:
@@ -113,8 +295,24 @@ def get_virtual_packages() -> tuple[str, ...]:
     )
 
 
+def get_conda_build_version() -> str:
+    """Return the installed version of conda-build or ``n/a`` if it isn't installed.
+
+    The version is read from the package metadata since importing conda-build is slow.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("conda-build")
+    except PackageNotFoundError:
+        return "n/a"
+
+
 def get_channel_urls() -> tuple[str, ...]:
     """Return a list of currently configured channel URLs with tokens masked."""
+    from conda.common.url import mask_anaconda_token
+    from conda.models.channel import all_channel_urls
+
     channels = list(all_channel_urls(context.channels))
     return tuple(mask_anaconda_token(c) for c in channels)
 
@@ -124,12 +322,213 @@ def get_conda_command() -> str:
     return context._argparse_args.cmd
 
 
+def get_prefix() -> str:
+    """Return the prefix of the environment telemetry data is collected for.
+
+    That is the prefix of the current ``collection_session``, else the environment
+    given with ``-n``/``-p``, else the active environment.
+    """
+    session = collection.current_session()
+    if session is not None and session.prefix is not None:
+        return session.prefix
+    args = context._argparse_args
+    if getattr(args, "prefix", None) or getattr(args, "name", None):
+        return str(context.target_prefix)
+    return str(context.active_prefix or context.root_prefix)
+
+
+def get_channel_names_key() -> str:
+    """Return a hash of the configuration the canonical channel names depend on.
+
+    ``conda list --canonical`` names channels relative to the channel alias, the
+    default channels and the custom channels, so a cached packages header is only
+    valid for the configuration it was computed with.
+    """
+    config = json.dumps(
+        [
+            str(context.channel_alias),
+            [str(channel) for channel in context.migrated_channel_aliases],
+            [str(channel) for channel in context.default_channels],
+            sorted(
+                (name, str(channel))
+                for name, channel in context.custom_channels.items()
+            ),
+        ],
+        default=str,
+    )
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+
+def get_site_packages_stamp(prefix: str) -> int:
+    """Return the modification time of the prefix's ``site-packages`` directory.
+
+    pip doesn't touch ``conda-meta``, but adds and removes directories in
+    ``site-packages`` whenever it installs or removes a package.
+    """
+    if (site_packages := get_site_packages(prefix)) is None:
+        return -1
+    try:
+        return Path(site_packages).stat().st_mtime_ns
+    except OSError:
+        return -1
+
+
+#: Default scope of the current command by the identity of its parsed arguments,
+#: see ``get_default_scope``
+DEFAULT_SCOPES: dict[int, tuple[object, Session]] = {}
+
+
+def get_default_scope() -> Session:
+    """Return the session values are collected in outside of ``collection_session``.
+
+    A conda command reads a single configuration, so only its prefix is part of the
+    key. Resolving ``-n``/``-p`` reads the environments directories, so the scope
+    is computed once per command and kept for its parsed arguments.
+    """
+    args = context._argparse_args
+    if (entry := DEFAULT_SCOPES.get(id(args))) is not None and entry[0] is args:
+        return entry[1]
+    scope = Session(get_prefix())
+    DEFAULT_SCOPES.clear()
+    DEFAULT_SCOPES[id(args)] = (args, scope)
+    return scope
+
+
+#: Caches of the collected values, per prefix and configuration (see
+#: ``collection_session``)
+collection = CollectionContext(default_scope=get_default_scope)
+
+
+def get_collection_config_key() -> str:
+    """Return a hash of the configuration the collected values depend on."""
+    config = json.dumps(
+        [
+            get_channel_config_key(),
+            get_packages_format(),
+            context.plugins.anaconda_telemetry_detect_virtual_packages,
+            context.plugins.anaconda_telemetry_collectors or {},
+        ],
+        default=str,
+    )
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+
+def configure_collection() -> None:
+    """Apply the ``anaconda_telemetry_cache_*`` settings to the cached values."""
+    ttl = float(context.plugins.anaconda_telemetry_cache_ttl)
+    collection.configure(
+        max_bytes=int(context.plugins.anaconda_telemetry_cache_max_bytes),
+        ttl=ttl if ttl > 0 else None,
+    )
+
+
+@contextlib.contextmanager
+def collection_session(prefix: str | None = None) -> Iterator[Session]:
+    """Collect the headers of the requests made in the block for ``prefix``.
+
+    Meant for processes that run many operations on different prefixes, like
+    services embedding conda: values collected in the block are cached for
+    ``prefix`` and the current configuration only. The session applies to the
+    current thread, and to threads started with a copy of its context.
+    """
+    configure_collection()
+    with collection.session(prefix, get_collection_config_key()) as session:
+        yield session
+
+
+@functools.lru_cache(1_024)
+def get_channel_name(channel: str) -> str:
+    """Return the canonical name of a channel URL (e.g. ``conda-forge``)."""
+    from conda.models.channel import Channel
+
+    return Channel(channel).canonical_name
+
+
+def iter_package_list() -> Iterator[str]:
+    """Yield the packages in the current environment, sorted by name.
+
+    Packages are formatted like ``conda list --canonical``. Every record is read and
+    formatted only when it is consumed, so stopping early skips the remaining ones.
+    Prefixes containing packages installed with pip are listed by conda itself,
+    which also reports those packages.
+    """
+    prefix = get_prefix()
+    if has_pip_packages(prefix):
+        from conda.cli.main_list import list_packages
+
+        _, pip_packages = list_packages(prefix, format="canonical")
+        yield from typing.cast("list[str]", pip_packages)
+        return
+
+    for record in iter_sorted_conda_meta(prefix):
+        yield format_package(
+            get_channel_name(record.channel),
+            record.subdir,
+            record.name,
+            record.version,
+            record.build,
+        )
+
+
 def get_package_list() -> tuple[str, ...]:
-    """Retrieve the list of packages in the current environment."""
-    prefix = context.active_prefix or context.root_prefix
-    _, packages = list_packages(prefix, format="canonical")
+    """Retrieve the list of packages in the current environment.
+
+    Packages are formatted like ``conda list --canonical`` and sorted by name.
+    """
+    return tuple(iter_package_list())
+
+
+@collection.cached
+def get_inventory() -> PackageInventory:
+    """Return the inventory of the packages installed in the current environment.
 
-    return packages
+    The environment is only scanned once per process; transactions update the
+    inventory with ``update_inventory``.
+    """
+    return PackageInventory(get_prefix(), get_package_list())
+
+
+def update_inventory(
+    prefix: str, unlinked: Iterable[str], linked: Iterable[str]
+) -> bool:
+    """Apply a transaction on ``prefix`` to the inventory, if it has been read.
+
+    ``unlinked`` are package names and ``linked`` canonical package strings. The
+    headers that depend on the inventory are recomputed on the next request.
+    Returns whether the inventory was updated.
+    """
+    inventory = get_inventory.cache_get()
+    if inventory is None:
+        # the header may have been streamed from the prefix without reading the
+        # inventory, it is streamed again from the changed prefix
+        if os.path.normcase(get_prefix()) == os.path.normcase(prefix):
+            collection.discard(get_installed_packages_header_value, get_header_bundle)
+        return False
+    if os.path.normcase(inventory.prefix) != os.path.normcase(prefix):
+        return False
+
+    inventory.update(unlinked, linked)
+    collection.discard(get_installed_packages_header_value, get_header_bundle)
+    return True
+
+
+def iter_installed_packages() -> Iterable[str]:
+    """Return the packages of the inventory if it has been read, else stream them.
+
+    Streaming only reads as many ``conda-meta`` records as the consumer takes.
+    """
+    if (inventory := get_inventory.cache_get()) is not None:
+        return inventory.packages()
+    return iter_package_list()
+
+
+def get_packages_format() -> str:
+    """Return the wire format of the packages header (see ``PACKAGES_FORMATS``)."""
+    encoding = context.plugins.anaconda_telemetry_packages_format
+    if encoding not in PACKAGES_FORMATS:
+        logger.debug("Unknown packages format %r, using 'plain'", encoding)
+        return "plain"
+    return encoding
 
 
 def get_search_term() -> str:
@@ -143,11 +542,11 @@ def get_install_arguments() -> tuple[str, ...]:
 
 
 @timer
-@functools.lru_cache(None)
+@collection.cached
 def get_sys_info_header_value() -> str:
     """Return ``;`` delimited string of extra system information."""
     telemetry_data = {
-        "conda_build_version": conda_build_version,
+        "conda_build_version": get_conda_build_version(),
         "conda_command": get_conda_command(),
     }
 
@@ -156,127 +555,829 @@ def get_sys_info_header_value() -> str:
     )
 
 
+def collapse_channel_urls(urls: Iterable[str], subdirs: Iterable[str]) -> list[str]:
+    """Strip the ``subdirs`` from ``urls`` and drop duplicates, keeping the order."""
+    subdirs = frozenset(subdirs)
+    channels: dict[str, None] = {}
+    for url in urls:
+        base, _, last = url.rstrip("/").rpartition("/")
+        channels.setdefault(base if base and last in subdirs else url, None)
+    return list(channels)
+
+
+def get_channel_config_key() -> str:
+    """Return a hash of the configuration the channel URLs are expanded from.
+
+    The configuration may contain tokens, so only its hash is stored.
+    """
+    argparse_args = dict(getattr(context, "_argparse_args", None) or {})
+    config = json.dumps(
+        [
+            list(context.channels),
+            list(context.default_channels),
+            sorted(
+                (name, str(channel))
+                for name, channel in context.custom_channels.items()
+            ),
+            sorted(
+                (name, [str(channel) for channel in channels])
+                for name, channels in context.custom_multichannels.items()
+            ),
+            [str(channel) for channel in context.migrated_channel_aliases],
+            str(context.channel_alias),
+            list(context.subdirs),
+            bool(argparse_args.get("override_channels")),
+        ],
+        default=str,
+    )
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+
 @timer
-@functools.lru_cache(None)
+@collection.cached
 def get_channel_urls_header_value() -> str:
-    """Return ``FIELD_SEPARATOR`` delimited string of channel URLs."""
-    return FIELD_SEPARATOR.join(get_channel_urls())
+    """Return ``FIELD_SEPARATOR`` delimited string of channel URLs.
+
+    Every channel is only listed once, without its subdirs. The value is cached on
+    disk for as long as the channel configuration stays the same.
+    """
+    from conda import __version__ as conda_version
+
+    key = get_channel_config_key()
+    stamp = (conda_version,)
+    cache = HeaderCache("channels")
+    if (value := cache.get(key, stamp)) is not None:
+        return value
+
+    value = FIELD_SEPARATOR.join(
+        collapse_channel_urls(get_channel_urls(), context.subdirs)
+    )
+    cache.set(key, stamp, value)
+    return value
+
+
+def get_virtual_packages_stamp() -> tuple[str, ...]:
+    """Return what the detected virtual packages depend on, besides the host.
+
+    Detection can be overridden with the ``CONDA_OVERRIDE_*`` environment
+    variables, and the ``__conda`` virtual package reports conda's version.
+    """
+    from conda import __version__ as conda_version
+
+    overrides = sorted(
+        f"{name}={value}"
+        for name, value in os.environ.items()
+        if name.startswith(VIRTUAL_PACKAGES_OVERRIDE_PREFIX)
+    )
+    return (conda_version, context.subdir, *overrides)
 
 
 @timer
-@functools.lru_cache(None)
+@collection.cached
 def get_virtual_packages_header_value() -> str:
-    """Return ``FIELD_SEPARATOR`` delimited string of virtual packages."""
-    return FIELD_SEPARATOR.join(get_virtual_packages())
+    """Return ``FIELD_SEPARATOR`` delimited string of virtual packages.
+
+    Detecting virtual packages can be slow (e.g. ``__cuda``), so the value is
+    cached on disk per host for ``anaconda_telemetry_virtual_packages_ttl``
+    seconds. Without a cached value, detection can be skipped entirely with
+    ``anaconda_telemetry_detect_virtual_packages``.
+    """
+    import platform
+
+    plugins = context.plugins
+    ttl = plugins.anaconda_telemetry_virtual_packages_ttl
+    host = platform.node()
+    stamp = get_virtual_packages_stamp()
+    cache = HeaderCache("virtual-packages")
+    if ttl > 0 and (value := cache.get(host, stamp, max_age=ttl)) is not None:
+        return value
+
+    if not plugins.anaconda_telemetry_detect_virtual_packages:
+        return ""
+
+    value = FIELD_SEPARATOR.join(get_virtual_packages())
+    if ttl > 0:
+        cache.set(host, stamp, value)
+    return value
 
 
 @timer
-@functools.lru_cache(None)
+@collection.cached
 def get_install_arguments_header_value() -> str:
     """Return ``FIELD_SEPARATOR`` delimited string of channel URLs."""
     return FIELD_SEPARATOR.join(get_install_arguments())
 
 
 @timer
-@functools.lru_cache(None)
+@collection.cached
 def get_installed_packages_header_value() -> str:
-    """Return ``FIELD_SEPARATOR`` delimited string of install arguments."""
-    return FIELD_SEPARATOR.join(get_package_list())
+    """Return the installed packages encoded in the configured packages format.
+
+    The value is cached on disk per prefix and reused by later conda processes
+    for as long as neither the prefix (including its ``site-packages``) nor the
+    channel configuration has changed.
+    """
+    encoding = get_packages_format()
+    prefix = get_prefix()
+    stamp: tuple[int | str, ...] | None = None
+    if (prefix_stamp := get_prefix_stamp(prefix)) is not None:
+        stamp = (
+            *prefix_stamp,
+            get_site_packages_stamp(prefix),
+            get_channel_names_key(),
+            encoding,
+        )
+    if encoding == "delta":
+        return get_packages_delta(prefix, stamp)
+
+    cache = HeaderCache("packages")
+    if stamp is not None and (value := cache.get(prefix, stamp)) is not None:
+        return value
+
+    if encoding == "plain":
+        # stops reading the prefix once the overall budget is used up; the value is
+        # cut to its final size when packed
+        value = encode_packages(iter_installed_packages(), encoding, SIZE_LIMIT)
+    else:
+        # the other formats group all packages by channel first; compressed values
+        # can't be truncated later on, so they have to fit into the guaranteed share
+        size_limit = PACKAGES_SIZE_LIMIT if encoding == "compressed" else SIZE_LIMIT
+        value = encode_packages(get_inventory().packages(), encoding, size_limit)
+    if stamp is not None:
+        cache.set(prefix, stamp, value)
+    return value
+
+
+class PackagesSnapshot(typing.NamedTuple):
+    """The package set last sent for a prefix in the ``delta`` format."""
+
+    #: Stamp of the prefix and the channel configuration when the packages were read
+    stamp: tuple[int | str, ...]
+    fingerprint: str
+    packages: tuple[str, ...]
+
+
+def load_packages_snapshot(prefix: str) -> PackagesSnapshot | None:
+    """Return the package set last sent for ``prefix``, if there is one."""
+    if (value := HeaderCache("snapshots").get(prefix, ())) is None:
+        return None
+    try:
+        entry = json.loads(value)
+        return PackagesSnapshot(
+            tuple(entry["stamp"]),
+            str(entry["fingerprint"]),
+            tuple(entry["packages"]),
+        )
+    except (ValueError, KeyError, TypeError) as exc:
+        logger.debug("Ignoring invalid packages snapshot", exc_info=exc)
+        return None
+
+
+def save_packages_snapshot(prefix: str, snapshot: PackagesSnapshot) -> None:
+    """Store the package set sent for ``prefix``, replacing the previous one."""
+    HeaderCache("snapshots").set(prefix, (), json.dumps(snapshot._asdict()))
+
+
+def get_packages_delta(prefix: str, stamp: tuple[int | str, ...] | None) -> str:
+    """Return the packages of ``prefix`` relative to the package set sent last.
+
+    The package set sent last is kept on disk per prefix. While the prefix is
+    unchanged, the value only carries its fingerprint without reading the prefix;
+    otherwise only the packages added and removed since then are sent. Without a
+    previous package set, all packages are sent and start a new chain.
+
+    The package set is only kept once the value was sent as it is (see
+    ``save_sent_snapshots``). If the changes don't fit into the guaranteed share of
+    the packages header, the value carries the fingerprint of the package set it
+    describes and ends with ``TRUNCATION_MARKER`` (see ``truncate_delta``). That
+    package set becomes the base and the following values send the rest.
+    """
+    snapshot = load_packages_snapshot(prefix)
+    if snapshot is not None and snapshot.stamp == stamp:
+        return encode_delta(snapshot.fingerprint, snapshot.fingerprint)
+
+    packages, fingerprint = get_inventory().state()
+    base, base_packages = ("", ()) if snapshot is None else snapshot[1:]
+    added, removed = diff_packages(base_packages, packages)
+    # values cut while packing can't become a base, so they have to fit into the
+    # guaranteed share like compressed values
+    value = encode_delta(fingerprint, base, added, removed, PACKAGES_SIZE_LIMIT)
+    if value.endswith(TRUNCATION_MARKER):
+        value, packages = truncate_delta(value, base_packages)
+        fingerprint = decode_delta(value).fingerprint
+        if stamp is not None:
+            # the rest of the changes is due even while the prefix is unchanged
+            stamp = ()
+    if stamp is not None:
+        PENDING_SNAPSHOTS[collection.scope(), value] = (
+            prefix,
+            PackagesSnapshot(stamp, fingerprint, packages),
+        )
+    return value
+
+
+def save_sent_snapshots(headers: Iterable[CondaRequestHeader]) -> None:
+    """Keep the package set of the ``delta`` value in ``headers`` as the next base.
+
+    Values truncated while packing the headers differ from the collected ones and
+    are skipped.
+    """
+    scope = collection.scope()
+    for header in headers:
+        if header.name == HEADER_PACKAGES and (
+            pending := PENDING_SNAPSHOTS.pop((scope, header.value), None)
+        ):
+            save_packages_snapshot(*pending)
 
 
 class HeaderWrapper(typing.NamedTuple):
-    """Object that wraps ``CondaRequestHeader`` and adds a ``size_limit`` field."""
+    """Object that wraps ``CondaRequestHeader`` and adds packing fields.
+
+    See ``packing.Candidate`` for the meaning of ``size_limit`` and ``priority``.
+    """
 
     header: CondaRequestHeader
     size_limit: int
+    priority: int = 0
 
 
 def validate_headers(
     header_wrappers: Sequence[HeaderWrapper],
+    size_limit: int = SIZE_LIMIT,
 ) -> Iterator[CondaRequestHeader]:
-    """Make sure that all headers combined are not larger than ``SIZE_LIMIT``.
+    """Make sure that all headers combined are not larger than ``size_limit``.
 
-    Any headers over their individual limits will be truncated.
+    Each header is guaranteed its own limit; budget left unused by smaller
+    headers is handed to larger ones in order of priority. Headers that still
+    don't fit are truncated at a field boundary and end with ``TRUNCATION_MARKER``.
+    The wrapped headers are left untouched and new ``CondaRequestHeader`` objects
+    are returned.
     """
-    for wrapper in header_wrappers:
-        wrapper.header.value = wrapper.header.value[: wrapper.size_limit]
-        yield wrapper.header
+    candidates = [
+        Candidate(wrapper.header.value, wrapper.size_limit, wrapper.priority)
+        for wrapper in header_wrappers
+    ]
+    if tracer.enabled:
+        with tracer.span("validate_headers") as span:
+            packed_headers = pack(candidates, size_limit)
+            span.set_attribute(
+                ATTRIBUTE_BYTES, sum(len(packed.value) for packed in packed_headers)
+            )
+            span.set_attribute(
+                ATTRIBUTE_TRUNCATED_BYTES,
+                sum(packed.truncated_bytes for packed in packed_headers),
+            )
+    else:
+        packed_headers = pack(candidates, size_limit)
+    for wrapper, packed in zip(header_wrappers, packed_headers):
+        if metrics.enabled and packed.truncated_bytes:
+            metrics.record_truncation(
+                wrapper.header.name, packed.truncated_bytes, packed.truncated_fields
+            )
+        yield CondaRequestHeader(name=wrapper.header.name, value=packed.value)
 
 
-def _conda_request_headers() -> Sequence[HeaderWrapper]:
-    custom_headers = [
-        HeaderWrapper(
-            header=CondaRequestHeader(
-                name=HEADER_SYS_INFO,
-                value=get_sys_info_header_value(),
-            ),
-            size_limit=500,
-        ),
-        HeaderWrapper(
-            header=CondaRequestHeader(
-                name=HEADER_CHANNELS,
-                value=get_channel_urls_header_value(),
-            ),
-            size_limit=500,
-        ),
-        HeaderWrapper(
-            header=CondaRequestHeader(
-                name=HEADER_VIRTUAL_PACKAGES,
-                value=get_virtual_packages_header_value(),
+def get_collector_timeouts() -> dict[str, float]:
+    """Return the deadline in seconds of each header's collector.
+
+    The ``anaconda_telemetry_timeouts`` setting maps header names without the
+    ``anaconda-telemetry-`` prefix (e.g. ``packages``) to seconds, ``0`` disables
+    the deadline of a header.
+    """
+    timeouts = dict(COLLECTOR_TIMEOUTS)
+    for name, timeout in (context.plugins.anaconda_telemetry_timeouts or {}).items():
+        timeouts[f"{HEADER_PREFIX}-{name}"] = float(timeout)
+    return timeouts
+
+
+class CollectorRun:
+    """A collector running on one of the collector threads."""
+
+    __slots__ = ("done", "error", "value")
+
+    def __init__(self) -> None:
+        """Create a run that isn't done yet."""
+        self.done = threading.Event()
+        self.value: str | None = None
+        self.error: Exception | None = None
+
+    def run(self, func: Callable[[], str]) -> None:
+        """Call the collector ``func`` and keep its value or error."""
+        try:
+            self.value = func()
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.done.set()
+
+
+def start_collectors(
+    collectors: Sequence[tuple[str, Callable[[], str]]],
+    workers: int | None = None,
+) -> dict[str, CollectorRun]:
+    """Start the ``collectors`` of each header name on up to ``workers`` threads.
+
+    ``workers`` defaults to ``COLLECTOR_WORKERS``. The threads are daemon threads,
+    so collectors that hang (e.g. on a network filesystem) don't keep conda from
+    exiting, and they keep the collection session of the caller.
+    """
+    runs = {name: CollectorRun() for name, _ in collectors}
+    jobs: queue.SimpleQueue[tuple[Callable[[], str], CollectorRun]] = (
+        queue.SimpleQueue()
+    )
+    for name, func in collectors:
+        jobs.put((func, runs[name]))
+
+    def work() -> None:
+        while True:
+            try:
+                func, run = jobs.get_nowait()
+            except queue.Empty:
+                return
+            run.run(func)
+
+    for _ in range(min(workers or COLLECTOR_WORKERS, len(runs))):
+        # a context can only be entered by one thread at a time
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(work,),
+            name=COLLECTOR_THREAD_NAME,
+            daemon=True,
+        ).start()
+    return runs
+
+
+def wait_for_collector(name: str, run: CollectorRun, timeout: float | None) -> str:
+    """Return the value of header ``name`` once its collector is done.
+
+    If the collector isn't done within ``timeout`` seconds, ``TIMEOUT_MARKER`` is
+    returned, the timeout is recorded and the collector keeps running; once it is
+    done, ``get_request_header_bundle`` collects the headers again with its cached
+    value. Errors of the collector are raised.
+    """
+    if not run.done.wait(timeout):
+        logger.debug("Collecting %s took longer than %s seconds", name, timeout)
+        if metrics.enabled:
+            metrics.record_timeout(name)
+        LATE_COLLECTORS[collection.scope(), name] = run.done
+        return TIMEOUT_MARKER
+    if run.error is not None:
+        raise run.error
+    LATE_COLLECTORS.pop((collection.scope(), name), None)
+    return typing.cast("str", run.value)
+
+
+def collect_headers(
+    collectors: Sequence[tuple[str, CachedFunction[str]]],
+    timeouts: Mapping[str, float],
+) -> dict[str, str]:
+    """Return the values of the headers of ``collectors``, by header name.
+
+    Collectors of values that aren't cached yet are started at once on a small pool
+    of threads (see ``start_collectors``), so the first request waits for the
+    slowest collector instead of the sum of all of them. Deadlines count from that
+    start. A collector that fails only loses its own header: the error is logged
+    and recorded, and the values of the other collectors are returned. While
+    profiling, the collectors are run one after the other on the calling thread.
+    """
+    values = {}
+    cold = []
+    for name, func in collectors:
+        if profiler.enabled or func.cache_get() is not None:
+            try:
+                values[name] = func()
+            except Exception as exc:
+                record_collector_error(name, exc)
+            else:
+                LATE_COLLECTORS.pop((collection.scope(), name), None)
+        else:
+            cold.append((name, func))
+    if not cold:
+        return values
+
+    started = time.monotonic()
+    for name, run in start_collectors(cold).items():
+        timeout = timeouts.get(name, 0)
+        try:
+            values[name] = wait_for_collector(
+                name,
+                run,
+                max(started + timeout - time.monotonic(), 0) if timeout > 0 else None,
+            )
+        except Exception as exc:
+            record_collector_error(name, exc)
+    return values
+
+
+def record_collector_error(name: str, exc: Exception) -> None:
+    """Log and count that the collector of header ``name`` failed with ``exc``."""
+    logger.debug("Failed to collect %s", name, exc_info=exc)
+    if metrics.enabled:
+        metrics.record_error(name)
+
+
+class CollectionPlan(typing.NamedTuple):
+    """The base headers collected for a command."""
+
+    headers: frozenset[str]
+
+
+def get_collection_plan(command: str) -> CollectionPlan:
+    """Return the plan of the base headers collected for ``command``.
+
+    The ``anaconda_telemetry_collectors`` setting maps commands, or ``*`` for every
+    command without its own entry, to the header names to collect without the
+    ``anaconda-telemetry-`` prefix (e.g. ``[sys-info, channels]``) and replaces
+    ``COLLECTION_PLANS``.
+    """
+    overrides = context.plugins.anaconda_telemetry_collectors or {}
+    names = overrides.get(command, overrides.get("*"))
+    if names is None:
+        headers = COLLECTION_PLANS.get(command, BASE_HEADERS)
+    else:
+        headers = frozenset(f"{HEADER_PREFIX}-{name}" for name in names)
+        if unknown := headers - BASE_HEADERS:
+            logger.debug("Ignoring unknown headers: %s", ", ".join(sorted(unknown)))
+        headers &= BASE_HEADERS
+    return CollectionPlan(headers=headers)
+
+
+@timer
+def _conda_request_headers(command: str | None = None) -> Sequence[HeaderWrapper]:
+    if command is None:
+        command = get_conda_command()
+    configure_collection()
+    plan = get_collection_plan(command)
+    timeouts = get_collector_timeouts()
+    collectors = [
+        (name, collector, size_limit, priority)
+        for name, collector, size_limit, priority in (
+            (HEADER_SYS_INFO, get_sys_info_header_value, 500, 0),
+            (HEADER_CHANNELS, get_channel_urls_header_value, 500, 4),
+            (HEADER_VIRTUAL_PACKAGES, get_virtual_packages_header_value, 500, 2),
+            (
+                HEADER_PACKAGES,
+                get_installed_packages_header_value,
+                PACKAGES_SIZE_LIMIT,
+                3,
             ),
-            size_limit=500,
-        ),
+        )
+        if name in plan.headers
+    ]
+    values = collect_headers(
+        [(name, collector) for name, collector, _, _ in collectors], timeouts
+    )
+    custom_headers = [
         HeaderWrapper(
-            header=CondaRequestHeader(
-                name=HEADER_PACKAGES,
-                value=get_installed_packages_header_value(),
-            ),
-            size_limit=5_000,
-        ),
+            header=CondaRequestHeader(name=name, value=values[name]),
+            size_limit=size_limit,
+            priority=priority,
+        )
+        for name, _, size_limit, priority in collectors
+        if name in values
     ]
 
-    command = get_conda_command()
+    custom_headers.extend(_command_request_headers(command))
+
+    return custom_headers
 
+
+def _command_request_headers(command: str) -> list[HeaderWrapper]:
+    """Return the headers specific to ``command``, taken from its arguments."""
     if command == "search":
-        custom_headers.append(
+        return [
             HeaderWrapper(
                 header=CondaRequestHeader(
                     name=HEADER_SEARCH,
                     value=get_search_term(),
                 ),
                 size_limit=500,
+                priority=1,
             )
-        )
+        ]
 
     elif command in {"install", "create"}:
-        custom_headers.append(
+        return [
             HeaderWrapper(
                 header=CondaRequestHeader(
                     name=HEADER_INSTALL,
                     value=get_install_arguments_header_value(),
                 ),
                 size_limit=500,
+                priority=1,
             )
-        )
+        ]
 
-    return custom_headers
+    return []
+
+
+@collection.cached
+def get_header_bundle(command: str) -> tuple[CondaRequestHeader, ...]:
+    """Return the final, size-validated headers sent for ``command``.
+
+    The bundle is computed once per command, even if conda requests it from several
+    threads at once, and the same tuple is returned on every following request.
+    Failures are not cached, so collection is retried on the next request.
+    """
+    if profiler.enabled:
+        with profiler.profile(command):
+            return tuple(validate_headers(_conda_request_headers(command)))
+    return tuple(validate_headers(_conda_request_headers(command)))
+
+
+@collection.cached
+def get_reduced_header_bundle(command: str) -> tuple[CondaRequestHeader, ...]:
+    """Return the headers sent while the full bundle is still being collected.
+
+    Only the headers taken from the command line arguments are included, they
+    don't need to inspect the environment or the configuration.
+    """
+    return tuple(validate_headers(_command_request_headers(command)))
+
+
+class Prefetch:
+    """The collection of a command's headers running in the background."""
+
+    __slots__ = ("deadline", "done")
+
+    def __init__(self) -> None:
+        """Start waiting for a collection that isn't done yet."""
+        #: Set once the collection is done, whether it succeeded or not
+        self.done = threading.Event()
+        #: When requests stop waiting for the collection, set by the first request
+        self.deadline: float | None = None
+
+    def ready(self) -> bool:
+        """Return whether the collection is done, waiting until the deadline.
+
+        The first request sets the deadline ``PREFETCH_TIMEOUT`` seconds ahead;
+        requests made after it passed return right away.
+        """
+        if self.done.is_set():
+            return True
+        if self.deadline is None:
+            self.deadline = time.monotonic() + PREFETCH_TIMEOUT
+        return self.done.wait(max(self.deadline - time.monotonic(), 0))
+
+
+def start_prefetch(command: str) -> threading.Event:
+    """Start collecting the header bundle for ``command`` in a background thread.
+
+    The returned event is set once collection is done, whether it succeeded or
+    not. Requests made before then wait at most until the deadline of the
+    ``Prefetch``.
+    """
+    prefetch = Prefetch()
+    key = (collection.scope(), command)
+    if (started := PREFETCHES.setdefault(key, prefetch)) is not prefetch:
+        return started.done
+    done = prefetch.done
+
+    def collect() -> None:
+        try:
+            get_header_bundle(command)
+        except Exception as exc:
+            logger.debug("Failed to prefetch telemetry data", exc_info=exc)
+        finally:
+            done.set()
+
+    # a daemon thread never delays the exit of conda
+    threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(collect,),
+        name=PREFETCH_THREAD_NAME,
+        daemon=True,
+    ).start()
+    return done
+
+
+def refresh_late_headers() -> None:
+    """Collect the headers again once a collector that missed its deadline is done.
+
+    Only the headers of the current collection scope are collected again.
+    """
+    scope = collection.scope()
+    if any(
+        done.is_set()
+        for (late_scope, _), done in list(LATE_COLLECTORS.items())
+        if late_scope == scope
+    ):
+        collection.discard(get_header_bundle)
+
+
+def classify_request(path: str) -> str:
+    """Return the class of a request for ``path``: repodata, artifact or other.
+
+    Only the end of the path is compared with a fixed set of suffixes, so the cost
+    doesn't depend on the length of the path.
+    """
+    if path.endswith(ARTIFACT_SUFFIXES):
+        return REQUEST_ARTIFACT
+    if path.endswith(REPODATA_SUFFIXES):
+        return REQUEST_REPODATA
+    return REQUEST_OTHER
 
 
-def should_submit_request_headers(host: str, path: str) -> bool:
-    """Return whether we should submit request headers to the given host and path."""
-    return REQUEST_HEADER_PATTERN.match(f"{host}{path}") is not None
+def get_profile_bundle(
+    bundle: tuple[CondaRequestHeader, ...], command: str, request_class: str
+) -> tuple[CondaRequestHeader, ...]:
+    """Return the headers of ``bundle`` in the profile of ``request_class``.
+
+    Each bundle is reduced once per request class; the following requests get the
+    same tuple from ``PROFILE_BUNDLES``.
+    """
+    if (names := REQUEST_PROFILES.get(request_class)) is None:
+        return bundle
+    key = (collection.scope(), command, request_class)
+    cached = PROFILE_BUNDLES.get(key)
+    if cached is not None and cached[0] is bundle:
+        return cached[1]
+    profile = tuple(header for header in bundle if header.name in names)
+    PROFILE_BUNDLES[key] = (bundle, profile)
+    return profile
+
+
+def get_request_header_bundle(
+    command: str, request_class: str = REQUEST_REPODATA
+) -> tuple[CondaRequestHeader, ...]:
+    """Return the headers for a request, without waiting long for a prefetch."""
+    if LATE_COLLECTORS:
+        refresh_late_headers()
+    prefetch = PREFETCHES.get((collection.scope(), command))
+    if prefetch is not None and not prefetch.ready():
+        logger.debug("Telemetry data not ready, sending reduced headers")
+        bundle = get_reduced_header_bundle(command)
+    else:
+        bundle = get_header_bundle(command)
+    return get_profile_bundle(bundle, command, request_class)
+
+
+def claim_session_host(host: str) -> bool:
+    """Return whether ``host`` has yet to receive the full headers in this session.
+
+    Only the first caller for each host and collection scope gets ``True``, even if
+    several threads ask at the same time. Hosts that already received the headers
+    are found with a single set lookup, without taking the lock.
+    """
+    key = (collection.scope(), host)
+    if key in SESSION_HOSTS:
+        return False
+    with SESSION_HOSTS_LOCK:
+        if key in SESSION_HOSTS:
+            return False
+        SESSION_HOSTS.add(key)
+        return True
+
+
+def get_session_header_bundle(
+    host: str, command: str, request_class: str = REQUEST_REPODATA
+) -> tuple[CondaRequestHeader, ...]:
+    """Return the full headers for the first request to ``host``, then only the session.
+
+    If the first request only gets the reduced headers because the collection isn't
+    done yet, the full headers are sent with one of the following requests instead.
+    Requests whose class doesn't send all headers never count as the first request.
+    """
+    key = (collection.scope(), host)
+    if key in SESSION_HOSTS:
+        return (SESSION_HEADER,)
+    if REQUEST_PROFILES.get(request_class) is not None:
+        return (*get_request_header_bundle(command, request_class), SESSION_HEADER)
+    if not claim_session_host(host):
+        return (SESSION_HEADER,)
+    try:
+        headers = get_request_header_bundle(command, request_class)
+    except Exception:
+        SESSION_HOSTS.discard(key)
+        raise
+    if headers is not get_header_bundle.cache_get(command) or any(
+        late_scope == key[0] for late_scope, _ in list(LATE_COLLECTORS)
+    ):
+        # send the complete headers with one of the following requests
+        SESSION_HOSTS.discard(key)
+    return (*headers, SESSION_HEADER)
+
+
+@functools.lru_cache(32)
+def get_request_header_rules(entries: Sequence[str] = ()) -> dict[str, tuple[str, ...]]:
+    """Map each host that receives request headers to the allowed path prefixes.
+
+    ``entries`` are the values of the ``anaconda_telemetry_hosts`` setting, either
+    a plain host (any path is allowed) or a host followed by a channel name
+    (e.g. ``mirror.example.com/conda-forge``). The mapping is computed once per
+    value of the setting, so deciding on a host is a single dictionary lookup.
+    """
+    rules: dict[str, set[str]] = {host: {"/"} for host in REQUEST_HEADER_HOSTS}
+    for host, channels in REQUEST_HEADER_CHANNELS.items():
+        rules.setdefault(host, set()).update(f"/{channel}/" for channel in channels)
+    for entry in entries:
+        # tolerate URLs, e.g. https://mirror.example.com/conda-forge
+        _, _, entry = entry.strip().rpartition("://")
+        host, _, channel = entry.strip("/").partition("/")
+        if host:
+            channel = channel.strip("/")
+            rules.setdefault(host, set()).add(f"/{channel}/" if channel else "/")
+    return {
+        # a host allowed for any path doesn't need its channel prefixes
+        host: ("/",) if "/" in prefixes else tuple(sorted(prefixes))
+        for host, prefixes in rules.items()
+    }
+
+
+def should_submit_request_headers(
+    host: str, path: str, allowed_hosts: Sequence[str] | None = None
+) -> bool:
+    """Return whether we should submit request headers to the given host and path.
+
+    ``allowed_hosts`` defaults to the ``anaconda_telemetry_hosts`` setting.
+    """
+    if allowed_hosts is None:
+        allowed_hosts = context.plugins.anaconda_telemetry_hosts
+    prefixes = get_request_header_rules(tuple(allowed_hosts)).get(host)
+    # an empty path is the root path, e.g. https://repo.anaconda.com
+    return prefixes is not None and (path or "/").startswith(prefixes)
+
+
+# report the hit rates of the caches that aren't wrapped by ``timer``
+for _cached in (
+    get_channel_name,
+    get_header_bundle,
+    get_reduced_header_bundle,
+    get_request_header_rules,
+):
+    metrics.register_cache(_cached.__name__, _cached)
 
 
 @hookimpl
-def conda_request_headers(host: str, path: str) -> Iterator[CondaRequestHeader]:
+def conda_request_headers(host: str, path: str) -> Iterable[CondaRequestHeader]:
     """Return a list of custom headers to be included in the request."""
+    if tracer.enabled:
+        return trace_request_headers(host, path)
+    return get_headers_for_request(host, path)
+
+
+def get_headers_for_request(host: str, path: str) -> Iterable[CondaRequestHeader]:
+    """Return the headers for a request to ``host`` and ``path``, never raising."""
     try:
-        if context.plugins.anaconda_telemetry and should_submit_request_headers(
-            host, path
+        plugins = context.plugins
+        if plugins.anaconda_telemetry and should_submit_request_headers(
+            host, path, plugins.anaconda_telemetry_hosts
         ):
-            yield from validate_headers(_conda_request_headers())
+            request_class = classify_request(path)
+            if plugins.anaconda_telemetry_send_once:
+                headers = get_session_header_bundle(
+                    host, get_conda_command(), request_class
+                )
+            else:
+                headers = get_request_header_bundle(get_conda_command(), request_class)
+            if PENDING_SNAPSHOTS:
+                save_sent_snapshots(headers)
+            return headers
     except Exception as exc:
         logger.debug("Failed to collect telemetry data", exc_info=exc)
+    return ()
+
+
+def trace_request_headers(host: str, path: str) -> Iterable[CondaRequestHeader]:
+    """Return the headers of ``conda_request_headers`` and record them in a span."""
+    with tracer.span(
+        "conda_request_headers",
+        **{
+            "server.address": host,
+            "url.path": path,
+            "anaconda_telemetry.request_class": classify_request(path),
+        },
+    ) as span:
+        span.set_attribute(
+            ATTRIBUTE_CACHE_HIT,
+            get_header_bundle.cache_get(get_conda_command()) is not None,
+        )
+        headers = tuple(get_headers_for_request(host, path))
+        span.set_attribute(
+            ATTRIBUTE_BYTES,
+            sum(len(header.name) + len(header.value) for header in headers),
+        )
+    return headers
+
+
+def prefetch_headers(command: str) -> None:  # noqa: ARG001
+    """Start collecting the headers as soon as a command that needs them starts."""
+    try:
+        if context.plugins.anaconda_telemetry:
+            # key on the parsed command like ``conda_request_headers`` does
+            start_prefetch(get_conda_command())
+    except Exception as exc:
+        logger.debug("Failed to start prefetching telemetry data", exc_info=exc)
+
+
+@hookimpl
+def conda_pre_commands() -> Iterator[CondaPreCommand]:
+    """Return the pre-command that collects the headers in the background."""
+    yield CondaPreCommand(
+        name="anaconda-telemetry-prefetch",
+        action=prefetch_headers,
+        run_for=set(PREFETCH_COMMANDS),
+    )
 
 
 @hookimpl
@@ -287,3 +1388,102 @@ def conda_settings() -> Iterator[CondaSetting]:
         description="Whether Anaconda Telemetry is enabled",
         parameter=PrimitiveParameter(True, element_type=bool),
     )
+    yield CondaSetting(
+        name="anaconda_telemetry_hosts",
+        description=(
+            "Additional hosts that Anaconda Telemetry headers are sent to; use "
+            "<host>/<channel> to only send them for a single channel on that host"
+        ),
+        parameter=SequenceParameter(PrimitiveParameter("", element_type=str)),
+    )
+    yield CondaSetting(
+        name="anaconda_telemetry_send_once",
+        description=(
+            "Whether Anaconda Telemetry headers are only sent with the first request "
+            "to each host, later requests only carry a session identifier"
+        ),
+        parameter=PrimitiveParameter(False, element_type=bool),
+    )
+    yield CondaSetting(
+        name="anaconda_telemetry_timeouts",
+        description=(
+            "Seconds each Anaconda Telemetry header may take to collect before it "
+            "is sent as <timeout>, by header name (e.g. packages: 5); 0 disables "
+            "the deadline"
+        ),
+        parameter=MapParameter(PrimitiveParameter(0.0, element_type=float)),
+    )
+    yield CondaSetting(
+        name="anaconda_telemetry_collectors",
+        description=(
+            "Anaconda Telemetry headers collected per command (or * for all other "
+            "commands), e.g. install: [sys-info, channels, virtual-packages]; "
+            "replaces the defaults of those commands"
+        ),
+        parameter=MapParameter(
+            SequenceParameter(PrimitiveParameter("", element_type=str))
+        ),
+    )
+    yield CondaSetting(
+        name="anaconda_telemetry_virtual_packages_ttl",
+        description=(
+            "Seconds the detected virtual packages are cached for on this host; "
+            "0 disables the cache"
+        ),
+        parameter=PrimitiveParameter(86_400, element_type=int),
+    )
+    yield CondaSetting(
+        name="anaconda_telemetry_detect_virtual_packages",
+        description=(
+            "Whether virtual packages are detected for Anaconda Telemetry when they "
+            "aren't cached; if disabled, the virtual packages header is left empty"
+        ),
+        parameter=PrimitiveParameter(True, element_type=bool),
+    )
+    yield CondaSetting(
+        name="anaconda_telemetry_packages_format",
+        description=(
+            "Wire format of the Anaconda Telemetry packages header: plain, grouped "
+            "(packages grouped by channel), compressed (grouped, zlib and base64) "
+            "or delta (only the changes since the packages were last sent)"
+        ),
+        parameter=PrimitiveParameter("plain", element_type=str),
+    )
+    yield CondaSetting(
+        name="anaconda_telemetry_cache_max_bytes",
+        description=(
+            "Bytes of memory the Anaconda Telemetry header values cached in a "
+            "process may take up, across all prefixes"
+        ),
+        parameter=PrimitiveParameter(DEFAULT_MAX_BYTES, element_type=int),
+    )
+    yield CondaSetting(
+        name="anaconda_telemetry_cache_ttl",
+        description=(
+            "Seconds the Anaconda Telemetry header values are cached for in a "
+            "process; 0 keeps them until they are evicted"
+        ),
+        parameter=PrimitiveParameter(0.0, element_type=float),
+    )
+
+
+@hookimpl
+def conda_subcommands() -> Iterator[CondaSubcommand]:
+    """Return the ``conda telemetry`` subcommand."""
+    yield CondaSubcommand(
+        name="telemetry",
+        summary="Inspect the Anaconda Telemetry plugin",
+        action=cli.execute,
+        configure_parser=cli.configure_parser,
+    )
+
+
+@hookimpl
+def conda_post_transaction_actions() -> Iterator[CondaPostTransactionAction]:
+    """Return the action that keeps the package inventory up to date."""
+    from .actions import UpdateInventoryAction
+
+    yield CondaPostTransactionAction(
+        name="anaconda-telemetry-update-inventory",
+        action=UpdateInventoryAction,
+    )
@@ -0,0 +1,49 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Base class of the opt-in instruments that observe the header collection.
+
+The metrics, profiler and tracer of a process are each an ``Instrument``. They are
+disabled unless their environment variable is set, and the collection only checks
+``enabled`` before handing them any work. What they recorded is written once, when
+the process exits.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import ClassVar
+
+
+class Instrument:
+    """Records data about the header collection and writes it at exit."""
+
+    #: Environment variable that enables the instrument of the current process
+    env_var: ClassVar[str]
+
+    def __init__(self) -> None:
+        """Create a disabled instrument."""
+        #: A plain attribute, so the collection can check it on every call
+        self.enabled = False
+
+    def enable(self, *, dump_at_exit: bool = True) -> None:
+        """Start recording, optionally calling ``dump`` when the process exits."""
+        if not self.enabled and dump_at_exit:
+            atexit.register(self.dump)
+        self.enabled = True
+
+    def enable_from_environment(self) -> None:
+        """Enable the instrument if its environment variable is set."""
+        if os.environ.get(self.env_var):
+            self.enable()
+
+    def cancel_dump(self) -> None:
+        """Don't write what was recorded at exit."""
+        atexit.unregister(self.dump)
+
+    def dump(self) -> object:
+        """Write what was recorded so far."""
+        raise NotImplementedError
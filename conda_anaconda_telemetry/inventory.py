@@ -0,0 +1,92 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""In-memory inventory of the packages installed in a prefix.
+
+The inventory is read from ``conda-meta`` once per process and then kept up to
+date with the packages linked and unlinked by conda's transactions, so the
+packages header can be recomputed without scanning the prefix again.
+"""
+
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import TYPE_CHECKING
+
+from .encoding import (
+    CHANNEL_SEPARATOR,
+    FINGERPRINT_MODULUS,
+    fingerprint,
+    format_fingerprint,
+    package_digest,
+    package_name,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+
+def format_package(
+    channel: str, subdir: str, name: str, version: str, build: str
+) -> str:
+    """Return the canonical string of a package, like ``conda list --canonical``."""
+    if subdir:
+        channel = f"{channel}/{subdir}"
+    return f"{channel}{CHANNEL_SEPARATOR}{name}-{version}-{build}"
+
+
+class PackageInventory:
+    """Canonical strings of the packages installed in ``prefix``, sorted by name.
+
+    Updates only touch the changed packages: each one is located with a binary
+    search instead of rebuilding or re-sorting the whole inventory, and only its
+    digest is added to or subtracted from the fingerprint of the package set.
+    """
+
+    def __init__(self, prefix: str, packages: Iterable[str]) -> None:
+        """Create the inventory of ``prefix`` from canonical package strings."""
+        self.prefix = prefix
+        pairs = sorted((package_name(package), package) for package in packages)
+        self._names = [name for name, _ in pairs]
+        self._packages = [package for _, package in pairs]
+        self._fingerprint = fingerprint(self._packages)
+        self._lock = threading.Lock()
+
+    def packages(self) -> tuple[str, ...]:
+        """Return a snapshot of the canonical package strings."""
+        with self._lock:
+            return tuple(self._packages)
+
+    def fingerprint(self) -> str:
+        """Return the fingerprint of the package set (see ``encoding.fingerprint``)."""
+        with self._lock:
+            return format_fingerprint(self._fingerprint)
+
+    def state(self) -> tuple[tuple[str, ...], str]:
+        """Return a consistent snapshot of the packages and their fingerprint."""
+        with self._lock:
+            return tuple(self._packages), format_fingerprint(self._fingerprint)
+
+    def update(self, unlinked: Iterable[str] = (), linked: Iterable[str] = ()) -> None:
+        """Remove the ``unlinked`` package names, then add the ``linked`` packages.
+
+        A linked package replaces an installed package with the same name.
+        """
+        with self._lock:
+            for name in unlinked:
+                index = bisect_left(self._names, name)
+                if index < len(self._names) and self._names[index] == name:
+                    self._fingerprint -= package_digest(self._packages[index])
+                    del self._names[index]
+                    del self._packages[index]
+            for package in linked:
+                name = package_name(package)
+                index = bisect_left(self._names, name)
+                if index < len(self._names) and self._names[index] == name:
+                    self._fingerprint -= package_digest(self._packages[index])
+                    self._packages[index] = package
+                else:
+                    self._names.insert(index, name)
+                    self._packages.insert(index, package)
+                self._fingerprint += package_digest(package)
+            self._fingerprint %= FINGERPRINT_MODULUS
@@ -0,0 +1,184 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""In-process metrics about the cost of collecting the telemetry headers.
+
+With ``CONDA_ANACONDA_TELEMETRY_METRICS`` set, the ``timer`` decorator in
+``hooks.py`` records the duration of every call, next to the hit rates of the
+caches and the headers that were truncated, timed out or failed. The metrics of a
+command are written to ``metrics.json`` in the cache directory, where
+``conda telemetry stats`` reads them.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import random
+import threading
+from typing import TYPE_CHECKING
+
+from .cache import get_cache_dir
+from .instrument import Instrument
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+    from typing import Any, Final
+
+logger = logging.getLogger(__name__)
+
+#: Environment variable that enables collecting metrics
+METRICS_ENV_VAR: Final = "CONDA_ANACONDA_TELEMETRY_METRICS"
+
+#: Name of the file in the cache directory metrics are written to at exit
+METRICS_FILE_NAME: Final = "metrics.json"
+
+#: Maximum number of durations kept per timer to compute percentiles; beyond that,
+#: the samples are a uniform random sample of all calls
+MAX_SAMPLES: Final = 10_000
+
+#: Percentiles reported for every timer
+PERCENTILES: Final = (50, 90, 99)
+
+
+def get_metrics_path() -> Path:
+    """Return the file the metrics of the last command are written to."""
+    return get_cache_dir() / METRICS_FILE_NAME
+
+
+def percentile(samples: list[float], percent: int) -> float:
+    """Return the ``percent`` percentile of the sorted ``samples`` (nearest rank)."""
+    index = max(0, -(-len(samples) * percent // 100) - 1)
+    return samples[index]
+
+
+class Timing:
+    """Durations of all calls to a single function, in seconds.
+
+    Not thread-safe on its own; ``MetricsRegistry`` holds its lock while adding.
+    """
+
+    def __init__(self) -> None:
+        """Start without any calls."""
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.samples: list[float] = []
+
+    def add(self, duration: float) -> None:
+        """Record the ``duration`` of a single call.
+
+        The samples are a reservoir (Algorithm R), so the percentiles of a
+        long-running process describe all of its calls and not only the first ones.
+        """
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(duration)
+        elif (index := random.randrange(self.count)) < MAX_SAMPLES:  # noqa: S311
+            self.samples[index] = duration
+
+    def to_dict(self) -> dict[str, float]:
+        """Return the count, total, minimum, maximum and percentiles."""
+        samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            **{f"p{percent}": percentile(samples, percent) for percent in PERCENTILES},
+        }
+
+
+class MetricsRegistry(Instrument):
+    """Collects the timings, cache statistics and counters of one process."""
+
+    env_var = METRICS_ENV_VAR
+
+    def __init__(self) -> None:
+        """Create a disabled registry."""
+        super().__init__()
+        self.timings: dict[str, Timing] = {}
+        self.caches: dict[str, Callable] = {}
+        self.truncation: dict[str, dict[str, int]] = {}
+        self.timeouts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        #: Guards timings, truncation, timeout and error counts; conda sends
+        #: requests from many threads
+        self.lock = threading.Lock()
+
+    def reset(self) -> None:
+        """Forget everything recorded so far, keeping the registered caches."""
+        with self.lock:
+            self.timings.clear()
+            self.truncation.clear()
+            self.timeouts.clear()
+            self.errors.clear()
+
+    def register_cache(self, name: str, func: Callable) -> None:
+        """Report the hits and misses of the ``functools.lru_cache`` ``func``.
+
+        The statistics are read from ``func.cache_info()`` when a snapshot is
+        taken, so caches cost nothing while collecting.
+        """
+        self.caches[name] = func
+
+    def record_duration(self, name: str, duration: float) -> None:
+        """Record that a call to the function ``name`` took ``duration`` seconds."""
+        with self.lock:
+            if (timing := self.timings.get(name)) is None:
+                timing = self.timings[name] = Timing()
+            timing.add(duration)
+
+    def record_truncation(self, name: str, size: int, fields: int) -> None:
+        """Record that a header lost ``size`` bytes and ``fields`` fields."""
+        with self.lock:
+            truncation = self.truncation.setdefault(name, {"bytes": 0, "fields": 0})
+            truncation["bytes"] += size
+            truncation["fields"] += fields
+
+    def record_timeout(self, name: str) -> None:
+        """Record that the collector of header ``name`` missed its deadline."""
+        with self.lock:
+            self.timeouts[name] = self.timeouts.get(name, 0) + 1
+
+    def record_error(self, name: str) -> None:
+        """Record that the collector of header ``name`` failed."""
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return all metrics as a JSON serializable dictionary."""
+        caches = {}
+        for name, func in self.caches.items():
+            info = func.cache_info()  # type: ignore[attr-defined]
+            caches[name] = {"hits": info.hits, "misses": info.misses}
+        with self.lock:
+            timers = {name: t.to_dict() for name, t in sorted(self.timings.items())}
+            truncation = {name: dict(t) for name, t in self.truncation.items()}
+            timeouts = dict(self.timeouts)
+            errors = dict(self.errors)
+        return {
+            "timers": timers,
+            "caches": caches,
+            "truncation": truncation,
+            "timeouts": timeouts,
+            "errors": errors,
+        }
+
+    def dump(self, path: Path | None = None) -> None:
+        """Write the metrics to ``path`` (see ``get_metrics_path``) as JSON."""
+        path = path or get_metrics_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(self.snapshot(), indent=2))
+        except OSError as exc:
+            logger.debug("Failed to write metrics to %s", path, exc_info=exc)
+
+
+#: Metrics of the current process
+registry = MetricsRegistry()
+registry.enable_from_environment()
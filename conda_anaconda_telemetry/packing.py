@@ -0,0 +1,107 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Fit header values into a shared size budget.
+
+Every header has its own size limit, but the limits are only guaranteed shares of
+the overall budget. Whatever a header doesn't use of its share is passed on to
+the headers that need more room, in order of their priority. Values that still
+don't fit are cut at a field boundary and end with ``TRUNCATION_MARKER``, so
+receivers never see partial fields.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+from .encoding import FIELD_SEPARATOR, TRUNCATION_MARKER
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+
+class Candidate(NamedTuple):
+    """A header value competing for space in the budget."""
+
+    value: str
+    #: Guaranteed share of the budget
+    size_limit: int
+    #: Lower values are served first
+    priority: int = 0
+
+
+class Packed(NamedTuple):
+    """A header value after packing."""
+
+    value: str
+    #: Number of characters removed from the original value
+    truncated_bytes: int
+    #: Number of fields removed from the original value
+    truncated_fields: int
+
+
+def truncate_fields(value: str, size_limit: int) -> str:
+    """Cut ``value`` at the last field boundary that leaves room for the marker.
+
+    Runs in time proportional to ``size_limit``, independent of the size of
+    ``value``. If not even the first field fits, only the marker is returned.
+    """
+    if len(value) <= size_limit:
+        return value
+    if size_limit < len(TRUNCATION_MARKER):
+        return ""
+
+    # longest prefix that still leaves room for the separator and the marker
+    keep = size_limit - len(FIELD_SEPARATOR) - len(TRUNCATION_MARKER)
+    cut = value.rfind(FIELD_SEPARATOR, 0, max(keep, 0) + len(FIELD_SEPARATOR))
+    if cut <= 0:
+        return TRUNCATION_MARKER
+    return f"{value[:cut]}{FIELD_SEPARATOR}{TRUNCATION_MARKER}"
+
+
+def allocate(candidates: Sequence[Candidate], budget: int) -> list[int]:
+    """Return how much of ``budget`` each candidate may use.
+
+    Every candidate first receives up to its own size limit, then the remaining
+    budget is handed out to candidates that need more, both in order of priority.
+    """
+    order = sorted(range(len(candidates)), key=lambda index: candidates[index].priority)
+    allocations = [0] * len(candidates)
+
+    remaining = budget
+    for index in order:
+        candidate = candidates[index]
+        allocations[index] = min(len(candidate.value), candidate.size_limit, remaining)
+        remaining -= allocations[index]
+
+    for index in order:
+        if remaining <= 0:
+            break
+        extra = min(len(candidates[index].value) - allocations[index], remaining)
+        if extra > 0:
+            allocations[index] += extra
+            remaining -= extra
+
+    return allocations
+
+
+def pack(candidates: Sequence[Candidate], budget: int) -> list[Packed]:
+    """Fit the candidates into ``budget``, returning them in their original order."""
+    packed = []
+    for candidate, allocation in zip(candidates, allocate(candidates, budget)):
+        value = truncate_fields(candidate.value, allocation)
+        if value == candidate.value:
+            packed.append(Packed(value, 0, 0))
+            continue
+
+        kept = value.count(FIELD_SEPARATOR) + 1 if value else 0
+        if value.endswith(TRUNCATION_MARKER):
+            # the marker is not one of the original fields
+            kept -= 1
+        packed.append(
+            Packed(
+                value,
+                truncated_bytes=len(candidate.value) - len(value),
+                truncated_fields=candidate.value.count(FIELD_SEPARATOR) + 1 - kept,
+            )
+        )
+    return packed
@@ -0,0 +1,182 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Opt-in profiling of the header collection.
+
+``CONDA_ANACONDA_TELEMETRY_PROFILE`` selects the profilers as a comma separated
+list:
+
+``cprofile``
+    Function call statistics of ``cProfile``, written to ``<command>-<time>-<pid>.prof``
+    (open with ``python -m pstats`` or ``snakeviz``).
+
+``tracemalloc``
+    The peak memory and the largest allocation sites, written to
+    ``<command>-<time>-<pid>.tracemalloc.txt``.
+
+The collection of every command's headers (``_conda_request_headers``, all
+collectors and ``validate_headers``) is profiled and one file per command and
+profiler is written to the ``profiles`` directory in the cache directory, or to
+``CONDA_ANACONDA_TELEMETRY_PROFILE_DIR``, when the process exits. The profilers
+are only imported once they are selected.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .cache import get_cache_dir
+from .instrument import Instrument
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from cProfile import Profile
+    from typing import Final
+
+logger = logging.getLogger(__name__)
+
+#: Environment variable that enables profiling, e.g. ``cprofile,tracemalloc``
+PROFILE_ENV_VAR: Final = "CONDA_ANACONDA_TELEMETRY_PROFILE"
+
+#: Environment variable that overrides the directory profiles are written to
+PROFILE_DIR_ENV_VAR: Final = "CONDA_ANACONDA_TELEMETRY_PROFILE_DIR"
+
+#: Supported profilers
+PROFILERS: Final = frozenset({"cprofile", "tracemalloc"})
+
+#: Number of allocation sites listed in the ``tracemalloc`` report
+TOP_ALLOCATIONS: Final = 50
+
+
+def get_profile_dir() -> Path:
+    """Return the directory profiles are written to."""
+    if directory := os.environ.get(PROFILE_DIR_ENV_VAR):
+        return Path(directory)
+    return get_cache_dir() / "profiles"
+
+
+def parse_profilers(value: str) -> frozenset[str]:
+    """Return the supported profilers in the comma separated ``value``."""
+    names = {name.strip().lower() for name in value.split(",") if name.strip()}
+    if unknown := names - PROFILERS:
+        logger.debug("Ignoring unknown profilers: %s", ", ".join(sorted(unknown)))
+    return frozenset(names & PROFILERS)
+
+
+class Profiler(Instrument):
+    """Collects profiles of the header collection, per command."""
+
+    env_var = PROFILE_ENV_VAR
+
+    def __init__(self) -> None:
+        """Create a disabled profiler."""
+        super().__init__()
+        self.profilers: frozenset[str] = frozenset()
+        self.profiles: dict[str, Profile] = {}
+        self.allocations: dict[str, str] = {}
+        #: Only one collection is profiled at a time, ``cProfile`` can't be nested
+        self._lock = threading.Lock()
+        self._started = time.strftime("%Y%m%dT%H%M%S")
+
+    def enable(
+        self, profilers: Iterable[str] = PROFILERS, *, dump_at_exit: bool = True
+    ) -> None:
+        """Start profiling with the given ``profilers``, writing them at exit.
+
+        Without any supported profilers, profiling is disabled.
+        """
+        self.profilers = frozenset(profilers) & PROFILERS
+        if self.profilers:
+            super().enable(dump_at_exit=dump_at_exit)
+        else:
+            self.enabled = False
+
+    def enable_from_environment(self) -> None:
+        """Enable the profilers listed in the environment variable, if any."""
+        if value := os.environ.get(self.env_var):
+            self.enable(parse_profilers(value))
+
+    def reset(self) -> None:
+        """Forget all profiles collected so far."""
+        self.profiles.clear()
+        self.allocations.clear()
+
+    @contextlib.contextmanager
+    def profile(self, command: str) -> Iterator[None]:
+        """Profile the code in the block, adding to the profile of ``command``."""
+        if not self.enabled:
+            yield
+            return
+
+        with self._lock:
+            if "cprofile" in self.profilers:
+                from cProfile import Profile
+
+                profile = self.profiles.setdefault(command, Profile())
+            else:
+                profile = None
+            tracing = False
+            if "tracemalloc" in self.profilers:
+                import tracemalloc
+
+                if not (tracing := tracemalloc.is_tracing()):
+                    tracemalloc.start()
+                tracemalloc.reset_peak()
+
+            if profile is not None:
+                profile.enable()
+            try:
+                yield
+            finally:
+                if profile is not None:
+                    profile.disable()
+                if "tracemalloc" in self.profilers:
+                    self.allocations[command] = self._report_allocations()
+                    if not tracing:
+                        tracemalloc.stop()
+
+    def _report_allocations(self) -> str:
+        import tracemalloc
+
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        lines = [f"Peak memory: {peak} bytes", "", "Largest allocation sites:"]
+        lines.extend(
+            str(stat) for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+        )
+        return "\n".join(lines) + "\n"
+
+    def get_path(self, command: str, suffix: str) -> Path:
+        """Return the file the profile of ``command`` with ``suffix`` is written to."""
+        name = f"{command or 'conda'}-{self._started}-{os.getpid()}{suffix}"
+        return get_profile_dir() / name
+
+    def dump(self) -> list[Path]:
+        """Write all profiles to ``get_profile_dir`` and return their paths."""
+        paths = []
+        try:
+            for command, profile in self.profiles.items():
+                path = self.get_path(command, ".prof")
+                path.parent.mkdir(parents=True, exist_ok=True)
+                profile.dump_stats(path)
+                paths.append(path)
+            for command, report in self.allocations.items():
+                path = self.get_path(command, ".tracemalloc.txt")
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(report)
+                paths.append(path)
+        except OSError as exc:
+            logger.debug("Failed to write profiles", exc_info=exc)
+        return paths
+
+
+#: Profiler of the current process
+profiler = Profiler()
+profiler.enable_from_environment()
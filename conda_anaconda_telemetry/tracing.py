@@ -0,0 +1,227 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+"""Opt-in trace of the header collection in an OpenTelemetry compatible format.
+
+With ``CONDA_ANACONDA_TELEMETRY_TRACE`` set, every ``conda_request_headers`` call,
+every timed collector and the packing of the headers are recorded as spans: with
+their start and end time, the thread they ran on, whether the value was cached and
+how many bytes were produced and truncated.
+
+Spans are kept in memory and written when the process exits, or once ``MAX_SPANS``
+of them are waiting, as a single line appended to ``traces.jsonl`` in the cache
+directory (or the file in ``CONDA_ANACONDA_TELEMETRY_TRACE_FILE``). Every line is an
+OTLP/JSON ``ExportTraceServiceRequest``, like the lines written by the file exporter
+of the OpenTelemetry Collector, so the traces can be read by its ``otlpjsonfile``
+receiver or any other OTLP tooling.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import APP_NAME
+from .cache import get_cache_dir
+from .instrument import Instrument
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from typing import Any, Final
+
+logger = logging.getLogger(__name__)
+
+#: Environment variable that enables tracing
+TRACE_ENV_VAR: Final = "CONDA_ANACONDA_TELEMETRY_TRACE"
+
+#: Environment variable that overrides the file traces are appended to
+TRACE_FILE_ENV_VAR: Final = "CONDA_ANACONDA_TELEMETRY_TRACE_FILE"
+
+#: Name of the file in the cache directory traces are appended to
+TRACE_FILE_NAME: Final = "traces.jsonl"
+
+#: Number of spans kept in memory before they are appended to the trace file, so
+#: long-lived processes don't keep every span until they exit
+MAX_SPANS: Final = 10_000
+
+#: Span kind ``SPAN_KIND_INTERNAL`` of the OTLP protocol
+SPAN_KIND_INTERNAL: Final = 1
+
+#: Status code ``STATUS_CODE_ERROR`` of the OTLP protocol
+STATUS_CODE_ERROR: Final = 2
+
+#: Whether the value was taken from a cache
+ATTRIBUTE_CACHE_HIT: Final = "anaconda_telemetry.cache_hit"
+
+#: Number of bytes of the header values produced
+ATTRIBUTE_BYTES: Final = "anaconda_telemetry.bytes"
+
+#: Number of bytes removed from the header values to fit the size limit
+ATTRIBUTE_TRUNCATED_BYTES: Final = "anaconda_telemetry.truncated_bytes"
+
+
+def get_trace_path() -> Path:
+    """Return the file traces are appended to."""
+    if path := os.environ.get(TRACE_FILE_ENV_VAR):
+        return Path(path)
+    return get_cache_dir() / TRACE_FILE_NAME
+
+
+def encode_value(value: Any) -> dict[str, Any]:  # noqa: ANN401
+    """Return ``value`` as an OTLP/JSON ``AnyValue``."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # 64 bit integers are strings in OTLP/JSON
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [encode_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def encode_attributes(attributes: dict[str, Any]) -> list[dict[str, Any]]:
+    """Return ``attributes`` as a list of OTLP/JSON ``KeyValue``."""
+    return [
+        {"key": key, "value": encode_value(value)} for key, value in attributes.items()
+    ]
+
+
+class Span:
+    """A timed operation on a single thread."""
+
+    __slots__ = ("attributes", "end", "error", "name", "parent_id", "span_id", "start")
+
+    def __init__(self, name: str, parent_id: str, attributes: dict[str, Any]) -> None:
+        """Start the span ``name`` now, as a child of the span ``parent_id``."""
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error: str | None = None
+        self.start = time.time_ns()
+        self.end = self.start
+
+    def set_attribute(self, key: str, value: Any) -> None:  # noqa: ANN401
+        """Set the attribute ``key`` of the span."""
+        self.attributes[key] = value
+
+    def to_dict(self, trace_id: str) -> dict[str, Any]:
+        """Return the span as an OTLP/JSON ``Span`` of the trace ``trace_id``."""
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": encode_attributes(self.attributes),
+        }
+        if self.error is not None:
+            span["status"] = {"code": STATUS_CODE_ERROR, "message": self.error}
+        return span
+
+
+class Tracer(Instrument):
+    """Collects the spans of one process, all of them part of a single trace."""
+
+    env_var = TRACE_ENV_VAR
+
+    def __init__(self) -> None:
+        """Create a disabled tracer."""
+        super().__init__()
+        self.trace_id = os.urandom(16).hex()
+        self.spans: list[Span] = []
+        #: The open span of the current context, inherited by threads started with
+        #: a copy of the context (like the collector threads)
+        self._current: ContextVar[Span | None] = ContextVar(
+            f"anaconda_telemetry_span_{id(self)}", default=None
+        )
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:  # noqa: ANN401
+        """Record the code in the block as the span ``name``.
+
+        Spans started while another span is open in the same context are its
+        children, including spans on threads started with a copy of that context.
+        Exceptions are recorded as the status of the span.
+        """
+        parent = self._current.get()
+        thread = threading.current_thread()
+        attributes.update({"thread.id": thread.ident, "thread.name": thread.name})
+        span = Span(name, parent.span_id if parent is not None else "", attributes)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            span.end = time.time_ns()
+            self._current.reset(token)
+            with self._lock:
+                self.spans.append(span)
+                full = len(self.spans) >= MAX_SPANS
+            if full:
+                self.dump()
+
+    def to_dict(self, spans: list[Span] | None = None) -> dict[str, Any]:
+        """Return ``spans`` as an OTLP/JSON ``ExportTraceServiceRequest``.
+
+        Defaults to the spans that haven't been written yet.
+        """
+        from . import __version__
+
+        resource = {
+            "service.name": APP_NAME,
+            "service.version": __version__,
+            "process.pid": os.getpid(),
+        }
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": encode_attributes(resource)},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __package__, "version": __version__},
+                            "spans": [
+                                span.to_dict(self.trace_id)
+                                for span in (self.spans if spans is None else spans)
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def dump(self, path: Path | None = None) -> None:
+        """Append the spans to ``path`` (see ``get_trace_path``) as a single line.
+
+        The spans are removed from memory, even if they can't be written.
+        """
+        with self._lock:
+            spans, self.spans = self.spans, []
+        if not spans:
+            return
+        path = path or get_trace_path()
+        try:
+            line = json.dumps(self.to_dict(spans), separators=(",", ":"))
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("a") as fh:
+                fh.write(line + "\n")
+        except OSError as exc:
+            logger.debug("Failed to write trace to %s", path, exc_info=exc)
+
+
+#: Tracer of the current process
+tracer = Tracer()
+tracer.enable_from_environment()
@@ -0,0 +1,37 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+from conda.auxlib.collection import AttrDict
+
+from conda_anaconda_telemetry.metrics import MetricsRegistry, registry
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from pytest_mock import MockerFixture
+
+
+@pytest.fixture
+def metrics() -> Iterator[MetricsRegistry]:
+    """
+    Enables the metrics registry of the current process for a single test
+    """
+    registry.enable(dump_at_exit=False)
+    yield registry
+    registry.enabled = False
+    registry.reset()
+
+
+@pytest.fixture
+def install(mocker: MockerFixture) -> None:
+    """
+    Simulates running ``conda install package``
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        AttrDict(cmd="install", packages=["package"]),
+    )
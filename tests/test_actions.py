@@ -0,0 +1,188 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import pytest
+from conda.models.records import PackageRecord
+
+from conda_anaconda_telemetry import hooks
+from conda_anaconda_telemetry.actions import UpdateInventoryAction
+from conda_anaconda_telemetry.cache import CACHE_DIR_ENV_VAR
+from conda_anaconda_telemetry.hooks import (
+    conda_post_transaction_actions,
+    get_installed_packages_header_value,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+    from unittest.mock import MagicMock
+
+    from pytest import MonkeyPatch
+    from pytest_mock import MockerFixture
+
+TEST_PREFIX = "/opt/conda/envs/test"
+
+TEST_PACKAGES = (
+    "defaults/osx-arm64::libxml2-2.13.1-h0b34f26_2",
+    "defaults/osx-arm64::sqlite-3.45.3-h80987f9_0",
+)
+
+
+def make_record(
+    name: str, version: str, build: str = "0", channel: str = "defaults"
+) -> PackageRecord:
+    return PackageRecord(
+        name=name,
+        version=version,
+        build=build,
+        build_number=0,
+        channel=channel,
+        subdir="osx-arm64",
+    )
+
+
+def run_transaction(
+    prefix: str,
+    unlink_precs: tuple[PackageRecord, ...] = (),
+    link_precs: tuple[PackageRecord, ...] = (),
+) -> None:
+    action = UpdateInventoryAction({}, prefix, unlink_precs, link_precs, (), (), ())
+    action.verify()
+    action.execute()
+
+
+@pytest.fixture(autouse=True)
+def package_list(
+    mocker: MockerFixture, monkeypatch: MonkeyPatch, tmp_path: Path
+) -> Iterator[MagicMock]:
+    """
+    Simulates an environment with ``TEST_PACKAGES`` whose inventory was read and
+    whose headers were collected
+    """
+    monkeypatch.setenv(CACHE_DIR_ENV_VAR, str(tmp_path))
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=TEST_PREFIX)
+    package_list = mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list",
+        side_effect=lambda: iter(TEST_PACKAGES),
+    )
+    hooks.get_inventory.cache_clear()
+    get_installed_packages_header_value.cache_clear()
+    hooks.get_inventory()
+    assert get_installed_packages_header_value() == ";".join(TEST_PACKAGES)
+    yield package_list
+    hooks.get_inventory.cache_clear()
+    get_installed_packages_header_value.cache_clear()
+
+
+def test_conda_post_transaction_actions() -> None:
+    """
+    Ensure the inventory action is registered
+    """
+    (action,) = conda_post_transaction_actions()
+
+    assert action.action is UpdateInventoryAction
+
+
+def test_install(package_list: MagicMock) -> None:
+    """
+    Ensure installed packages show up without scanning the environment again
+    """
+    run_transaction(TEST_PREFIX, link_precs=(make_record("bzip2", "1.0.8"),))
+
+    assert get_installed_packages_header_value() == ";".join(
+        ("defaults/osx-arm64::bzip2-1.0.8-0", *TEST_PACKAGES)
+    )
+    assert package_list.call_count == 1
+
+
+def test_update(package_list: MagicMock) -> None:
+    """
+    Ensure updated packages replace the previous version
+    """
+    run_transaction(
+        TEST_PREFIX,
+        unlink_precs=(make_record("sqlite", "3.45.3", "h80987f9_0"),),
+        link_precs=(make_record("sqlite", "3.46.0", "h0", "conda-forge"),),
+    )
+
+    assert get_installed_packages_header_value() == ";".join(
+        (TEST_PACKAGES[0], "conda-forge/osx-arm64::sqlite-3.46.0-h0")
+    )
+    assert package_list.call_count == 1
+
+
+def test_remove(package_list: MagicMock) -> None:
+    """
+    Ensure removed packages disappear from the header
+    """
+    run_transaction(TEST_PREFIX, unlink_precs=(make_record("libxml2", "2.13.1"),))
+
+    assert get_installed_packages_header_value() == TEST_PACKAGES[1]
+    assert package_list.call_count == 1
+
+
+def test_other_prefix(package_list: MagicMock) -> None:
+    """
+    Ensure transactions in other environments don't change the header
+    """
+    run_transaction("/opt/conda/envs/other", link_precs=(make_record("bzip2", "1"),))
+
+    assert get_installed_packages_header_value() == ";".join(TEST_PACKAGES)
+    assert package_list.call_count == 1
+
+
+def test_collection_session(package_list: MagicMock) -> None:
+    """
+    Ensure the inventory of the transaction's collection session is updated, even
+    though conda executes the actions on other threads
+    """
+    with hooks.collection_session(TEST_PREFIX):
+        hooks.get_inventory()
+        action = UpdateInventoryAction(
+            {}, TEST_PREFIX, (), (make_record("bzip2", "1.0.8"),), (), (), ()
+        )
+        with ThreadPoolExecutor(1) as executor:
+            executor.submit(action.execute).result()
+
+        assert get_installed_packages_header_value() == ";".join(
+            ("defaults/osx-arm64::bzip2-1.0.8-0", *TEST_PACKAGES)
+        )
+    assert package_list.call_count == 2
+
+
+def test_errors_are_logged(
+    mocker: MockerFixture, caplog: pytest.LogCaptureFixture
+) -> None:
+    """
+    Ensure a failing inventory update doesn't fail the transaction
+    """
+    caplog.set_level(logging.DEBUG)
+    mocker.patch(
+        "conda_anaconda_telemetry.actions.update_inventory",
+        side_effect=Exception("Boom"),
+    )
+
+    run_transaction(TEST_PREFIX, link_precs=(make_record("bzip2", "1.0.8"),))
+
+    assert "Failed to update the package inventory" in caplog.text
+
+
+def test_inventory_not_read(package_list: MagicMock) -> None:
+    """
+    Ensure a header streamed from the environment is collected again after a
+    transaction if the inventory wasn't read
+    """
+    hooks.get_inventory.cache_clear()
+    get_installed_packages_header_value.cache_clear()
+    get_installed_packages_header_value()
+
+    run_transaction(TEST_PREFIX, link_precs=(make_record("bzip2", "1.0.8"),))
+    get_installed_packages_header_value()
+
+    assert hooks.get_inventory.cache_get() is None
+    assert package_list.call_count == 3
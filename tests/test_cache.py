@@ -0,0 +1,139 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import pytest
+
+from conda_anaconda_telemetry.cache import (
+    CACHE_DIR_ENV_VAR,
+    HeaderCache,
+    get_cache_dir,
+    get_prefix_stamp,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest import MonkeyPatch
+    from pytest_mock import MockerFixture
+
+
+@pytest.fixture
+def prefix(tmp_path: Path) -> Path:
+    """
+    Creates a minimal prefix with a ``conda-meta`` directory and history file
+    """
+    conda_meta = tmp_path / "env" / "conda-meta"
+    conda_meta.mkdir(parents=True)
+    (conda_meta / "history").write_text("==> 2024-01-01 00:00:00 <==\n")
+    return tmp_path / "env"
+
+
+def test_get_cache_dir_env_var(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
+    """
+    Ensure the cache directory can be overridden with an environment variable
+    """
+    monkeypatch.setenv(CACHE_DIR_ENV_VAR, str(tmp_path))
+    assert get_cache_dir() == tmp_path
+
+
+def test_get_prefix_stamp_missing_prefix(tmp_path: Path) -> None:
+    """
+    Ensure prefixes without ``conda-meta`` have no stamp and are never cached
+    """
+    assert get_prefix_stamp(tmp_path / "missing") is None
+
+
+def test_get_prefix_stamp_changes(prefix: Path) -> None:
+    """
+    Ensure the stamp changes when the history file or records change
+    """
+    stamp = get_prefix_stamp(prefix)
+    assert stamp is not None
+    assert get_prefix_stamp(prefix) == stamp
+
+    with (prefix / "conda-meta" / "history").open("a") as fh:
+        fh.write("+defaults/linux-64::python-3.12.0-h0_0\n")
+    assert get_prefix_stamp(prefix) != stamp
+
+    stamp = get_prefix_stamp(prefix)
+    record = prefix / "conda-meta" / "python-3.12.0-h0_0.json"
+    record.write_text("{}")
+    os.utime(prefix / "conda-meta", ns=(0, 0))
+    assert get_prefix_stamp(prefix) != stamp
+
+
+def test_header_cache_roundtrip(tmp_path: Path) -> None:
+    """
+    Ensure values are returned for matching stamps only
+    """
+    cache = HeaderCache("packages", tmp_path)
+    assert cache.get("/opt/conda", (1, 2, 3)) is None
+
+    cache.set("/opt/conda", (1, 2, 3), "a;b;c")
+    assert cache.get("/opt/conda", (1, 2, 3)) == "a;b;c"
+    assert cache.get("/opt/conda", (1, 2, 4)) is None
+    assert cache.get("/opt/other", (1, 2, 3)) is None
+    assert HeaderCache("channels", tmp_path).get("/opt/conda", (1, 2, 3)) is None
+
+
+@pytest.mark.parametrize(
+    "content",
+    ["", "not json", "[]", '{"version": 0}', '{"version": 1, "value": 1}'],
+)
+def test_header_cache_corrupt_entry(tmp_path: Path, content: str) -> None:
+    """
+    Ensure unreadable or malformed entries are treated as a cache miss
+    """
+    cache = HeaderCache("packages", tmp_path)
+    cache.set("/opt/conda", (1,), "value")
+    cache.path("/opt/conda").write_text(content)
+
+    assert cache.get("/opt/conda", (1,)) is None
+
+
+def test_header_cache_unwritable_directory(tmp_path: Path) -> None:
+    """
+    Ensure failing writes are ignored
+    """
+    (tmp_path / "packages").write_text("not a directory")
+    cache = HeaderCache("packages", tmp_path)
+
+    cache.set("/opt/conda", (1,), "value")
+    assert cache.get("/opt/conda", (1,)) is None
+
+
+def test_header_cache_concurrent_writers(tmp_path: Path) -> None:
+    """
+    Ensure concurrent writers never leave a partial entry or temporary files behind
+    """
+    cache = HeaderCache("packages", tmp_path)
+    values = [f"value-{index};" * 1_000 for index in range(16)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda value: cache.set("/opt/conda", (1,), value), values))
+
+    assert cache.get("/opt/conda", (1,)) in values
+    assert [path.name for path in cache.directory.iterdir()] == [
+        cache.path("/opt/conda").name
+    ]
+
+
+def test_header_cache_max_age(tmp_path: Path, mocker: MockerFixture) -> None:
+    """
+    Ensure entries older than ``max_age`` are treated as misses
+    """
+    cache = HeaderCache("test", tmp_path)
+    cache.set("key", (1,), "value")
+
+    assert cache.get("key", (1,), max_age=60) == "value"
+
+    mocker.patch("time.time", return_value=time.time() + 120)
+
+    assert cache.get("key", (1,), max_age=60) is None
+    assert cache.get("key", (1,)) == "value"
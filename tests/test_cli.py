@@ -0,0 +1,94 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import json
+from argparse import ArgumentParser
+from typing import TYPE_CHECKING
+
+import pytest
+
+from conda_anaconda_telemetry import cli
+from conda_anaconda_telemetry.cache import CACHE_DIR_ENV_VAR
+from conda_anaconda_telemetry.hooks import conda_subcommands
+from conda_anaconda_telemetry.metrics import (
+    MetricsRegistry,
+    get_metrics_path,
+    registry,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest import CaptureFixture, MonkeyPatch
+    from pytest_mock import MockerFixture
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch: MonkeyPatch, tmp_path: Path) -> Path:
+    """
+    Keeps the metrics out of the user's cache directory
+    """
+    monkeypatch.setenv(CACHE_DIR_ENV_VAR, str(tmp_path))
+    return tmp_path
+
+
+def run(*argv: str) -> int:
+    parser = ArgumentParser()
+    cli.configure_parser(parser)
+    return cli.execute(parser.parse_args(argv))
+
+
+def test_conda_subcommands() -> None:
+    """
+    Ensure the ``telemetry`` subcommand is registered
+    """
+    (subcommand,) = conda_subcommands()
+
+    assert subcommand.name == "telemetry"
+    assert subcommand.action is cli.execute
+
+
+def test_stats(capsys: CaptureFixture) -> None:
+    """
+    Ensure ``conda telemetry stats`` prints the metrics of the last command
+    """
+    metrics = MetricsRegistry()
+    metrics.record_duration("get_sys_info_header_value", 0.25)
+    metrics.dump()
+
+    assert run("stats") == 0
+
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["timers"]["get_sys_info_header_value"]["max"] == 0.25
+
+
+def test_stats_missing(capsys: CaptureFixture) -> None:
+    """
+    Ensure a hint is shown if no metrics have been collected yet
+    """
+    assert run("stats") == 1
+
+    assert str(get_metrics_path()) in capsys.readouterr().err
+
+
+def test_stats_keeps_metrics(mocker: MockerFixture) -> None:
+    """
+    Ensure ``conda telemetry`` doesn't replace the metrics it shows with its own
+    """
+    unregister = mocker.patch("atexit.unregister")
+
+    run("stats")
+
+    unregister.assert_called_once_with(registry.dump)
+
+
+def test_execute_without_parser(capsys: CaptureFixture) -> None:
+    """
+    Ensure the raw arguments conda passes without a parser are understood
+    """
+    MetricsRegistry().dump()
+
+    assert cli.execute(("stats",)) == 0
+    assert "timers" in json.loads(capsys.readouterr().out)
+    assert cli.execute(()) == 1
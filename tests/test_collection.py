@@ -0,0 +1,222 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import pytest
+
+from conda_anaconda_telemetry.collection import (
+    BoundedCache,
+    CollectionContext,
+    Session,
+    estimate_size,
+)
+
+if TYPE_CHECKING:
+    from pytest import MonkeyPatch
+
+#: Number of threads calling a function at the same time
+THREADS = 16
+
+
+@pytest.fixture
+def clock(monkeypatch: MonkeyPatch) -> list[float]:
+    """
+    Replaces ``time.monotonic`` with a clock that only moves when told to
+    """
+    now = [1_000.0]
+    monkeypatch.setattr(
+        "conda_anaconda_telemetry.collection.time.monotonic", lambda: now[0]
+    )
+    return now
+
+
+def test_estimate_size() -> None:
+    """
+    Ensure the size of nested values includes the values they contain
+    """
+    value = "a" * 1_000
+
+    assert estimate_size(value) >= 1_000
+    assert estimate_size((value, value)) > 2_000
+    assert estimate_size(Session("/opt/conda", value)) > 1_000
+
+
+def test_lru_eviction() -> None:
+    """
+    Ensure the least recently used value is evicted once there are too many
+    """
+    cache = BoundedCache(maxsize=2, max_bytes=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.evictions == 1
+    assert len(cache) == 2
+
+
+def test_max_bytes_eviction() -> None:
+    """
+    Ensure values are evicted once they take up too much memory and values that
+    don't fit at all aren't stored
+    """
+    size = estimate_size("a" * 1_000)
+    cache = BoundedCache(maxsize=None, max_bytes=2 * size)
+    cache.set("a", "a" * 1_000)
+    cache.set("b", "b" * 1_000)
+    cache.set("c", "c" * 1_000)
+
+    assert cache.get("a") is None
+    assert cache.nbytes == 2 * size
+    cache.set("d", "d" * 10_000)
+    assert cache.get("d") is None
+    assert len(cache) == 2
+
+    cache.configure(maxsize=None, max_bytes=size)
+    assert len(cache) == 1
+    assert cache.nbytes == size
+
+
+def test_ttl(clock: list[float]) -> None:
+    """
+    Ensure values expire ``ttl`` seconds after they were added
+    """
+    cache = BoundedCache(ttl=10)
+    calls = []
+
+    def compute() -> str:
+        calls.append(clock[0])
+        return "value"
+
+    assert cache.get_or_compute("a", compute) == "value"
+    clock[0] += 5
+    assert cache.get_or_compute("a", compute) == "value"
+    clock[0] += 10
+    assert cache.get("a") is None
+    assert cache.get_or_compute("a", compute) == "value"
+    assert len(calls) == 2
+
+
+def test_get_or_compute_single_flight() -> None:
+    """
+    Ensure concurrent callers share a single computation and failures aren't cached
+    """
+    cache = BoundedCache()
+    calls = []
+    barrier = threading.Barrier(THREADS)
+
+    def compute() -> str:
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    def call() -> str:
+        barrier.wait()
+        return cache.get_or_compute("a", compute)
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        results = list(executor.map(lambda _: call(), range(THREADS)))
+
+    assert results == ["value"] * THREADS
+    assert calls == [1]
+
+    def fail() -> str:
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        cache.get_or_compute("b", fail)
+    assert cache.get_or_compute("b", compute) == "value"
+
+
+def test_sessions() -> None:
+    """
+    Ensure values are cached per session, nested sessions apply and the default
+    scope is used outside of sessions
+    """
+    scope = ["default"]
+    collection = CollectionContext(default_scope=lambda: scope[0])
+    calls = []
+
+    @collection.cached
+    def collect(name: str) -> str:
+        calls.append(collection.scope())
+        return f"{name}@{collection.scope()}"
+
+    assert collect("a") == "a@default"
+    with collection.session("/envs/one") as one:
+        assert collection.current_session() == one
+        assert collect("a") == f"a@{one}"
+        with collection.session("/envs/two", "config") as two:
+            assert collect("a") == f"a@{two}"
+        assert collect("a") == f"a@{one}"
+        assert collect.cache_get("a") == f"a@{one}"
+    assert collection.current_session() is None
+    assert collect("a") == "a@default"
+    scope[0] = "other"
+    assert collect.cache_get("a") is None
+
+    assert len(calls) == 3
+    assert collect.cache_info().currsize == 3
+    assert collect.cache_info().hits == 2
+    collect.cache_clear()
+    assert collect.cache_info().currsize == 0
+    assert len(collection.cache) == 0
+
+
+def test_discard() -> None:
+    """
+    Ensure only the values of the current scope are discarded
+    """
+    collection = CollectionContext()
+
+    @collection.cached
+    def collect(name: str) -> str:
+        return f"{name}@{collection.scope()}"
+
+    @collection.cached
+    def other() -> str:
+        return "other"
+
+    with collection.session("/envs/one"):
+        collect("a")
+        collect("b")
+        other()
+    collect("a")
+
+    with collection.session("/envs/one"):
+        collection.discard(collect)
+        assert collect.cache_get("a") is None
+        assert other.cache_get() == "other"
+    assert collect.cache_get("a") == "a@None"
+
+    collection.discard()
+    assert collect.cache_get("a") is None
+    assert len(collection.cache) == 1
+
+
+def test_sessions_per_thread() -> None:
+    """
+    Ensure sessions opened on other threads don't leak into each other
+    """
+    collection = CollectionContext()
+
+    @collection.cached
+    def collect() -> object:
+        time.sleep(0.01)
+        return collection.current_session()
+
+    def run(index: int) -> bool:
+        with collection.session(f"/envs/{index}") as session:
+            return collect() == session
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        assert all(executor.map(run, range(4 * THREADS)))
+    assert len(collection.cache) == 4 * THREADS
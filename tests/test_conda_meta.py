@@ -0,0 +1,244 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING
+
+import pytest
+from conda.common.path import get_python_site_packages_short_path
+
+from conda_anaconda_telemetry.conda_meta import (
+    CHUNK_SIZE,
+    UNKNOWN_CHANNEL,
+    CondaMetaRecord,
+    get_python_version,
+    has_pip_packages,
+    iter_conda_meta,
+    iter_sorted_conda_meta,
+    read_record,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture
+
+CHANNEL = "https://conda.anaconda.org/conda-forge/linux-64"
+
+
+def write_record(
+    conda_meta: Path,
+    name: str,
+    version: str = "1.0",
+    build: str = "0",
+    *,
+    sort_keys: bool = True,
+    file_name: str | None = None,
+    **fields: object,
+) -> Path:
+    """
+    Writes a ``conda-meta`` record the same way conda does
+    """
+    record = {
+        "build": build,
+        "build_number": 0,
+        "channel": CHANNEL,
+        "depends": [],
+        "files": [],
+        "name": name,
+        "paths_data": {"paths": [], "paths_version": 1},
+        "subdir": "linux-64",
+        "url": f"{CHANNEL}/{name}-{version}-{build}.conda",
+        "version": version,
+        **fields,
+    }
+    path = conda_meta / (file_name or f"{name}-{version}-{build}.json")
+    path.write_text(json.dumps(record, indent=2, sort_keys=sort_keys))
+    return path
+
+
+@pytest.fixture
+def conda_meta(tmp_path: Path) -> Path:
+    path = tmp_path / "conda-meta"
+    path.mkdir()
+    (path / "history").write_text("")
+    return path
+
+
+def test_read_record(conda_meta: Path) -> None:
+    """
+    Ensure the fields are read from a small record
+    """
+    path = write_record(conda_meta, "python-dateutil", "2.9.0", "pyhd8ed1ab_0")
+
+    assert read_record(str(path)) == CondaMetaRecord(
+        "python-dateutil", "2.9.0", "pyhd8ed1ab_0", CHANNEL, "linux-64"
+    )
+
+
+def test_read_record_large(conda_meta: Path, mocker: MockerFixture) -> None:
+    """
+    Ensure large records are read without parsing the whole document
+    """
+    files = [f"lib/python3.12/site-packages/pkg/module_{i}.py" for i in range(1_000)]
+    path = write_record(conda_meta, "pkg", files=files)
+    assert path.stat().st_size > 4 * CHUNK_SIZE
+    json_load = mocker.spy(json, "load")
+
+    assert read_record(str(path)) == CondaMetaRecord(
+        "pkg", "1.0", "0", CHANNEL, "linux-64"
+    )
+    assert json_load.call_count == 0
+
+
+def test_read_record_unsorted_fallback(conda_meta: Path) -> None:
+    """
+    Ensure records written with another key order are parsed in full
+    """
+    files = [f"bin/tool_{i}" for i in range(1_000)]
+    path = write_record(
+        conda_meta,
+        "pkg",
+        sort_keys=False,
+        files=files,
+        subdir="osx-arm64",
+        channel="https://conda.anaconda.org/conda-forge/osx-arm64",
+    )
+    record = json.loads(path.read_text())
+    # move "subdir" and "channel" into the middle of the document
+    record = {"files": record.pop("files"), **record, "more": files}
+    path.write_text(json.dumps(record))
+
+    assert read_record(str(path)) == CondaMetaRecord(
+        "pkg",
+        "1.0",
+        "0",
+        "https://conda.anaconda.org/conda-forge/osx-arm64",
+        "osx-arm64",
+    )
+
+
+def test_read_record_unexpected_file_name(conda_meta: Path) -> None:
+    """
+    Ensure records whose file name doesn't follow conda's pattern are parsed in full
+    """
+    path = write_record(conda_meta, "pkg", file_name="pkg.json", channel=None)
+
+    assert read_record(str(path)) == CondaMetaRecord(
+        "pkg", "1.0", "0", UNKNOWN_CHANNEL, "linux-64"
+    )
+
+
+def test_read_record_escaped_channel(conda_meta: Path) -> None:
+    """
+    Ensure JSON escape sequences in the channel are decoded
+    """
+    channel = "file:///C:\\Users\\conda\\channel/win-64"
+    path = write_record(conda_meta, "pkg", channel=channel)
+
+    assert read_record(str(path)).channel == channel
+
+
+def test_iter_conda_meta(conda_meta: Path) -> None:
+    """
+    Ensure all readable records are returned and anything else is skipped
+    """
+    write_record(conda_meta, "zlib", "1.3.1", "h4ab18f5_1")
+    write_record(conda_meta, "ca-certificates", "2024.8.30", "hbcca054_0")
+    (conda_meta / "broken-1.0-0.json").write_text("{")
+    (conda_meta / "notes.txt").write_text("not a record")
+
+    assert sorted(iter_conda_meta(conda_meta.parent)) == [
+        CondaMetaRecord(
+            "ca-certificates", "2024.8.30", "hbcca054_0", CHANNEL, "linux-64"
+        ),
+        CondaMetaRecord("zlib", "1.3.1", "h4ab18f5_1", CHANNEL, "linux-64"),
+    ]
+
+
+def test_iter_conda_meta_missing(tmp_path: Path) -> None:
+    """
+    Ensure prefixes without ``conda-meta`` yield nothing
+    """
+    assert list(iter_conda_meta(tmp_path)) == []
+
+
+def test_get_python_version(conda_meta: Path) -> None:
+    """
+    Ensure the python version is taken from the record file names
+    """
+    assert get_python_version(conda_meta.parent) is None
+
+    write_record(conda_meta, "python-dateutil", "2.9.0", "pyhd8ed1ab_0")
+    assert get_python_version(conda_meta.parent) is None
+
+    write_record(conda_meta, "python", "3.12.1", "h0")
+    assert get_python_version(conda_meta.parent) == "3.12.1"
+
+
+@pytest.mark.parametrize(
+    "installers,expected",
+    [
+        ((), False),
+        (("conda", "conda"), False),
+        (("conda", None), False),
+        (("conda", "pip"), True),
+        (("uv",), True),
+    ],
+)
+def test_has_pip_packages(
+    conda_meta: Path, installers: tuple[str | None, ...], expected: bool
+) -> None:
+    """
+    Ensure distributions installed by anything but conda are detected
+    """
+    write_record(conda_meta, "python", "3.12.1", "h0")
+    site_packages = conda_meta.parent / get_python_site_packages_short_path("3.12.1")
+    site_packages.mkdir(parents=True)
+    for i, installer in enumerate(installers):
+        dist_info = site_packages / f"pkg_{i}-1.0.dist-info"
+        dist_info.mkdir()
+        if installer is not None:
+            (dist_info / "INSTALLER").write_text(f"{installer}\n")
+
+    assert has_pip_packages(conda_meta.parent) is expected
+
+
+def test_has_pip_packages_without_python(conda_meta: Path) -> None:
+    """
+    Ensure prefixes without python never report pip packages
+    """
+    assert not has_pip_packages(conda_meta.parent)
+
+
+def test_iter_sorted_conda_meta(conda_meta: Path) -> None:
+    """
+    Ensure records are sorted like ``iter_conda_meta``, including unusual file names
+    """
+    write_record(conda_meta, "zlib", "1.3.1", "h4ab18f5_1")
+    write_record(conda_meta, "python-dateutil", "2.9.0", "py_0")
+    write_record(conda_meta, "python", "3.12.4", "h5148396_1")
+    write_record(conda_meta, "ca-certificates", file_name="certificates.json")
+    (conda_meta / "broken-1.0-0.json").write_text("{")
+    (conda_meta / "broken.json").write_text("{")
+
+    assert list(iter_sorted_conda_meta(conda_meta.parent)) == sorted(
+        iter_conda_meta(conda_meta.parent)
+    )
+
+
+def test_iter_sorted_conda_meta_lazy(conda_meta: Path, mocker: MockerFixture) -> None:
+    """
+    Ensure records are only read when they are consumed
+    """
+    for index in range(10):
+        write_record(conda_meta, f"pkg{index}")
+    read = mocker.patch(
+        "conda_anaconda_telemetry.conda_meta.read_record", side_effect=read_record
+    )
+
+    records = iter_sorted_conda_meta(conda_meta.parent)
+
+    assert next(records).name == "pkg0"
+    assert read.call_count == 1
@@ -0,0 +1,271 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import pytest
+
+from conda_anaconda_telemetry.encoding import (
+    PACKAGES_FORMATS,
+    decode_delta,
+    decode_packages,
+    diff_packages,
+    encode_delta,
+    encode_packages,
+    fingerprint,
+    format_fingerprint,
+    reconstruct_packages,
+    truncate_delta,
+)
+
+TEST_PACKAGES = (
+    "defaults/osx-arm64::sqlite-3.45.3-h80987f9_0",
+    "defaults/osx-arm64::pcre2-10.42-hb066dcc_1",
+    "defaults/noarch::tzdata-2024a-h04d1e81_0",
+    "conda-forge/osx-arm64::libxml2-2.13.1-h0b34f26_2",
+    "conda-canary/label/dev/osx-arm64::conda-24.9.2+35_g979716cd9-py312_0",
+    "local::package-1.0-0",
+)
+
+
+def make_packages(count: int) -> list[str]:
+    channels = ("defaults/linux-64", "defaults/noarch", "conda-forge/linux-64")
+    return [
+        f"{channels[index % len(channels)]}::package-{index}-1.{index}-h{index:08x}_0"
+        for index in range(count)
+    ]
+
+
+@pytest.mark.parametrize("encoding", PACKAGES_FORMATS)
+def test_roundtrip(encoding: str) -> None:
+    """
+    Ensure every format decodes to the encoded packages
+    """
+    value = encode_packages(TEST_PACKAGES, encoding)
+
+    assert sorted(decode_packages(value)) == sorted(TEST_PACKAGES)
+
+
+def test_plain_format() -> None:
+    """
+    Ensure the plain format is identical to the original header value
+    """
+    assert encode_packages(TEST_PACKAGES) == ";".join(TEST_PACKAGES)
+
+
+def test_grouped_format() -> None:
+    """
+    Ensure channel prefixes are only sent once per group
+    """
+    value = encode_packages(TEST_PACKAGES[:3], "grouped")
+
+    assert value == (
+        "~1;defaults/noarch::;tzdata-2024a-h04d1e81_0"
+        ";defaults/osx-arm64::;pcre2-10.42-hb066dcc_1;sqlite-3.45.3-h80987f9_0"
+    )
+
+
+@pytest.mark.parametrize("encoding", PACKAGES_FORMATS)
+def test_size_limit(encoding: str) -> None:
+    """
+    Ensure values never exceed the size limit and only lose whole packages
+    """
+    packages = make_packages(1_000)
+
+    value = encode_packages(packages, encoding, size_limit=5_000)
+    decoded = decode_packages(value)
+
+    assert len(value) <= 5_000
+    assert decoded
+    assert set(decoded) <= set(packages)
+
+
+@pytest.mark.parametrize("encoding", ["grouped", "compressed"])
+def test_compact_formats_fit_more_packages(encoding: str) -> None:
+    """
+    Ensure the compact formats fit more packages into the same number of bytes
+    """
+    packages = make_packages(1_000)
+
+    plain = decode_packages(encode_packages(packages, "plain", size_limit=5_000))
+    compact = decode_packages(encode_packages(packages, encoding, size_limit=5_000))
+
+    assert len(compact) > len(plain)
+
+
+def test_size_limit_too_small() -> None:
+    """
+    Ensure nothing is sent if not even a single package fits
+    """
+    assert encode_packages(TEST_PACKAGES, "compressed", size_limit=10) == ""
+    assert encode_packages(TEST_PACKAGES, "plain", size_limit=10) == ""
+
+
+def test_decode_ignores_unknown_fields() -> None:
+    """
+    Ensure truncated values and other fields without a package are skipped
+    """
+    assert decode_packages("") == ()
+    assert decode_packages("defaults/noarch::tzdata-2024a-0;defaults/noa") == (
+        "defaults/noarch::tzdata-2024a-0",
+    )
+    assert decode_packages("~1;tzdata-2024a-0;defaults/noarch::") == ()
+
+
+def test_decode_unknown_format() -> None:
+    """
+    Ensure unknown format versions are rejected
+    """
+    with pytest.raises(ValueError, match="Unknown packages format"):
+        decode_packages("~9;abc")
+
+
+def test_unknown_encoding() -> None:
+    """
+    Ensure unknown format names are rejected
+    """
+    with pytest.raises(KeyError):
+        encode_packages(TEST_PACKAGES, "unknown")
+
+
+def test_fingerprint() -> None:
+    """
+    Ensure fingerprints depend on the package set only, not on the order
+    """
+    assert fingerprint(TEST_PACKAGES) == fingerprint(reversed(TEST_PACKAGES))
+    assert fingerprint(TEST_PACKAGES) != fingerprint(TEST_PACKAGES[1:])
+    assert len(format_fingerprint(fingerprint(TEST_PACKAGES))) == 32
+    assert format_fingerprint(fingerprint(())) == "0" * 32
+
+
+def test_diff_packages() -> None:
+    """
+    Ensure changed packages are only added and removed packages listed by name
+    """
+    new = (
+        "defaults/osx-arm64::sqlite-3.46.0-h80987f9_0",
+        *TEST_PACKAGES[1:4],
+        "defaults/noarch::six-1.16.0-pyhd3eb1b0_1",
+    )
+
+    assert diff_packages(TEST_PACKAGES, new) == (
+        (
+            "defaults/noarch::six-1.16.0-pyhd3eb1b0_1",
+            "defaults/osx-arm64::sqlite-3.46.0-h80987f9_0",
+        ),
+        ("conda", "package"),
+    )
+
+
+def test_delta_format() -> None:
+    """
+    Ensure deltas carry both fingerprints, the grouped added packages and the names
+    of the removed packages
+    """
+    value = encode_delta(
+        "f" * 32,
+        "0" * 32,
+        ["defaults/noarch::six-1.16.0-pyhd3eb1b0_1"],
+        ["tzdata", "pcre2"],
+    )
+
+    assert value == (
+        f"~3;{'f' * 32};{'0' * 32};defaults/noarch::;six-1.16.0-pyhd3eb1b0_1"
+        ";-;pcre2;tzdata"
+    )
+    delta = decode_delta(value)
+    assert delta.fingerprint == "f" * 32
+    assert delta.base == "0" * 32
+    assert delta.added == ("defaults/noarch::six-1.16.0-pyhd3eb1b0_1",)
+    assert delta.removed == ("pcre2", "tzdata")
+    assert not delta.truncated
+    assert decode_delta(f"{value[:80]};...").truncated
+
+
+def test_delta_truncation() -> None:
+    """
+    Ensure truncated deltas end with the truncation marker within the size limit
+    """
+    value = encode_delta("f" * 32, "", TEST_PACKAGES, (), size_limit=120)
+
+    assert len(value) <= 120
+    assert value.endswith(";...")
+    assert decode_delta(value).truncated
+    assert set(decode_delta(value).added) < set(TEST_PACKAGES)
+    assert not decode_delta(encode_delta("f" * 32, "", TEST_PACKAGES)).truncated
+
+
+def test_truncate_delta() -> None:
+    """
+    Ensure truncated deltas carry the fingerprint of the packages they describe
+    and continue the chain
+    """
+    value = encode_packages(TEST_PACKAGES, "delta", size_limit=120)
+
+    truncated, packages = truncate_delta(value, ())
+
+    assert len(truncated) == len(value)
+    assert decode_delta(truncated).truncated
+    assert set(packages) < set(TEST_PACKAGES)
+    assert reconstruct_packages([truncated]) == packages
+    rest = encode_delta(
+        format_fingerprint(fingerprint(TEST_PACKAGES)),
+        format_fingerprint(fingerprint(packages)),
+        *diff_packages(packages, TEST_PACKAGES),
+    )
+    assert sorted(reconstruct_packages([truncated, rest])) == sorted(TEST_PACKAGES)
+    assert truncate_delta(rest, packages) == (
+        rest,
+        reconstruct_packages([truncated, rest]),
+    )
+
+
+def test_reconstruct_packages() -> None:
+    """
+    Ensure the full package set is reconstructed from a chain of deltas
+    """
+    states = [
+        list(TEST_PACKAGES),
+        [*TEST_PACKAGES[:5], "defaults/noarch::six-1.16.0-pyhd3eb1b0_1"],
+        [
+            "defaults/osx-arm64::sqlite-3.46.0-h80987f9_0",
+            *TEST_PACKAGES[1:5],
+            "defaults/noarch::six-1.16.0-pyhd3eb1b0_1",
+        ],
+        [
+            "defaults/osx-arm64::sqlite-3.46.0-h80987f9_0",
+            "defaults/noarch::six-1.16.0-pyhd3eb1b0_1",
+        ],
+    ]
+    values = [encode_packages(states[0], "delta")]
+    for old, new in zip(states, states[1:]):
+        values.append(
+            encode_delta(
+                format_fingerprint(fingerprint(new)),
+                format_fingerprint(fingerprint(old)),
+                *diff_packages(old, new),
+            )
+        )
+
+    for count, state in enumerate(states, 1):
+        assert sorted(reconstruct_packages(values[:count])) == sorted(state)
+    assert all(len(value) < 200 for value in values[1:])
+
+
+def test_reconstruct_broken_chain() -> None:
+    """
+    Ensure missing and truncated deltas are detected
+    """
+    old, new = list(TEST_PACKAGES), list(TEST_PACKAGES[1:])
+    keyframe = encode_packages(old, "delta")
+    delta = encode_delta(
+        format_fingerprint(fingerprint(new)),
+        format_fingerprint(fingerprint(old)),
+        *diff_packages(old, new),
+    )
+
+    with pytest.raises(ValueError, match="unknown package set"):
+        reconstruct_packages([delta])
+    with pytest.raises(ValueError, match="doesn't match"):
+        reconstruct_packages([keyframe[:120]])
+    with pytest.raises(ValueError, match="needs its base"):
+        decode_packages(delta)
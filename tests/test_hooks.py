@@ -2,55 +2,114 @@
 # SPDX-License-Identifier: BSD-3-Clause
 from __future__ import annotations
 
+import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import TYPE_CHECKING
 from unittest.mock import MagicMock
 
 import pytest
+from conda.auxlib.collection import AttrDict
+from conda.cli.conda_argparse import generate_parser
+from conda.common.path import get_python_site_packages_short_path
+from conda.plugins import CondaRequestHeader
 
+from conda_anaconda_telemetry import hooks
+from conda_anaconda_telemetry.cache import CACHE_DIR_ENV_VAR
+from conda_anaconda_telemetry.encoding import (
+    decode_delta,
+    encode_packages,
+    reconstruct_packages,
+)
 from conda_anaconda_telemetry.hooks import (
     HEADER_CHANNELS,
     HEADER_INSTALL,
     HEADER_PACKAGES,
     HEADER_SEARCH,
+    HEADER_SESSION,
     HEADER_SYS_INFO,
     HEADER_VIRTUAL_PACKAGES,
     SIZE_LIMIT,
+    HeaderWrapper,
     _conda_request_headers,
     conda_request_headers,
     conda_settings,
+    get_conda_build_version,
+    get_header_bundle,
+    get_installed_packages_header_value,
+    get_package_list,
+    iter_package_list,
     should_submit_request_headers,
     timer,
+    validate_headers,
 )
 
 if TYPE_CHECKING:
-    from pytest import CaptureFixture, MonkeyPatch
+    from collections.abc import Iterator
+
+    from pytest import CaptureFixture, LogCaptureFixture, MonkeyPatch
     from pytest_mock import MockerFixture
 
+    from conda_anaconda_telemetry.metrics import MetricsRegistry
+
 
 #: Host used across all tests
 TEST_HOST = "repo.anaconda.com"
 
+#: Sorted by name, like the output of ``iter_package_list``
 TEST_PACKAGES = [
-    "defaults/osx-arm64::sqlite-3.45.3-h80987f9_0",
-    "defaults/osx-arm64::pcre2-10.42-hb066dcc_1",
     "defaults/osx-arm64::libxml2-2.13.1-h0b34f26_2",
+    "defaults/osx-arm64::pcre2-10.42-hb066dcc_1",
+    "defaults/osx-arm64::sqlite-3.45.3-h80987f9_0",
 ]
 
 
-def mock_list_packages(*args: tuple, **kwargs: dict) -> tuple:  # noqa: ARG001
-    return 0, TEST_PACKAGES
+def mock_iter_package_list() -> Iterator[str]:
+    return iter(TEST_PACKAGES)
 
 
 @pytest.fixture(autouse=True)
 def packages(mocker: MockerFixture) -> list:
     """
-    Mocks ``conda_anaconda_telemetry.hooks.list_packages``
+    Mocks ``conda_anaconda_telemetry.hooks.iter_package_list``
     """
-    mocker.patch("conda_anaconda_telemetry.hooks.list_packages", mock_list_packages)
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list", mock_iter_package_list
+    )
+    hooks.get_inventory.cache_clear()
     return TEST_PACKAGES
 
 
+@pytest.fixture(autouse=True)
+def header_bundle() -> Iterator[None]:
+    """
+    Clears the header bundles and prefetches of previous tests
+    """
+    get_header_bundle.cache_clear()
+    hooks.get_reduced_header_bundle.cache_clear()
+    yield
+    get_header_bundle.cache_clear()
+    hooks.get_reduced_header_bundle.cache_clear()
+    hooks.PREFETCHES.clear()
+    hooks.SESSION_HOSTS.clear()
+    hooks.LATE_COLLECTORS.clear()
+    hooks.PENDING_SNAPSHOTS.clear()
+    hooks.PROFILE_BUNDLES.clear()
+    hooks.DEFAULT_SCOPES.clear()
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch: MonkeyPatch, tmp_path: Path) -> Path:
+    """
+    Keeps the on-disk header cache out of the user's cache directory
+    """
+    monkeypatch.setenv(CACHE_DIR_ENV_VAR, str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
 @pytest.mark.parametrize(
     "host,path",
     [
@@ -60,14 +119,14 @@ def packages(mocker: MockerFixture) -> list:
             "/some/path",
         ),  # Any path should work for repo.anaconda.com
         ("conda.anaconda.org", "/conda-forge/"),  # Exact match for conda.anaconda.org
-        ("conda.anaconda.org", "/conda-forge/noarch/pkg.conda"),  # Prefix match
+        ("conda.anaconda.org", "/conda-forge/noarch/repodata.json"),  # Prefix match
     ],
 )
 def test_default_headers(mocker: MockerFixture, host: str, path: str) -> None:
     """
     Ensure default headers are returned for matching host/path combinations
     """
-    mock_argparse_args = mocker.MagicMock(match_spec="package", cmd="search")
+    mock_argparse_args = mocker.MagicMock(cmd="update")
     mocker.patch(
         "conda_anaconda_telemetry.hooks.context._argparse_args", mock_argparse_args
     )
@@ -111,7 +170,6 @@ def test_search_headers(
     expected_header_names = {
         HEADER_SYS_INFO,
         HEADER_CHANNELS,
-        HEADER_PACKAGES,
         HEADER_VIRTUAL_PACKAGES,
         HEADER_SEARCH,
     }
@@ -119,6 +177,7 @@ def test_search_headers(
     assert len(header_names.intersection(expected_header_names)) == len(
         expected_header_names
     )
+    assert HEADER_PACKAGES not in header_names
 
 
 @pytest.mark.parametrize(
@@ -186,28 +245,50 @@ def test_conda_settings() -> None:
     """
     Ensure the correct conda settings are returned
     """
-    settings = list(conda_settings())
+    settings = {setting.name: setting for setting in conda_settings()}
 
-    assert len(settings) == 1
-    assert settings[0].name == "anaconda_telemetry"
-    assert settings[0].description == "Whether Anaconda Telemetry is enabled"
-    assert settings[0].parameter.default.value is True
+    assert settings["anaconda_telemetry"].description == (
+        "Whether Anaconda Telemetry is enabled"
+    )
+    assert settings["anaconda_telemetry"].parameter.default.value is True
+    assert settings["anaconda_telemetry_hosts"].parameter.default.value == ()
+    assert (
+        settings["anaconda_telemetry_virtual_packages_ttl"].parameter.default.value
+        == 86_400
+    )
+    assert (
+        settings["anaconda_telemetry_detect_virtual_packages"].parameter.default.value
+        is True
+    )
+    assert settings["anaconda_telemetry_send_once"].parameter.default.value is False
+    assert settings["anaconda_telemetry_timeouts"].parameter.default.value == {}
+    assert settings["anaconda_telemetry_collectors"].parameter.default.value == {}
+    assert (
+        settings["anaconda_telemetry_cache_max_bytes"].parameter.default.value
+        == 32 * 1_024 * 1_024
+    )
+    assert settings["anaconda_telemetry_cache_ttl"].parameter.default.value == 0
 
 
-def test_exception_handling(mocker: MockerFixture, caplog: CaptureFixture) -> None:
+@pytest.mark.usefixtures("install")
+def test_exception_handling(mocker: MockerFixture, caplog: LogCaptureFixture) -> None:
     """
-    When any exception is encountered, ``conda_request_headers`` should return nothing
-    and log a debug message.
+    When an exception outside of the collectors is encountered,
+    ``conda_request_headers`` should return nothing and log a debug message.
     """
     caplog.set_level(logging.DEBUG)
     mocker.patch(
-        "conda_anaconda_telemetry.hooks.get_sys_info_header_value",
+        "conda_anaconda_telemetry.hooks.get_collector_timeouts",
         side_effect=Exception("Boom"),
     )
 
     assert list(conda_request_headers(TEST_HOST, "")) == []
-    assert caplog.records[0].levelname == "DEBUG"
-    assert "Failed to collect telemetry data" in caplog.text
+    (record,) = (
+        record
+        for record in caplog.records
+        if record.getMessage().startswith("Failed to collect telemetry data")
+    )
+    assert record.levelname == "DEBUG"
     assert "Exception: Boom" in caplog.text
 
 
@@ -327,3 +408,1305 @@ def test_non_matching_patterns(mocker: MockerFixture, host: str, path: str) -> N
 
     headers = list(conda_request_headers(host, path))
     assert headers == []
+
+
+def test_installed_packages_header_value_disk_cache(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """
+    Ensure the packages header is reused across processes until the prefix changes
+    """
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=str(prefix))
+    package_list = mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list",
+        side_effect=mock_iter_package_list,
+    )
+
+    def clear_cache() -> None:
+        # clearing the in-memory caches simulates a new conda process
+        get_installed_packages_header_value.cache_clear()
+        hooks.get_inventory.cache_clear()
+
+    clear_cache()
+    assert get_installed_packages_header_value() == ";".join(TEST_PACKAGES)
+    clear_cache()
+    assert get_installed_packages_header_value() == ";".join(TEST_PACKAGES)
+    assert package_list.call_count == 1
+
+    (prefix / "conda-meta" / "history").write_text("==> 2024-01-01 00:00:00 <==\n")
+    clear_cache()
+    assert get_installed_packages_header_value() == ";".join(TEST_PACKAGES)
+    assert package_list.call_count == 2
+    clear_cache()
+
+
+def test_installed_packages_header_value_channel_config(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """
+    Ensure the cached packages header isn't reused once the channel configuration,
+    and with it the canonical channel names, changes
+    """
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=str(prefix))
+    package_list = mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list",
+        side_effect=mock_iter_package_list,
+    )
+
+    def clear_cache() -> None:
+        # clearing the in-memory caches simulates a new conda process
+        get_installed_packages_header_value.cache_clear()
+        hooks.get_inventory.cache_clear()
+
+    clear_cache()
+    get_installed_packages_header_value()
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.get_channel_names_key", return_value="other"
+    )
+    clear_cache()
+    get_installed_packages_header_value()
+    clear_cache()
+    get_installed_packages_header_value()
+
+    assert package_list.call_count == 2
+    clear_cache()
+
+
+def test_get_package_list(mocker: MockerFixture, tmp_path: Path) -> None:
+    """
+    Ensure packages are read from ``conda-meta`` and formatted like
+    ``conda list --canonical``
+    """
+    conda_meta = tmp_path / "conda-meta"
+    conda_meta.mkdir()
+    for channel, subdir, name, version, build in (
+        ("https://conda.anaconda.org/conda-forge", "noarch", "tzdata", "2024a", "0"),
+        ("https://conda.anaconda.org/conda-forge", "linux-64", "bzip2", "1.0.8", "h0"),
+        ("https://conda.anaconda.org/conda-forge", "", "zlib", "1.3", "h1"),
+    ):
+        record = {
+            "build": build,
+            "channel": f"{channel}/{subdir}" if subdir else channel,
+            "name": name,
+            "subdir": subdir,
+            "version": version,
+        }
+        (conda_meta / f"{name}-{version}-{build}.json").write_text(json.dumps(record))
+    (conda_meta / "history").write_text("")
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=tmp_path)
+    mocker.patch("conda_anaconda_telemetry.hooks.iter_package_list", iter_package_list)
+
+    assert get_package_list() == (
+        "conda-forge/linux-64::bzip2-1.0.8-h0",
+        "conda-forge/noarch::tzdata-2024a-0",
+        "conda-forge::zlib-1.3-h1",
+    )
+
+
+@pytest.mark.parametrize(
+    "installer,pip_packages",
+    [
+        ("conda", False),
+        ("pip", True),
+    ],
+)
+def test_get_package_list_pip_interop(
+    mocker: MockerFixture, tmp_path: Path, installer: str, pip_packages: bool
+) -> None:
+    """
+    Ensure prefixes with packages installed by pip are listed by conda, which
+    includes those packages in its output
+    """
+    conda_meta = tmp_path / "conda-meta"
+    conda_meta.mkdir()
+    record = {
+        "build": "h0",
+        "channel": "https://conda.anaconda.org/conda-forge/linux-64",
+        "name": "python",
+        "subdir": "linux-64",
+        "version": "3.12.1",
+    }
+    (conda_meta / "python-3.12.1-h0.json").write_text(json.dumps(record))
+    site_packages = tmp_path / get_python_site_packages_short_path("3.12.1")
+    dist_info = site_packages / "requests-2.32.3.dist-info"
+    dist_info.mkdir(parents=True)
+    (dist_info / "INSTALLER").write_text(f"{installer}\n")
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=tmp_path)
+    mocker.patch("conda_anaconda_telemetry.hooks.iter_package_list", iter_package_list)
+    list_packages = mocker.patch(
+        "conda.cli.main_list.list_packages",
+        return_value=(
+            0,
+            [
+                "conda-forge/linux-64::python-3.12.1-h0",
+                "pypi/pypi::requests-2.32.3-pypi_0",
+            ],
+        ),
+    )
+
+    packages = get_package_list()
+
+    assert ("pypi/pypi::requests-2.32.3-pypi_0" in packages) is pip_packages
+    assert list_packages.called is pip_packages
+    assert "conda-forge/linux-64::python-3.12.1-h0" in packages
+
+
+def test_get_conda_build_version(mocker: MockerFixture) -> None:
+    """
+    Ensure the conda-build version is read from the package metadata
+    """
+    from importlib.metadata import PackageNotFoundError
+
+    version = mocker.patch("importlib.metadata.version", return_value="24.9.0")
+    assert get_conda_build_version() == "24.9.0"
+    version.assert_called_once_with("conda-build")
+
+    version.side_effect = PackageNotFoundError("conda-build")
+    assert get_conda_build_version() == "n/a"
+
+
+def test_header_bundle_is_reused(mocker: MockerFixture) -> None:
+    """
+    Ensure headers are only built once per command and returned as is afterwards
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        mocker.MagicMock(packages=["package"], cmd="install"),
+    )
+    request_headers = mocker.spy(hooks, "_conda_request_headers")
+
+    first = conda_request_headers(TEST_HOST, "/pkgs/main/linux-64/repodata.json")
+    second = conda_request_headers(TEST_HOST, "/pkgs/main/noarch/repodata.json")
+
+    assert first is second
+    assert isinstance(first, tuple)
+    assert request_headers.call_count == 1
+
+
+def test_collectors_run_once_under_concurrency(mocker: MockerFixture) -> None:
+    """
+    Ensure concurrent requests at the start of a command run each collector once
+    """
+    threads = 32
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        mocker.MagicMock(packages=["package"], cmd="install"),
+    )
+    collectors = {}
+    for name, value in (
+        ("iter_package_list", tuple(TEST_PACKAGES)),
+        ("get_virtual_packages", ("__unix=0=0",)),
+        ("get_channel_urls", ("https://repo.anaconda.com/pkgs/main",)),
+        ("get_conda_build_version", "n/a"),
+        ("get_install_arguments", ("package",)),
+    ):
+
+        def collect(value: object = value) -> object:
+            # slow enough for all threads to miss the cache at the same time
+            time.sleep(0.02)
+            return value
+
+        collectors[name] = mocker.patch(
+            f"conda_anaconda_telemetry.hooks.{name}", side_effect=collect
+        )
+    for func in (
+        hooks.get_sys_info_header_value,
+        hooks.get_channel_urls_header_value,
+        hooks.get_virtual_packages_header_value,
+        hooks.get_install_arguments_header_value,
+        hooks.get_installed_packages_header_value,
+    ):
+        func.cache_clear()
+    barrier = threading.Barrier(threads)
+
+    def request(index: int) -> tuple:
+        barrier.wait()
+        path = f"/pkgs/main/linux-64/{index}/repodata.json"
+        return tuple(conda_request_headers(TEST_HOST, path))
+
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(request, range(threads)))
+
+    assert all(result is results[0] for result in results)
+    assert {header.name for header in results[0]} >= {HEADER_PACKAGES, HEADER_INSTALL}
+    for name, collector in collectors.items():
+        assert collector.call_count == 1, name
+
+
+def test_conda_pre_commands() -> None:
+    """
+    Ensure headers are prefetched for commands that make requests to channels
+    """
+    (pre_command,) = hooks.conda_pre_commands()
+
+    assert pre_command.action is hooks.prefetch_headers
+    assert isinstance(pre_command.run_for, set)
+    assert {"create", "install", "search", "update"} <= pre_command.run_for
+
+
+def test_prefetch(mocker: MockerFixture) -> None:
+    """
+    Ensure requests use the headers collected in the background
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        mocker.MagicMock(packages=["package"], cmd="install"),
+    )
+    threads = []
+
+    def iter_package_list() -> tuple[str, ...]:
+        threads.append(threading.current_thread().name)
+        return tuple(TEST_PACKAGES)
+
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list",
+        side_effect=iter_package_list,
+    )
+    hooks.get_installed_packages_header_value.cache_clear()
+
+    hooks.prefetch_headers("install")
+    assert hooks.PREFETCHES[hooks.collection.scope(), "install"].done.wait(5)
+    headers = conda_request_headers(TEST_HOST, "/pkgs/main/linux-64/repodata.json")
+
+    # collected by the prefetch thread (or its collector threads), not the request
+    assert len(threads) == 1
+    assert threads[0] != threading.current_thread().name
+    assert headers is get_header_bundle("install")
+
+
+def test_prefetch_timeout(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
+    """
+    Ensure a reduced set of headers is sent while the prefetch isn't done
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        mocker.MagicMock(packages=["package"], cmd="install"),
+    )
+    release = threading.Event()
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list",
+        side_effect=lambda: release.wait(5) and tuple(TEST_PACKAGES),
+    )
+    hooks.get_installed_packages_header_value.cache_clear()
+    monkeypatch.setattr(hooks, "PREFETCH_TIMEOUT", 0.01)
+
+    done = hooks.start_prefetch("install")
+    reduced = conda_request_headers(TEST_HOST, "/pkgs/main/linux-64/repodata.json")
+    release.set()
+    assert done.wait(5)
+    full = conda_request_headers(TEST_HOST, "/pkgs/main/linux-64/repodata.json")
+
+    assert [header.name for header in reduced] == [HEADER_INSTALL]
+    assert {HEADER_INSTALL, HEADER_PACKAGES} <= {header.name for header in full}
+
+
+@pytest.mark.usefixtures("install")
+def test_prefetch_deadline(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
+    """
+    Ensure requests made after the first one timed out don't wait for the prefetch
+    again
+    """
+    release = threading.Event()
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list",
+        side_effect=lambda: release.wait(5) and tuple(TEST_PACKAGES),
+    )
+    hooks.get_installed_packages_header_value.cache_clear()
+    monkeypatch.setattr(hooks, "PREFETCH_TIMEOUT", 0.01)
+    path = "/pkgs/main/linux-64/repodata.json"
+
+    done = hooks.start_prefetch("install")
+    first = conda_request_headers(TEST_HOST, path)
+    wait = mocker.spy(done, "wait")
+    later = conda_request_headers(TEST_HOST, path)
+    release.set()
+
+    assert first == later
+    wait.assert_called_once_with(0)
+
+
+def test_validate_headers_does_not_mutate() -> None:
+    """
+    Ensure truncation returns new headers instead of modifying the wrapped ones
+    """
+    header = CondaRequestHeader(name=HEADER_PACKAGES, value="a;b;c;d;e")
+
+    (validated,) = validate_headers(
+        [HeaderWrapper(header=header, size_limit=7)], size_limit=7
+    )
+
+    assert validated.value == "a;b;..."
+    assert header.value == "a;b;c;d;e"
+
+
+def test_validate_headers_shares_budget() -> None:
+    """
+    Ensure budget left unused by small headers goes to the packages header
+    """
+    packages = ";".join(
+        f"defaults/noarch::package-{index}-1.0-0" for index in range(500)
+    )
+    wrappers = [
+        HeaderWrapper(
+            header=CondaRequestHeader(name=HEADER_SYS_INFO, value="sys-info"),
+            size_limit=500,
+        ),
+        HeaderWrapper(
+            header=CondaRequestHeader(name=HEADER_PACKAGES, value=packages),
+            size_limit=5_000,
+            priority=1,
+        ),
+    ]
+
+    sys_info, packages_header = validate_headers(wrappers)
+
+    assert sys_info.value == "sys-info"
+    assert 5_000 < len(packages_header.value) <= 7_000 - len("sys-info")
+    assert packages_header.value.endswith(";...")
+
+
+@pytest.mark.parametrize(
+    "host,path,expected",
+    [
+        ("mirror.example.com", "/pkgs/main/linux-64/repodata.json", True),
+        ("mirror.example.com", "", True),
+        ("conda.example.com", "/internal/noarch/repodata.json", True),
+        ("conda.example.com", "/internal", False),
+        ("conda.example.com", "/other/noarch/repodata.json", False),
+        ("conda.anaconda.org", "/internal/noarch/repodata.json", True),
+        ("conda.anaconda.org", "/conda-forge/noarch/repodata.json", True),
+        ("conda.anaconda.org", "/bioconda/noarch/repodata.json", False),
+        ("example.com", "/internal/noarch/repodata.json", False),
+    ],
+)
+def test_should_submit_request_headers_allowlist(
+    mocker: MockerFixture, host: str, path: str, expected: bool
+) -> None:
+    """
+    Ensure additional hosts and channels can be allowed with a setting
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context.plugins.anaconda_telemetry_hosts",
+        (
+            "mirror.example.com",
+            "https://conda.example.com/internal/",
+            "conda.anaconda.org/internal",
+        ),
+    )
+
+    assert should_submit_request_headers(host, path) == expected
+
+
+def test_should_submit_request_headers_matches_pattern() -> None:
+    """
+    Ensure the matcher makes the same decisions as ``REQUEST_HEADER_PATTERN``
+    """
+    from conda_anaconda_telemetry.hooks import REQUEST_HEADER_PATTERN
+
+    hosts = (
+        "repo.anaconda.com",
+        "repo.anaconda.cloud",
+        "conda.anaconda.org",
+        "repo.anaconda.org",
+        "conda.anaconda.org.evil.com",
+        "example.com",
+        "",
+    )
+    paths = (
+        "",
+        "/",
+        "//",
+        "r",
+        "/r",
+        "/r/",
+        "/rr/",
+        "/main/linux-64/repodata.json",
+        "/conda-forge/noarch/pkg-1.0-0.conda",
+        "/conda-forge-extra/noarch/repodata.json",
+        "/msys2/win-64/repodata.json",
+        "/anaconda/label/dev/noarch/repodata.json",
+        "/bioconda/linux-64/repodata.json",
+        "/pkgs/main/osx-arm64/current_repodata.json",
+        "conda-forge/",
+    )
+    for host in hosts:
+        for path in paths:
+            expected = REQUEST_HEADER_PATTERN.match(f"{host}{path}") is not None
+            assert should_submit_request_headers(host, path) == expected, (host, path)
+
+
+@pytest.mark.parametrize(
+    "encoding,expected",
+    [
+        ("plain", ";".join(TEST_PACKAGES)),
+        (
+            "grouped",
+            (
+                "~1;defaults/osx-arm64::;libxml2-2.13.1-h0b34f26_2"
+                ";pcre2-10.42-hb066dcc_1;sqlite-3.45.3-h80987f9_0"
+            ),
+        ),
+        ("unknown", ";".join(TEST_PACKAGES)),
+    ],
+)
+def test_installed_packages_header_value_format(
+    mocker: MockerFixture, encoding: str, expected: str
+) -> None:
+    """
+    Ensure the packages header uses the configured wire format
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context.plugins.anaconda_telemetry_packages_format",
+        encoding,
+    )
+    clear_cache = get_installed_packages_header_value.cache_clear
+
+    clear_cache()
+    assert get_installed_packages_header_value() == expected
+    clear_cache()
+
+
+@pytest.fixture
+def virtual_packages(mocker: MockerFixture) -> Iterator[MagicMock]:
+    """
+    Mocks virtual package detection and forgets values computed by other tests
+    """
+    hooks.get_virtual_packages_header_value.cache_clear()
+    yield mocker.patch(
+        "conda_anaconda_telemetry.hooks.get_virtual_packages",
+        return_value=("__unix=0=0", "__cuda=12.4=0"),
+    )
+    hooks.get_virtual_packages_header_value.cache_clear()
+
+
+def test_virtual_packages_cached_per_host(
+    virtual_packages: MagicMock, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Ensure virtual packages are only detected again if an override changes
+    """
+    monkeypatch.delenv("CONDA_OVERRIDE_CUDA", raising=False)
+    value = "__unix=0=0;__cuda=12.4=0"
+
+    assert hooks.get_virtual_packages_header_value() == value
+    # clearing the in-memory cache simulates a new conda process
+    hooks.get_virtual_packages_header_value.cache_clear()
+    assert hooks.get_virtual_packages_header_value() == value
+    assert virtual_packages.call_count == 1
+
+    monkeypatch.setenv("CONDA_OVERRIDE_CUDA", "11.8")
+    hooks.get_virtual_packages_header_value.cache_clear()
+    hooks.get_virtual_packages_header_value()
+    assert virtual_packages.call_count == 2
+
+
+@pytest.mark.parametrize("ttl", [0, -1])
+def test_virtual_packages_cache_expired(
+    virtual_packages: MagicMock, mocker: MockerFixture, ttl: int
+) -> None:
+    """
+    Ensure virtual packages are detected again once the TTL has passed
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context.plugins.anaconda_telemetry_virtual_packages_ttl",
+        ttl,
+    )
+
+    hooks.get_virtual_packages_header_value()
+    hooks.get_virtual_packages_header_value.cache_clear()
+    hooks.get_virtual_packages_header_value()
+
+    assert virtual_packages.call_count == 2
+
+
+def test_virtual_packages_skip_detection(
+    virtual_packages: MagicMock, mocker: MockerFixture
+) -> None:
+    """
+    Ensure detection can be skipped, using the cached value if there is one
+    """
+    hooks.get_virtual_packages_header_value()
+    hooks.get_virtual_packages_header_value.cache_clear()
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context.plugins.anaconda_telemetry_detect_virtual_packages",
+        False,
+    )
+
+    assert hooks.get_virtual_packages_header_value() == "__unix=0=0;__cuda=12.4=0"
+
+    mocker.patch("platform.node", return_value="other-host")
+    hooks.get_virtual_packages_header_value.cache_clear()
+
+    assert hooks.get_virtual_packages_header_value() == ""
+    assert virtual_packages.call_count == 1
+
+
+def test_collapse_channel_urls() -> None:
+    """
+    Ensure channels are listed once, without their subdirs
+    """
+    urls = [
+        "https://repo.anaconda.com/pkgs/main/linux-64",
+        "https://repo.anaconda.com/pkgs/main/noarch",
+        "https://conda.anaconda.org/conda-forge/noarch/",
+        "https://conda.anaconda.org/conda-forge",
+        "file:///opt/channel",
+    ]
+
+    assert hooks.collapse_channel_urls(urls, ("linux-64", "noarch")) == [
+        "https://repo.anaconda.com/pkgs/main",
+        "https://conda.anaconda.org/conda-forge",
+        "file:///opt/channel",
+    ]
+
+
+@pytest.fixture
+def channel_urls(mocker: MockerFixture) -> Iterator[MagicMock]:
+    """
+    Mocks ``conda_anaconda_telemetry.hooks.get_channel_urls`` and clears its header
+    """
+    hooks.get_channel_urls_header_value.cache_clear()
+    yield mocker.patch(
+        "conda_anaconda_telemetry.hooks.get_channel_urls",
+        return_value=(
+            "https://conda.anaconda.org/t/<TOKEN>/private/linux-64",
+            "https://conda.anaconda.org/t/<TOKEN>/private/noarch",
+        ),
+    )
+    hooks.get_channel_urls_header_value.cache_clear()
+
+
+def test_channel_urls_header_value_disk_cache(
+    channel_urls: MagicMock, mocker: MockerFixture
+) -> None:
+    """
+    Ensure the channels header is reused across processes until the channel
+    configuration changes, without writing the configuration to disk
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.get_channel_config_key",
+        return_value=hooks.get_channel_config_key(),
+    )
+    expected = "https://conda.anaconda.org/t/<TOKEN>/private"
+
+    assert hooks.get_channel_urls_header_value() == expected
+    hooks.get_channel_urls_header_value.cache_clear()
+    assert hooks.get_channel_urls_header_value() == expected
+    assert channel_urls.call_count == 1
+
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.get_channel_config_key", return_value="other"
+    )
+    hooks.get_channel_urls_header_value.cache_clear()
+    assert hooks.get_channel_urls_header_value() == expected
+    assert channel_urls.call_count == 2
+
+
+def test_get_channel_config_key(mocker: MockerFixture) -> None:
+    """
+    Ensure the key changes with the channel configuration and hides its tokens
+    """
+    key = hooks.get_channel_config_key()
+    channels = ("https://conda.anaconda.org/t/secret-token/private",)
+    mocker.patch.object(type(hooks.context), "channels", channels)
+
+    assert hooks.get_channel_config_key() != key
+    assert "secret-token" not in hooks.get_channel_config_key()
+
+
+@pytest.mark.parametrize(
+    "attribute,value",
+    [
+        ("custom_multichannels", {"internal": ("https://conda.example.com/a",)}),
+        ("migrated_channel_aliases", ("https://conda.example.com",)),
+    ],
+)
+def test_get_channel_config_key_multichannels(
+    mocker: MockerFixture, attribute: str, value: object
+) -> None:
+    """
+    Ensure the key changes with the other settings channel URLs are expanded with
+    """
+    key = hooks.get_channel_config_key()
+    mocker.patch.object(type(hooks.context), attribute, value)
+
+    assert hooks.get_channel_config_key() != key
+
+
+def test_get_channel_config_key_override_channels(mocker: MockerFixture) -> None:
+    """
+    Ensure ``--override-channels`` changes the key
+    """
+    channels = ("conda-forge",)
+    mocker.patch.object(type(hooks.context), "channels", channels)
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        AttrDict(channel=channels),
+    )
+    key = hooks.get_channel_config_key()
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        AttrDict(channel=channels, override_channels=True),
+    )
+
+    assert hooks.get_channel_config_key() != key
+
+
+@pytest.fixture
+def send_once(
+    mocker: MockerFixture,
+    install: None,  # noqa: ARG001
+) -> None:
+    """
+    Enables the ``anaconda_telemetry_send_once`` setting while running ``install``
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context.plugins.anaconda_telemetry_send_once",
+        True,
+    )
+
+
+@pytest.mark.usefixtures("send_once")
+def test_send_once_per_host() -> None:
+    """
+    Ensure only the first request to each host carries the full headers
+    """
+    path = "/pkgs/main/linux-64/repodata.json"
+
+    first = tuple(conda_request_headers(TEST_HOST, path))
+    second = tuple(conda_request_headers(TEST_HOST, path))
+    other = tuple(conda_request_headers("repo.anaconda.cloud", path))
+
+    assert {HEADER_PACKAGES, HEADER_SESSION} <= {h.name for h in first}
+    assert second == (hooks.SESSION_HEADER,)
+    assert {h.name for h in other} == {h.name for h in first}
+    assert {h.value for h in first + second + other if h.name == HEADER_SESSION} == {
+        hooks.SESSION_ID
+    }
+
+
+@pytest.mark.usefixtures("send_once")
+def test_send_once_under_concurrency() -> None:
+    """
+    Ensure concurrent requests to the same host send the full headers once
+    """
+    threads = 32
+    barrier = threading.Barrier(threads)
+
+    def request(index: int) -> tuple:
+        barrier.wait()
+        path = f"/pkgs/{index}/noarch/repodata.json"
+        return tuple(conda_request_headers(TEST_HOST, path))
+
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(request, range(threads)))
+
+    assert sum(result != (hooks.SESSION_HEADER,) for result in results) == 1
+
+
+@pytest.mark.usefixtures("send_once")
+def test_send_once_after_reduced_headers(
+    mocker: MockerFixture, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    Ensure the full headers are still sent once the prefetch is done if the first
+    request only got the reduced headers
+    """
+    release = threading.Event()
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list",
+        side_effect=lambda: release.wait(5) and tuple(TEST_PACKAGES),
+    )
+    hooks.get_installed_packages_header_value.cache_clear()
+    monkeypatch.setattr(hooks, "PREFETCH_TIMEOUT", 0.01)
+    path = "/pkgs/main/linux-64/repodata.json"
+
+    done = hooks.start_prefetch("install")
+    reduced = conda_request_headers(TEST_HOST, path)
+    release.set()
+    assert done.wait(5)
+    full = conda_request_headers(TEST_HOST, path)
+
+    assert [h.name for h in reduced] == [HEADER_INSTALL, HEADER_SESSION]
+    assert HEADER_PACKAGES in {h.name for h in full}
+    assert conda_request_headers(TEST_HOST, path) == (hooks.SESSION_HEADER,)
+
+
+def test_installed_packages_header_value_stops_early(mocker: MockerFixture) -> None:
+    """
+    Ensure the plain packages header stops collecting once the budget is used up
+    """
+    consumed = []
+
+    def iter_packages() -> Iterator[str]:
+        for index in range(100_000):
+            consumed.append(index)
+            yield f"defaults/linux-64::package{index:06}-1.0-0"
+
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list", side_effect=iter_packages
+    )
+    get_installed_packages_header_value.cache_clear()
+
+    value = get_installed_packages_header_value()
+
+    assert len(value) <= SIZE_LIMIT
+    assert len(consumed) == value.count(";") + 2
+    get_installed_packages_header_value.cache_clear()
+
+
+@pytest.fixture
+def slow_packages(mocker: MockerFixture) -> Iterator[threading.Event]:
+    """
+    Makes collecting the packages header of ``install`` block until the returned
+    event is set
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        mocker.MagicMock(packages=["package"], cmd="install"),
+    )
+    release = threading.Event()
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list",
+        side_effect=lambda: release.wait(5) and iter(TEST_PACKAGES),
+    )
+    mocker.patch.dict(hooks.COLLECTOR_TIMEOUTS, {HEADER_PACKAGES: 0.01})
+    get_installed_packages_header_value.cache_clear()
+    yield release
+    release.set()
+    get_installed_packages_header_value.cache_clear()
+
+
+def test_collector_timeout(
+    slow_packages: threading.Event, metrics: MetricsRegistry
+) -> None:
+    """
+    Ensure a slow collector is sent as a timeout marker while the other headers
+    are sent, and its header is sent once the collector is done
+    """
+    path = "/pkgs/main/linux-64/repodata.json"
+
+    first = {h.name: h.value for h in conda_request_headers(TEST_HOST, path)}
+    timeouts = metrics.snapshot()["timeouts"]
+    # taken before the collector is done, a refresh removes it right after
+    done = hooks.LATE_COLLECTORS[hooks.collection.scope(), HEADER_PACKAGES]
+    slow_packages.set()
+    assert done.wait(5)
+    later = {h.name: h.value for h in conda_request_headers(TEST_HOST, path)}
+
+    assert first[HEADER_PACKAGES] == hooks.TIMEOUT_MARKER
+    assert first[HEADER_SYS_INFO]
+    assert timeouts == {HEADER_PACKAGES: 1}
+    assert later[HEADER_PACKAGES] == ";".join(TEST_PACKAGES)
+    assert (hooks.collection.scope(), HEADER_PACKAGES) not in hooks.LATE_COLLECTORS
+
+
+def test_collector_timeout_setting(
+    slow_packages: threading.Event, mocker: MockerFixture
+) -> None:
+    """
+    Ensure deadlines can be changed per header and disabled with 0
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context.plugins.anaconda_telemetry_timeouts",
+        {"packages": 0, "channels": "0.5"},
+    )
+    slow_packages.set()
+
+    timeouts = hooks.get_collector_timeouts()
+
+    assert timeouts[HEADER_PACKAGES] == 0
+    assert timeouts[hooks.HEADER_CHANNELS] == 0.5
+    assert get_installed_packages_header_value() == ";".join(TEST_PACKAGES)
+    assert hooks.collect_headers(
+        [(HEADER_PACKAGES, get_installed_packages_header_value)], timeouts
+    ) == {HEADER_PACKAGES: ";".join(TEST_PACKAGES)}
+
+
+@pytest.mark.usefixtures("install")
+def test_collector_error_isolation(
+    mocker: MockerFixture, caplog: LogCaptureFixture, metrics: MetricsRegistry
+) -> None:
+    """
+    Ensure a failing collector only drops its own header, whether it runs on the
+    pool or its value was thought to be cached
+    """
+    caplog.set_level(logging.DEBUG)
+    sys_info = mocker.MagicMock(side_effect=ValueError("sys info"))
+    sys_info.cache_get.return_value = None
+    channels = mocker.MagicMock(side_effect=ValueError("channels"))
+    mocker.patch("conda_anaconda_telemetry.hooks.get_sys_info_header_value", sys_info)
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.get_channel_urls_header_value", channels
+    )
+
+    headers = {w.header.name: w.header.value for w in _conda_request_headers("install")}
+
+    assert HEADER_SYS_INFO not in headers
+    assert HEADER_CHANNELS not in headers
+    assert headers[HEADER_PACKAGES] == ";".join(TEST_PACKAGES)
+    assert HEADER_VIRTUAL_PACKAGES in headers
+    assert f"Failed to collect {HEADER_SYS_INFO}" in caplog.text
+    assert "ValueError: channels" in caplog.text
+    assert metrics.snapshot()["errors"] == {HEADER_SYS_INFO: 1, HEADER_CHANNELS: 1}
+
+
+def test_collectors_run_concurrently(mocker: MockerFixture) -> None:
+    """
+    Ensure the collectors of a cold request run at the same time on the collector
+    threads, in the collection session of the request
+    """
+    barrier = threading.Barrier(4, timeout=5)
+    threads = set()
+
+    def make_collector(value: str) -> MagicMock:
+        def collect() -> str:
+            threads.add(threading.current_thread().name)
+            barrier.wait()
+            return f"{value}@{hooks.get_prefix()}"
+
+        collector = mocker.MagicMock(side_effect=collect)
+        collector.cache_get.return_value = None
+        return collector
+
+    collectors = [(name, make_collector(name)) for name in hooks.BASE_HEADERS]
+
+    with hooks.collection_session("/envs/a"):
+        values = hooks.collect_headers(collectors, {})
+
+    assert values == {name: f"{name}@/envs/a" for name in hooks.BASE_HEADERS}
+    assert threads == {hooks.COLLECTOR_THREAD_NAME}
+    assert not hooks.LATE_COLLECTORS
+
+
+def test_collectors_share_deadline(mocker: MockerFixture) -> None:
+    """
+    Ensure deadlines count from the start of all collectors and a single worker
+    runs them one after the other
+    """
+    release = threading.Event()
+    started = []
+
+    def make_collector(name: str) -> MagicMock:
+        def collect() -> str:
+            started.append(name)
+            release.wait(5)
+            return name
+
+        collector = mocker.MagicMock(side_effect=collect)
+        collector.cache_get.return_value = None
+        return collector
+
+    mocker.patch("conda_anaconda_telemetry.hooks.COLLECTOR_WORKERS", 1)
+    names = (HEADER_SYS_INFO, HEADER_CHANNELS)
+    collectors = [(name, make_collector(name)) for name in names]
+
+    values = hooks.collect_headers(collectors, dict.fromkeys(names, 0.05))
+    assert started == [HEADER_SYS_INFO]
+    release.set()
+
+    assert values == dict.fromkeys(names, hooks.TIMEOUT_MARKER)
+    assert hooks.LATE_COLLECTORS[hooks.collection.scope(), HEADER_CHANNELS].wait(5)
+    assert started == list(names)
+
+
+@pytest.mark.parametrize(
+    "command,headers",
+    [
+        ("create", {HEADER_SYS_INFO, HEADER_CHANNELS, HEADER_VIRTUAL_PACKAGES}),
+        ("install", hooks.BASE_HEADERS),
+        ("search", {HEADER_SYS_INFO, HEADER_CHANNELS, HEADER_VIRTUAL_PACKAGES}),
+        ("update", hooks.BASE_HEADERS),
+    ],
+)
+def test_collection_plan(command: str, headers: set[str]) -> None:
+    """
+    Ensure each command collects only the headers it needs
+    """
+    assert hooks.get_collection_plan(command).headers == headers
+
+
+def test_collection_plan_env_create() -> None:
+    """
+    Ensure ``conda env create`` is planned like ``conda create``
+    """
+    args = generate_parser().parse_args(["env", "create", "-n", "x"])
+
+    assert args.cmd == "create"
+    assert args.name == "x"
+    assert hooks.get_collection_plan(args.cmd).headers == {
+        HEADER_SYS_INFO,
+        HEADER_CHANNELS,
+        HEADER_VIRTUAL_PACKAGES,
+    }
+
+
+@pytest.mark.parametrize(
+    "args,prefix",
+    [
+        ({"cmd": "install", "prefix": "/envs/target"}, "/envs/target"),
+        ({"cmd": "install", "name": "target"}, None),
+        ({"cmd": "install"}, "/envs/active"),
+    ],
+)
+def test_get_prefix(
+    mocker: MockerFixture, monkeypatch: MonkeyPatch, args: dict, prefix: str | None
+) -> None:
+    """
+    Ensure telemetry data is collected for the environment given with ``-n``/``-p``
+    or else the active one
+    """
+    monkeypatch.setenv("CONDA_PREFIX", "/envs/active")
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args", AttrDict(args)
+    )
+
+    assert hooks.get_prefix() == (
+        prefix or str(Path(hooks.context.envs_dirs[0], "target"))
+    )
+
+
+def test_default_scope(mocker: MockerFixture) -> None:
+    """
+    Ensure the prefix of the default scope is resolved once per command
+    """
+    get_prefix = mocker.patch(
+        "conda_anaconda_telemetry.hooks.get_prefix", return_value="/envs/target"
+    )
+    for _ in range(2):
+        mocker.patch(
+            "conda_anaconda_telemetry.hooks.context._argparse_args",
+            AttrDict(cmd="install", name="target"),
+        )
+        for _ in range(3):
+            assert hooks.collection.scope() == hooks.Session("/envs/target")
+
+    assert get_prefix.call_count == 2
+    assert len(hooks.DEFAULT_SCOPES) == 1
+
+
+def test_collection_plan_skips_collectors(mocker: MockerFixture) -> None:
+    """
+    Ensure the packages of no environment are read for ``conda create``
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context._argparse_args",
+        AttrDict(cmd="create", name="new", packages=["numpy"]),
+    )
+    package_list = mocker.patch("conda_anaconda_telemetry.hooks.iter_package_list")
+    get_installed_packages_header_value.cache_clear()
+
+    header_names = {header.name for header in get_header_bundle("create")}
+
+    assert header_names == {
+        HEADER_SYS_INFO,
+        HEADER_CHANNELS,
+        HEADER_VIRTUAL_PACKAGES,
+        HEADER_INSTALL,
+    }
+    package_list.assert_not_called()
+
+
+def test_collection_plan_setting(mocker: MockerFixture) -> None:
+    """
+    Ensure the plans can be replaced per command and for all other commands
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context.plugins.anaconda_telemetry_collectors",
+        {"*": ["sys-info", "channels", "unknown"], "create": ["packages"]},
+    )
+
+    assert hooks.get_collection_plan("install").headers == {
+        HEADER_SYS_INFO,
+        HEADER_CHANNELS,
+    }
+    assert hooks.get_collection_plan("create").headers == {HEADER_PACKAGES}
+
+
+@pytest.fixture
+def delta_format(
+    mocker: MockerFixture,
+    tmp_path: Path,
+    install: None,  # noqa: ARG001
+) -> MagicMock:
+    """
+    Runs ``install`` with the delta format in a prefix with ``TEST_PACKAGES``
+    """
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context.plugins.anaconda_telemetry_packages_format",
+        "delta",
+    )
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    mocker.patch("conda_anaconda_telemetry.hooks.get_prefix", return_value=str(prefix))
+    return mocker.patch(
+        "conda_anaconda_telemetry.hooks.iter_package_list",
+        side_effect=lambda: iter(TEST_PACKAGES),
+    )
+
+
+def new_process(send: bool = True) -> str:
+    """Return the packages header of a new process, optionally sending it."""
+    hooks.PENDING_SNAPSHOTS.clear()
+    hooks.get_header_bundle.cache_clear()
+    hooks.get_inventory.cache_clear()
+    get_installed_packages_header_value.cache_clear()
+    if not send:
+        return get_installed_packages_header_value()
+    headers = conda_request_headers(TEST_HOST, "/pkgs/main/linux-64/repodata.json")
+    return {header.name: header.value for header in headers}[HEADER_PACKAGES]
+
+
+def test_installed_packages_delta(delta_format: MagicMock, tmp_path: Path) -> None:
+    """
+    Ensure the delta format only sends the changes since the packages were last
+    sent and reconstructs to the packages of the prefix
+    """
+    values = [new_process(), new_process()]
+    assert delta_format.call_count == 1
+    packages = [
+        TEST_PACKAGES[0],
+        "defaults/noarch::six-1.16.0-pyhd3eb1b0_1",
+        *TEST_PACKAGES[2:],
+    ]
+    delta_format.side_effect = lambda: iter(packages)
+    (tmp_path / "env" / "conda-meta" / "history").write_text(
+        "==> 2024-01-01 00:00:00 <==\n"
+    )
+    values.append(new_process())
+    new_process()
+
+    assert values[0] == encode_packages(
+        TEST_PACKAGES, "delta", hooks.PACKAGES_SIZE_LIMIT
+    )
+    fingerprint = decode_delta(values[0]).fingerprint
+    assert values[1] == f"~3;{fingerprint};{fingerprint}"
+    assert values[2] == (
+        f"~3;{decode_delta(values[2]).fingerprint};{fingerprint}"
+        ";defaults/noarch::;six-1.16.0-pyhd3eb1b0_1;-;pcre2"
+    )
+    assert sorted(reconstruct_packages(values)) == sorted(packages)
+    assert delta_format.call_count == 2
+
+
+@pytest.mark.usefixtures("delta_format")
+def test_installed_packages_delta_not_sent() -> None:
+    """
+    Ensure packages that were collected but never sent don't become the base of
+    the next value
+    """
+    collected = new_process(send=False)
+
+    assert not decode_delta(collected).base
+    assert new_process() == collected
+    assert decode_delta(new_process()).base == decode_delta(collected).fingerprint
+
+
+@pytest.mark.usefixtures("delta_format")
+def test_installed_packages_delta_truncated(mocker: MockerFixture) -> None:
+    """
+    Ensure truncated values end with the truncation marker and are followed by
+    the packages that didn't fit
+    """
+    mocker.patch("conda_anaconda_telemetry.hooks.PACKAGES_SIZE_LIMIT", 120)
+
+    values = [new_process(), new_process()]
+
+    assert values[0].endswith(";...")
+    assert decode_delta(values[0]).truncated
+    assert decode_delta(values[1]).base == decode_delta(values[0]).fingerprint
+    assert sorted(reconstruct_packages(values)) == sorted(TEST_PACKAGES)
+
+
+def test_installed_packages_delta_large_prefix(delta_format: MagicMock) -> None:
+    """
+    Ensure the packages of a prefix larger than the size limit are sent over
+    several processes, after which only the fingerprint is sent
+    """
+    packages = [
+        f"conda-forge/linux-64::package-{index}-1.0-h{index:07x}_0"
+        for index in range(2_000)
+    ]
+    delta_format.side_effect = lambda: iter(packages)
+
+    values = [new_process()]
+    while decode_delta(values[-1]).truncated and len(values) < 100:
+        values.append(new_process())
+    fingerprint = decode_delta(values[-1]).fingerprint
+
+    assert len(values) > 10
+    assert all(len(value) <= hooks.PACKAGES_SIZE_LIMIT for value in values)
+    assert sorted(reconstruct_packages(values)) == sorted(packages)
+    assert new_process() == f"~3;{fingerprint};{fingerprint}"
+
+
+@pytest.mark.parametrize(
+    "path,request_class",
+    [
+        ("/pkgs/main/linux-64/repodata.json", hooks.REQUEST_REPODATA),
+        ("/conda-forge/noarch/current_repodata.json", hooks.REQUEST_REPODATA),
+        ("/conda-forge/noarch/repodata.json.zst", hooks.REQUEST_REPODATA),
+        ("/conda-forge/noarch/repodata.jlap", hooks.REQUEST_REPODATA),
+        ("/conda-forge/noarch/repodata_shards.msgpack.zst", hooks.REQUEST_REPODATA),
+        ("/pkgs/main/linux-64/python-3.12.4-h5148396_1.conda", hooks.REQUEST_ARTIFACT),
+        ("/pkgs/main/noarch/tzdata-2024a-h04d1e81_0.tar.bz2", hooks.REQUEST_ARTIFACT),
+        ("/pkgs/main/linux-64/", hooks.REQUEST_OTHER),
+        ("", hooks.REQUEST_OTHER),
+    ],
+)
+def test_classify_request(path: str, request_class: str) -> None:
+    """
+    Ensure requests are classified by the end of their path
+    """
+    assert hooks.classify_request(path) == request_class
+
+
+@pytest.mark.usefixtures("install")
+def test_request_profiles() -> None:
+    """
+    Ensure package downloads only carry the headers of their profile, reduced once
+    per bundle
+    """
+    artifact = "/pkgs/main/linux-64/python-3.12.4-h5148396_1.conda"
+
+    repodata = conda_request_headers(TEST_HOST, "/pkgs/main/linux-64/repodata.json")
+    first = conda_request_headers(TEST_HOST, artifact)
+    second = conda_request_headers(TEST_HOST, artifact.replace(".conda", ".tar.bz2"))
+
+    assert repodata is get_header_bundle("install")
+    assert {header.name for header in first} == {HEADER_SYS_INFO}
+    assert first is second
+    get_header_bundle.cache_clear()
+    assert conda_request_headers(TEST_HOST, artifact) is not first
+
+
+@pytest.mark.usefixtures("send_once")
+def test_send_once_with_request_profiles() -> None:
+    """
+    Ensure package downloads send the profile of the full bundle and don't count
+    as the request that sends all headers
+    """
+    artifact = "/pkgs/main/linux-64/python-3.12.4-h5148396_1.conda"
+
+    downloads = [conda_request_headers(TEST_HOST, artifact) for _ in range(2)]
+    claimed = (hooks.collection.scope(), TEST_HOST) in hooks.SESSION_HOSTS
+    repodata = conda_request_headers(TEST_HOST, "/pkgs/main/linux-64/repodata.json")
+
+    bundle, profile = hooks.PROFILE_BUNDLES[
+        hooks.collection.scope(), "install", hooks.REQUEST_ARTIFACT
+    ]
+    assert bundle is get_header_bundle("install")
+    assert {header.name for header in profile} == {HEADER_SYS_INFO}
+    assert downloads == [(*profile, hooks.SESSION_HEADER)] * 2
+    assert not claimed
+    assert repodata == (*bundle, hooks.SESSION_HEADER)
+    assert conda_request_headers(TEST_HOST, artifact) == (hooks.SESSION_HEADER,)
+
+
+@pytest.mark.usefixtures("install")
+def test_collection_sessions(mocker: MockerFixture, tmp_path: Path) -> None:
+    """
+    Ensure many prefixes used concurrently in their own sessions get the headers of
+    their own prefix and every prefix is only read once
+    """
+    prefixes = [str(tmp_path / f"env-{index}") for index in range(32)]
+    reads = []
+    get_installed_packages_header_value.cache_clear()
+
+    def iter_package_list() -> Iterator[str]:
+        prefix = hooks.get_prefix()
+        reads.append(prefix)
+        time.sleep(0.001)
+        return iter([f"defaults/noarch::{prefix.rsplit('-', 1)[1]}-1.0-0"])
+
+    mocker.patch("conda_anaconda_telemetry.hooks.iter_package_list", iter_package_list)
+
+    def collect(prefix: str) -> tuple[str, str]:
+        with hooks.collection_session(prefix):
+            bundle = get_header_bundle("install")
+            assert get_header_bundle("install") is bundle
+            packages = {header.name: header.value for header in bundle}
+            return packages[HEADER_PACKAGES], get_installed_packages_header_value()
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(collect, prefixes * 2))
+
+    for index, (bundled, collected) in enumerate(results):
+        expected = f"defaults/noarch::{index % len(prefixes)}-1.0-0"
+        assert bundled == collected == expected
+    assert sorted(reads) == sorted(prefixes)
+    assert get_installed_packages_header_value.cache_info().currsize == len(prefixes)
+    assert get_installed_packages_header_value.cache_get() is None
+    get_installed_packages_header_value.cache_clear()
+
+
+@pytest.mark.usefixtures("send_once", "packages")
+def test_collection_session_isolation() -> None:
+    """
+    Ensure transactions, late collectors and hosts that received the headers only
+    affect the session they belong to
+    """
+    path = "/pkgs/main/linux-64/repodata.json"
+    sessions = {}
+    for prefix in ("/envs/a", "/envs/b"):
+        with hooks.collection_session(prefix) as session:
+            sessions[prefix] = (session, get_header_bundle("install"))
+            assert tuple(conda_request_headers(TEST_HOST, path)) == (
+                *sessions[prefix][1],
+                hooks.SESSION_HEADER,
+            )
+    (one, bundle), (two, _) = sessions.values()
+    late = threading.Event()
+    late.set()
+    hooks.LATE_COLLECTORS[one, HEADER_PACKAGES] = late
+
+    with hooks.collection_session("/envs/b"):
+        hooks.refresh_late_headers()
+        hooks.update_inventory("/envs/b", ["sqlite"], [])
+        assert get_header_bundle.cache_get("install") is None
+    with hooks.collection_session("/envs/a"):
+        assert get_header_bundle.cache_get("install") is bundle
+        assert conda_request_headers(TEST_HOST, path) == (hooks.SESSION_HEADER,)
+        hooks.refresh_late_headers()
+        assert get_header_bundle.cache_get("install") is None
+    assert (one, TEST_HOST) in hooks.SESSION_HOSTS
+    assert (two, TEST_HOST) in hooks.SESSION_HOSTS
+
+
+def test_collection_session_config(mocker: MockerFixture) -> None:
+    """
+    Ensure values collected with another configuration aren't reused
+    """
+    with hooks.collection_session("/envs/a"):
+        plain = get_installed_packages_header_value()
+    mocker.patch(
+        "conda_anaconda_telemetry.hooks.context.plugins.anaconda_telemetry_packages_format",
+        "grouped",
+    )
+    with hooks.collection_session("/envs/a"):
+        grouped = get_installed_packages_header_value()
+
+    assert plain == encode_packages(TEST_PACKAGES, "plain")
+    assert grouped == encode_packages(TEST_PACKAGES, "grouped")
+
+
+def test_collection_cache_settings(mocker: MockerFixture) -> None:
+    """
+    Ensure the limits of the cached values are taken from the settings
+    """
+    plugins = "conda_anaconda_telemetry.hooks.context.plugins"
+    mocker.patch(f"{plugins}.anaconda_telemetry_cache_max_bytes", 1_000)
+    mocker.patch(f"{plugins}.anaconda_telemetry_cache_ttl", 60.0)
+
+    with hooks.collection_session("/envs/a"):
+        assert (hooks.collection.cache.max_bytes, hooks.collection.cache.ttl) == (
+            1_000,
+            60.0,
+        )
+    mocker.patch(f"{plugins}.anaconda_telemetry_cache_ttl", 0.0)
+    hooks.configure_collection()
+    assert hooks.collection.cache.ttl is None
@@ -0,0 +1,96 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+
+import conda_anaconda_telemetry
+
+#: Maximum time in microseconds importing the plugin may add to conda's startup
+IMPORT_TIME_BUDGET = 50_000
+
+#: Modules conda has already imported by the time plugins are loaded
+CONDA_MODULES = (
+    "conda.base.context",
+    "conda.common.configuration",
+    "conda.plugins",
+)
+
+#: Modules that must only be imported once a header is requested
+DEFERRED_MODULES = (
+    "conda.cli.main_list",
+    "conda.core.path_actions",
+    "cProfile",
+    "conda_build",
+    "importlib.metadata",
+    "setuptools_scm",
+)
+
+
+def import_plugin() -> tuple[dict[str, int], list[str]]:
+    """
+    Imports the plugin in a fresh interpreter with ``-X importtime`` and returns the
+    cumulative import time of each top-level module together with the deferred
+    modules that were imported
+    """
+    code = "; ".join(
+        (
+            "import sys, json",
+            *(f"import {module}" for module in CONDA_MODULES),
+            # ignore modules conda itself has already imported (e.g. importlib.metadata)
+            f"before = set(sys.modules).intersection({DEFERRED_MODULES!r})",
+            "import conda_anaconda_telemetry.hooks",
+            f"loaded = set(sys.modules).intersection({DEFERRED_MODULES!r}) - before",
+            "print(json.dumps(sorted(loaded)))",
+        )
+    )
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    import_times = {}
+    for line in result.stderr.splitlines():
+        # each line reports self and cumulative time in microseconds and the module
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, module = line.split("|")
+        # nested imports are indented, only keep the top-level ones
+        if not module.startswith("  ") and cumulative.strip().isdigit():
+            import_times[module.strip()] = int(cumulative)
+    return import_times, json.loads(result.stdout)
+
+
+def test_import_time_budget() -> None:
+    """
+    Ensure importing the plugin adds little to conda's startup time
+    """
+    import_times, _ = import_plugin()
+    plugin_time = sum(
+        cumulative
+        for module, cumulative in import_times.items()
+        if module.split(".")[0] == "conda_anaconda_telemetry"
+    )
+
+    assert 0 < plugin_time < IMPORT_TIME_BUDGET
+
+
+def test_heavy_imports_are_deferred() -> None:
+    """
+    Ensure expensive modules are not imported when conda loads the plugin
+    """
+    _, loaded = import_plugin()
+
+    assert loaded == []
+
+
+def test_app_version() -> None:
+    """
+    Ensure the application version is available
+    """
+    assert isinstance(conda_anaconda_telemetry.APP_VERSION, str)
+    assert conda_anaconda_telemetry.__version__ == conda_anaconda_telemetry.APP_VERSION
@@ -0,0 +1,50 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from conda_anaconda_telemetry.instrument import Instrument
+
+if TYPE_CHECKING:
+    from pytest import MonkeyPatch
+    from pytest_mock import MockerFixture
+
+
+class Recorder(Instrument):
+    env_var = "CONDA_ANACONDA_TELEMETRY_TEST_INSTRUMENT"
+
+    def dump(self) -> None:
+        pass
+
+
+def test_enable_from_environment(monkeypatch: MonkeyPatch) -> None:
+    """
+    Ensure instruments are only enabled when their environment variable is set
+    """
+    recorder = Recorder()
+    monkeypatch.delenv(Recorder.env_var, raising=False)
+    recorder.enable_from_environment()
+    assert recorder.enabled is False
+
+    monkeypatch.setenv(Recorder.env_var, "1")
+    recorder.enable_from_environment()
+    assert recorder.enabled is True
+    recorder.cancel_dump()
+
+
+def test_dump_at_exit(mocker: MockerFixture) -> None:
+    """
+    Ensure ``dump`` is registered once at exit and can be cancelled
+    """
+    register = mocker.patch("atexit.register")
+    unregister = mocker.patch("atexit.unregister")
+    recorder = Recorder()
+
+    recorder.enable()
+    recorder.enable()
+    recorder.cancel_dump()
+    Recorder().enable(dump_at_exit=False)
+
+    register.assert_called_once_with(recorder.dump)
+    unregister.assert_called_once_with(recorder.dump)
@@ -0,0 +1,122 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from conda_anaconda_telemetry import inventory
+from conda_anaconda_telemetry.encoding import fingerprint, format_fingerprint
+from conda_anaconda_telemetry.inventory import (
+    PackageInventory,
+    format_package,
+    package_name,
+)
+
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+TEST_PACKAGES = (
+    "defaults/osx-arm64::libxml2-2.13.1-h0b34f26_2",
+    "conda-forge/noarch::python-dateutil-2.9.0-pyhd8ed1ab_0",
+    "defaults/osx-arm64::sqlite-3.45.3-h80987f9_0",
+)
+
+
+def test_format_package() -> None:
+    """
+    Ensure packages are formatted like ``conda list --canonical``
+    """
+    assert (
+        format_package("defaults", "noarch", "tzdata", "2024a", "h04d1e81_0")
+        == "defaults/noarch::tzdata-2024a-h04d1e81_0"
+    )
+    assert format_package("local", "", "package", "1.0", "0") == "local::package-1.0-0"
+
+
+@pytest.mark.parametrize(
+    "package,name",
+    [
+        ("defaults/noarch::tzdata-2024a-h04d1e81_0", "tzdata"),
+        ("conda-forge/noarch::python-dateutil-2.9.0-pyhd8ed1ab_0", "python-dateutil"),
+        ("local::package-1.0-0", "package"),
+    ],
+)
+def test_package_name(package: str, name: str) -> None:
+    """
+    Ensure the name is taken from the canonical string
+    """
+    assert package_name(package) == name
+
+
+def test_inventory_is_sorted_by_name() -> None:
+    """
+    Ensure the inventory is sorted by name, like ``get_package_list``
+    """
+    packages = PackageInventory("/env", reversed(TEST_PACKAGES)).packages()
+
+    assert packages == TEST_PACKAGES
+
+
+def test_update() -> None:
+    """
+    Ensure linked packages are added or replaced and unlinked ones removed
+    """
+    packages = PackageInventory("/env", TEST_PACKAGES)
+
+    packages.update(
+        unlinked=["libxml2", "not-installed"],
+        linked=[
+            "defaults/osx-arm64::sqlite-3.46.0-h80987f9_0",
+            "defaults/noarch::tzdata-2024a-h04d1e81_0",
+            "defaults/osx-arm64::bzip2-1.0.8-h80987f9_6",
+        ],
+    )
+
+    assert packages.packages() == (
+        "defaults/osx-arm64::bzip2-1.0.8-h80987f9_6",
+        "conda-forge/noarch::python-dateutil-2.9.0-pyhd8ed1ab_0",
+        "defaults/osx-arm64::sqlite-3.46.0-h80987f9_0",
+        "defaults/noarch::tzdata-2024a-h04d1e81_0",
+    )
+
+
+def test_update_only_touches_changed_packages(mocker: MockerFixture) -> None:
+    """
+    Ensure the cost of an update depends on the changed packages only
+    """
+    packages = PackageInventory(
+        "/env",
+        (f"defaults/noarch::package-{index:05d}-1.0-0" for index in range(10_000)),
+    )
+    parse = mocker.spy(inventory, "package_name")
+
+    packages.update(
+        unlinked=["package-00010"],
+        linked=["defaults/noarch::package-00020-2.0-0"],
+    )
+
+    assert parse.call_count == 1
+    assert len(packages.packages()) == 9_999
+    assert "defaults/noarch::package-00020-2.0-0" in packages.packages()
+
+
+def test_fingerprint_is_updated_incrementally(mocker: MockerFixture) -> None:
+    """
+    Ensure updates change the fingerprint like hashing the new package set would,
+    without hashing the unchanged packages again
+    """
+    packages = PackageInventory("/env", TEST_PACKAGES)
+    digest = mocker.spy(inventory, "package_digest")
+
+    packages.update(
+        unlinked=["libxml2"],
+        linked=["defaults/osx-arm64::sqlite-3.46.0-h80987f9_0"],
+    )
+
+    assert digest.call_count == 3
+    assert packages.fingerprint() == format_fingerprint(
+        fingerprint(packages.packages())
+    )
+    assert packages.state() == (packages.packages(), packages.fingerprint())
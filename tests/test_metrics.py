@@ -0,0 +1,165 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import pytest
+from conda.plugins import CondaRequestHeader
+
+from conda_anaconda_telemetry import hooks
+from conda_anaconda_telemetry.hooks import HeaderWrapper, timer, validate_headers
+from conda_anaconda_telemetry.metrics import (
+    MetricsRegistry,
+    Timing,
+    percentile,
+    registry,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest import MonkeyPatch
+
+
+def test_percentile() -> None:
+    """
+    Ensure percentiles use the nearest rank of the sorted samples
+    """
+    samples = [float(value) for value in range(1, 101)]
+
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 99) == 99.0
+    assert percentile([1.0], 90) == 1.0
+
+
+def test_timing() -> None:
+    """
+    Ensure timings aggregate count, total, minimum and maximum
+    """
+    timing = Timing()
+    for duration in (0.3, 0.1, 0.2):
+        timing.add(duration)
+
+    stats = timing.to_dict()
+
+    assert stats["count"] == 3
+    assert stats["total"] == pytest.approx(0.6)
+    assert stats["min"] == 0.1
+    assert stats["max"] == 0.3
+    assert stats["p50"] == 0.2
+
+
+def test_timing_samples_all_calls(monkeypatch: MonkeyPatch) -> None:
+    """
+    Ensure the percentiles of a long-running process aren't limited to its first
+    calls once ``MAX_SAMPLES`` durations have been kept
+    """
+    monkeypatch.setattr("conda_anaconda_telemetry.metrics.MAX_SAMPLES", 10)
+    timing = Timing()
+    for duration in [0.001] * 10 + [1.0] * 1_000:
+        timing.add(duration)
+
+    assert len(timing.samples) == 10
+    assert timing.to_dict()["p50"] == 1.0
+
+
+def test_snapshot_and_dump(tmp_path: Path) -> None:
+    """
+    Ensure all metrics end up in the JSON written at exit
+    """
+    metrics = MetricsRegistry()
+
+    @functools.lru_cache(None)
+    def cached(value: int) -> int:
+        return value
+
+    cached(1)
+    cached(1)
+    metrics.register_cache("cached", cached)
+    metrics.record_duration("collect", 0.5)
+    metrics.record_truncation("header", 100, 3)
+    metrics.record_truncation("header", 10, 1)
+    metrics.dump(tmp_path / "metrics.json")
+
+    stats = json.loads((tmp_path / "metrics.json").read_text())
+
+    assert stats["timers"]["collect"]["count"] == 1
+    assert stats["caches"]["cached"] == {"hits": 1, "misses": 1}
+    assert stats["truncation"]["header"] == {"bytes": 110, "fields": 4}
+
+
+def test_record_from_threads() -> None:
+    """
+    Ensure no durations or truncation counts are lost when recorded concurrently
+    """
+    metrics = MetricsRegistry()
+
+    def record(_: int) -> None:
+        for _ in range(1_000):
+            metrics.record_duration("collect", 0.001)
+            metrics.record_truncation("header", 1, 1)
+
+    with ThreadPoolExecutor(8) as executor:
+        tuple(executor.map(record, range(8)))
+
+    stats = metrics.snapshot()
+    assert stats["timers"]["collect"]["count"] == 8_000
+    assert stats["truncation"]["header"] == {"bytes": 8_000, "fields": 8_000}
+
+
+def test_timer_records_durations(metrics: MetricsRegistry) -> None:
+    """
+    Ensure timed functions are recorded while metrics are enabled
+    """
+
+    @timer
+    def collect() -> str:
+        return "value"
+
+    assert collect() == "value"
+    assert collect() == "value"
+
+    assert metrics.snapshot()["timers"]["collect"]["count"] == 2
+
+
+def test_timer_disabled() -> None:
+    """
+    Ensure nothing is recorded while metrics are disabled
+    """
+
+    @timer
+    def collect_disabled() -> str:
+        return "value"
+
+    assert collect_disabled() == "value"
+
+    assert "collect_disabled" not in registry.snapshot()["timers"]
+
+
+def test_timer_registers_caches() -> None:
+    """
+    Ensure the hit rates of the header value caches are reported
+    """
+    caches = registry.snapshot()["caches"]
+
+    assert {
+        "get_header_bundle",
+        hooks.get_installed_packages_header_value.__name__,
+    } <= set(caches)
+
+
+def test_truncation_is_recorded(metrics: MetricsRegistry) -> None:
+    """
+    Ensure bytes and fields lost to truncation are recorded per header
+    """
+    header = CondaRequestHeader(name=hooks.HEADER_PACKAGES, value="a;b;c;d;e")
+
+    tuple(validate_headers([HeaderWrapper(header, size_limit=7)], size_limit=7))
+
+    assert metrics.snapshot()["truncation"] == {
+        hooks.HEADER_PACKAGES: {"bytes": 2, "fields": 3}
+    }
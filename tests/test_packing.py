@@ -0,0 +1,114 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import pytest
+
+from conda_anaconda_telemetry.encoding import TRUNCATION_MARKER
+from conda_anaconda_telemetry.packing import (
+    Candidate,
+    Packed,
+    allocate,
+    pack,
+    truncate_fields,
+)
+
+
+def make_fields(count: int) -> str:
+    return ";".join(f"defaults/noarch::package-{index}-1.0-0" for index in range(count))
+
+
+@pytest.mark.parametrize(
+    "value,size_limit,expected",
+    [
+        ("a;b;c", 10, "a;b;c"),
+        ("a;b;c", 5, "a;b;c"),
+        ("aa;bb;cc", 7, "aa;..."),
+        ("aa;bb;cc", 6, "aa;..."),
+        ("aa;bb;cc", 5, "..."),
+        ("aa;bb;cc", 3, "..."),
+        ("aa;bb;cc", 2, ""),
+        ("aa;bb;cc", 0, ""),
+    ],
+)
+def test_truncate_fields(value: str, size_limit: int, expected: str) -> None:
+    """
+    Ensure values are cut at field boundaries and marked as truncated
+    """
+    assert truncate_fields(value, size_limit) == expected
+
+
+def test_truncate_many_fields() -> None:
+    """
+    Ensure a value with 10,000 fields is cut to the limit without partial fields
+    """
+    value = make_fields(10_000)
+
+    truncated = truncate_fields(value, 7_000)
+    *fields, marker = truncated.split(";")
+
+    assert len(truncated) <= 7_000
+    assert marker == TRUNCATION_MARKER
+    assert fields == value.split(";")[: len(fields)]
+    # nothing but the marker would have fit in the remaining space
+    assert len(truncated) + len(value.split(";")[len(fields)]) + 1 > 7_000
+
+
+def test_truncate_single_long_field() -> None:
+    """
+    Ensure a single field longer than the budget is replaced by the marker
+    """
+    assert truncate_fields("a" * 10_000, 7_000) == TRUNCATION_MARKER
+
+
+def test_allocate_guaranteed_shares() -> None:
+    """
+    Ensure every candidate gets its own limit before any surplus is handed out
+    """
+    candidates = [
+        Candidate("a" * 1_000, 500, priority=0),
+        Candidate("b" * 1_000, 500, priority=1),
+    ]
+
+    assert allocate(candidates, 1_000) == [500, 500]
+    assert allocate(candidates, 1_500) == [1_000, 500]
+    assert allocate(candidates, 400) == [400, 0]
+
+
+def test_allocate_surplus_by_priority() -> None:
+    """
+    Ensure budget left unused by small candidates goes to the ones that need it
+    """
+    candidates = [
+        Candidate("c" * 1_000, 500, priority=4),
+        Candidate("s" * 10, 500, priority=0),
+        Candidate("p" * 10_000, 5_000, priority=3),
+    ]
+
+    assert allocate(candidates, 7_000) == [500, 10, 6_490]
+
+
+def test_pack() -> None:
+    """
+    Ensure packed values stay within the budget and report what was removed
+    """
+    packages = make_fields(10_000)
+    candidates = [
+        Candidate("sys-info", 500),
+        Candidate(packages, 5_000, priority=1),
+        Candidate("x" * 1_000, 500, priority=2),
+    ]
+
+    sys_info, packages_header, long_field = pack(candidates, 7_000)
+
+    assert sys_info == Packed("sys-info", 0, 0)
+    assert (
+        sum(len(packed.value) for packed in (sys_info, packages_header, long_field))
+        <= 7_000
+    )
+    assert packages_header.truncated_bytes == len(packages) - len(packages_header.value)
+    assert packages_header.truncated_fields == 10_000 - (
+        packages_header.value.count(";")
+    )
+    # the single field is longer than its share, so only the marker is left
+    assert long_field == Packed(TRUNCATION_MARKER, 997, 1)
@@ -0,0 +1,94 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import pstats
+from typing import TYPE_CHECKING
+
+import pytest
+
+from conda_anaconda_telemetry import hooks
+from conda_anaconda_telemetry.profiling import (
+    PROFILE_DIR_ENV_VAR,
+    Profiler,
+    parse_profilers,
+    profiler,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from pytest import MonkeyPatch
+
+
+@pytest.fixture
+def profile_dir(monkeypatch: MonkeyPatch, tmp_path: Path) -> Path:
+    """
+    Writes the profiles of a single test to a temporary directory
+    """
+    monkeypatch.setenv(PROFILE_DIR_ENV_VAR, str(tmp_path / "profiles"))
+    return tmp_path / "profiles"
+
+
+@pytest.fixture
+def enable_profiler() -> Iterator[Profiler]:
+    """
+    Enables both profilers of the current process for a single test
+    """
+    hooks.get_header_bundle.cache_clear()
+    profiler.enable({"cprofile", "tracemalloc"}, dump_at_exit=False)
+    yield profiler
+    profiler.enable(())
+    profiler.reset()
+    hooks.get_header_bundle.cache_clear()
+
+
+def test_parse_profilers() -> None:
+    """
+    Ensure unknown profilers are ignored
+    """
+    assert parse_profilers(" cProfile, tracemalloc ,,unknown") == {
+        "cprofile",
+        "tracemalloc",
+    }
+    assert parse_profilers("1") == frozenset()
+
+
+def test_profiler_disabled(profile_dir: Path) -> None:
+    """
+    Ensure nothing is collected or written while profiling is disabled
+    """
+    profiler = Profiler()
+
+    with profiler.profile("install"):
+        sum(range(100))
+
+    assert profiler.enabled is False
+    assert profiler.dump() == []
+    assert not profile_dir.exists()
+
+
+@pytest.mark.usefixtures("install")
+def test_profile_header_collection(
+    enable_profiler: Profiler, profile_dir: Path
+) -> None:
+    """
+    Ensure the collection of a command's headers is written to one file per
+    command and profiler
+    """
+    hooks.get_header_bundle("install")
+    hooks.get_header_bundle("install")
+    hooks.get_header_bundle.cache_clear()
+    hooks.get_header_bundle("install")
+
+    paths = enable_profiler.dump()
+
+    assert sorted(path.name.split("-")[0] for path in paths) == ["install", "install"]
+    assert {path.parent for path in paths} == {profile_dir}
+    (prof,) = (path for path in paths if path.suffix == ".prof")
+    stats = pstats.Stats(str(prof)).stats  # type: ignore[attr-defined]
+    functions = {name for _, _, name in stats}
+    assert {"_conda_request_headers", "validate_headers"} <= functions
+    (report,) = (path for path in paths if path.suffix == ".txt")
+    assert report.read_text().startswith("Peak memory: ")
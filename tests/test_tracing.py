@@ -0,0 +1,192 @@
+# Copyright (C) 2024 Anaconda, Inc
+# SPDX-License-Identifier: BSD-3-Clause
+from __future__ import annotations
+
+import json
+import threading
+from typing import TYPE_CHECKING
+
+import pytest
+
+from conda_anaconda_telemetry import hooks
+from conda_anaconda_telemetry.hooks import HEADER_PACKAGES, HeaderWrapper
+from conda_anaconda_telemetry.tracing import (
+    ATTRIBUTE_BYTES,
+    ATTRIBUTE_CACHE_HIT,
+    ATTRIBUTE_TRUNCATED_BYTES,
+    TRACE_FILE_ENV_VAR,
+    Tracer,
+    encode_value,
+    tracer,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+    from typing import Any
+
+    from pytest import MonkeyPatch
+    from pytest_mock import MockerFixture
+
+
+@pytest.fixture
+def trace_file(monkeypatch: MonkeyPatch, tmp_path: Path) -> Path:
+    """
+    Appends the traces of a single test to a temporary file
+    """
+    monkeypatch.setenv(TRACE_FILE_ENV_VAR, str(tmp_path / "traces.jsonl"))
+    return tmp_path / "traces.jsonl"
+
+
+@pytest.fixture
+def enable_tracer() -> Iterator[Tracer]:
+    """
+    Enables the tracer of the current process for a single test
+    """
+    hooks.get_header_bundle.cache_clear()
+    tracer.enable(dump_at_exit=False)
+    yield tracer
+    tracer.enabled = False
+    tracer.spans.clear()
+    hooks.get_header_bundle.cache_clear()
+
+
+def get_attributes(span: dict[str, Any]) -> dict[str, Any]:
+    """Return the attributes of an OTLP/JSON span as a plain dict."""
+    return {
+        attribute["key"]: next(iter(attribute["value"].values()))
+        for attribute in span["attributes"]
+    }
+
+
+def test_encode_value() -> None:
+    """
+    Ensure attribute values are encoded as OTLP/JSON ``AnyValue``
+    """
+    assert encode_value(True) == {"boolValue": True}
+    assert encode_value(2**40) == {"intValue": "1099511627776"}
+    assert encode_value(0.5) == {"doubleValue": 0.5}
+    assert encode_value("main") == {"stringValue": "main"}
+    assert encode_value(("a", 1)) == {
+        "arrayValue": {"values": [{"stringValue": "a"}, {"intValue": "1"}]}
+    }
+
+
+@pytest.mark.usefixtures("install")
+def test_tracer_disabled(trace_file: Path) -> None:
+    """
+    Ensure nothing is recorded or written while tracing is disabled
+    """
+    hooks.get_header_bundle.cache_clear()
+    hooks.get_header_bundle("install")
+
+    assert tracer.enabled is False
+    assert tracer.spans == []
+    tracer.dump()
+    assert not trace_file.exists()
+
+
+def test_span_nesting_and_errors() -> None:
+    """
+    Ensure spans on the same thread are nested and exceptions set their status
+    """
+    tracer = Tracer()
+
+    with (
+        tracer.span("outer") as outer,
+        pytest.raises(ValueError),
+        tracer.span("inner", size=3),
+    ):
+        raise ValueError("boom")
+
+    inner_span, outer_span = (span.to_dict(tracer.trace_id) for span in tracer.spans)
+    assert inner_span["parentSpanId"] == outer.span_id
+    assert outer_span["parentSpanId"] == ""
+    assert inner_span["status"] == {"code": 2, "message": "ValueError: boom"}
+    assert "status" not in outer_span
+    assert get_attributes(inner_span)["size"] == "3"
+    assert get_attributes(outer_span)["thread.id"] == str(threading.get_ident())
+    assert int(outer_span["startTimeUnixNano"]) <= int(inner_span["startTimeUnixNano"])
+    assert int(inner_span["endTimeUnixNano"]) <= int(outer_span["endTimeUnixNano"])
+
+
+@pytest.mark.usefixtures("install")
+def test_trace_request_headers(enable_tracer: Tracer, trace_file: Path) -> None:
+    """
+    Ensure requests, collectors and the packing of the headers are recorded and
+    appended to the trace file as one OTLP/JSON line per dump
+    """
+    hooks.get_sys_info_header_value.cache_clear()
+    headers = hooks.conda_request_headers("repo.anaconda.com", "/pkgs/main")
+    hooks.conda_request_headers("repo.anaconda.com", "/pkgs/main")
+    enable_tracer.dump()
+    hooks.conda_request_headers("repo.anaconda.com", "/pkgs/main")
+    enable_tracer.dump()
+
+    lines = trace_file.read_text().splitlines()
+    assert len(lines) == 2
+    assert enable_tracer.spans == []
+    first = json.loads(lines[0])
+    (resource_spans,) = first["resourceSpans"]
+    resource = get_attributes(resource_spans["resource"])
+    assert resource["service.name"] == "conda-anaconda-telemetry"
+    (scope_spans,) = resource_spans["scopeSpans"]
+    spans: dict[str, list[dict[str, Any]]] = {}
+    for span in scope_spans["spans"]:
+        spans.setdefault(span["name"], []).append(span)
+        assert span["traceId"] == enable_tracer.trace_id
+
+    requests = spans["conda_request_headers"]
+    assert [get_attributes(span)[ATTRIBUTE_CACHE_HIT] for span in requests] == [
+        False,
+        True,
+    ]
+    request = get_attributes(requests[0])
+    assert request["server.address"] == "repo.anaconda.com"
+    assert request["url.path"] == "/pkgs/main"
+    assert int(request[ATTRIBUTE_BYTES]) == sum(
+        len(header.name) + len(header.value) for header in headers
+    )
+    (collection,) = spans["_conda_request_headers"]
+    assert collection["parentSpanId"] == requests[0]["spanId"]
+    (validation,) = spans["validate_headers"]
+    assert validation["parentSpanId"] == requests[0]["spanId"]
+    assert ATTRIBUTE_TRUNCATED_BYTES in get_attributes(validation)
+    (sys_info,) = spans["get_sys_info_header_value"]
+    assert int(get_attributes(sys_info)[ATTRIBUTE_BYTES]) > 0
+    # collectors run on the collector threads, as children of the collection
+    assert get_attributes(sys_info)["thread.name"] == hooks.COLLECTOR_THREAD_NAME
+    assert sys_info["parentSpanId"] == collection["spanId"]
+
+
+def test_max_spans(
+    mocker: MockerFixture, enable_tracer: Tracer, trace_file: Path
+) -> None:
+    """
+    Ensure spans are appended to the trace file once ``MAX_SPANS`` are waiting
+    """
+    mocker.patch("conda_anaconda_telemetry.tracing.MAX_SPANS", 3)
+
+    for _ in range(7):
+        with enable_tracer.span("collect"):
+            pass
+
+    lines = trace_file.read_text().splitlines()
+    assert len(lines) == 2
+    (resource_spans,) = json.loads(lines[0])["resourceSpans"]
+    (scope_spans,) = resource_spans["scopeSpans"]
+    assert len(scope_spans["spans"]) == 3
+    assert len(enable_tracer.spans) == 1
+
+
+def test_trace_truncation(enable_tracer: Tracer) -> None:
+    """
+    Ensure the bytes removed to fit the size limit are recorded
+    """
+    header = hooks.CondaRequestHeader(HEADER_PACKAGES, "a" * 100)
+
+    (packed,) = hooks.validate_headers([HeaderWrapper(header, 10, 0)], 10)
+
+    (span,) = enable_tracer.spans
+    assert span.attributes[ATTRIBUTE_BYTES] == len(packed.value)
+    assert span.attributes[ATTRIBUTE_TRUNCATED_BYTES] == 100 - len(packed.value)